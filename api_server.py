@@ -1,20 +1,33 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, g, has_app_context, jsonify, request, send_file
 from flask_cors import CORS
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 
 # Import database manager
 sys.path.append(os.path.dirname(__file__))
 try:
-    from database_manager import AdvancedLicensePlateDB
+    from database_manager import (AdvancedLicensePlateDB, SEGMENT_PREFIX, SIMILAR_MAX_DISTANCE, day_range_ms,
+                                  get_connection_manager)
+    from function.segment_store import SegmentStore
     db = AdvancedLicensePlateDB()
+    # Ảnh lưu bằng --image-store segments: image_path = 'segment:<id>', đọc qua mmap
+    segment_store = SegmentStore(db.db_path)
     print("✅ Database manager loaded successfully")
 except ImportError as e:
     print(f"⚠️  Warning: Could not load database_manager: {e}")
     print("   API will run with basic functionality only")
     db = None
+    get_connection_manager = None
+    segment_store = None
+    SEGMENT_PREFIX = 'segment:'
+    SIMILAR_MAX_DISTANCE = 2
+
+from function.metrics import load_snapshots, render_prometheus
+
+# Snapshot metrics do main_advanced.py --metrics ghi ra (mỗi worker 1 file)
+METRICS_DIR = os.environ.get('LPR_METRICS_DIR', 'metrics')
 
 app = Flask(__name__)
 
@@ -28,16 +41,74 @@ CORS(app, resources={
 })
 
 # ==================== HELPER FUNCTIONS ====================
+def text_day_range(day):
+    """[start, end) on the local-time TEXT timestamp column: a range scan, unlike DATE(timestamp)"""
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return start.strftime('%Y-%m-%d %H:%M:%S'), (start + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+
+def request_timezone():
+    """tzinfo from ?tz=Area/City, None (server local time) when absent. ValueError if unknown"""
+    name = request.args.get('tz')
+    if not name:
+        return None
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown timezone: {name}')
+
+def request_day(name):
+    """?<name>=YYYY-MM-DD, None when absent. ValueError if malformed"""
+    day = request.args.get(name)
+    if not day:
+        return None
+    try:
+        datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM-DD, got {day}')
+    return day
+
+def bad_request(message):
+    return jsonify({
+        'success': False,
+        'message': message,
+        'data': []
+    }), 400
+
 def get_db_connection():
-    """Create database connection"""
+    """Borrow a pooled connection (WAL, tuned pragmas) for the current request"""
     db_path = 'license_plates.db'
     if not os.path.exists(db_path):
         print(f"⚠️  Database not found: {db_path}")
         return None
     
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if 'db_conn' not in g:
+        if get_connection_manager is None:
+            g.db_conn = sqlite3.connect(db_path)
+            g.db_conn.row_factory = sqlite3.Row
+        else:
+            g.db_conn = get_connection_manager(db_path).acquire()
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(error):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is None:
+        return
+    if get_connection_manager is None:
+        conn.close()
+    else:
+        get_connection_manager('license_plates.db').release(conn)
+
+def request_connection():
+    """The request's pooled connection inside an app context, None elsewhere (thread-local)"""
+    return get_db_connection() if has_app_context() else None
+
+# db.* methods and segment_store reads share the request's pooled connection instead of
+# opening (and never closing) a thread-local one on every request thread
+if db is not None:
+    db.connections.bind(request_connection)
 
 def dict_from_row(row):
     """Convert SQLite Row to dictionary"""
@@ -58,6 +129,7 @@ def home():
             'GET /api/plates/search?q=': 'Search plates',
             'GET /api/watchlist': 'Get watchlist',
             'GET /api/alerts': 'Get alerts',
+            'GET /api/metrics': 'Worker metrics (Prometheus text format)',
         }
     })
 
@@ -70,6 +142,12 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Per-stage latency histograms and counters of every running worker, Prometheus text format"""
+    body = render_prometheus(load_snapshots(METRICS_DIR))
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # ==================== PLATES ENDPOINTS ====================
 @app.route('/api/plates/recent', methods=['GET'])
 def get_recent_plates():
@@ -91,8 +169,6 @@ def get_recent_plates():
             LIMIT ?
         ''', (limit,)).fetchall()
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'count': len(plates),
@@ -133,8 +209,6 @@ def search_plates():
             ORDER BY timestamp DESC
         ''', (f'%{query}%',)).fetchall()
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'query': query,
@@ -149,11 +223,64 @@ def search_plates():
             'data': []
         }), 200
 
+@app.route('/api/plates/similar', methods=['GET'])
+def similar_plates():
+    """Top-k detected plates within ?max_distance= edits (0-2, default 2) of ?plate= (indexed, no table scan).
+    The index only holds keys for up to SIMILAR_MAX_DISTANCE edits, larger distances are rejected"""
+    try:
+        plate = request.args.get('plate', '')
+        limit = request.args.get('limit', 10, type=int)
+        max_distance = request.args.get('max_distance', 2, type=int)
+
+        if not plate:
+            return jsonify({
+                'success': False,
+                'message': 'Please provide plate',
+                'data': []
+            }), 400
+
+        if not 0 <= max_distance <= SIMILAR_MAX_DISTANCE:
+            return jsonify({
+                'success': False,
+                'message': f'max_distance must be between 0 and {SIMILAR_MAX_DISTANCE}',
+                'data': []
+            }), 400
+
+        if not db:
+            return jsonify({
+                'success': False,
+                'message': 'Database manager not available',
+                'data': []
+            }), 500
+
+        matches = db.search_similar(plate, limit, max_distance)
+
+        return jsonify({
+            'success': True,
+            'plate': plate,
+            'count': len(matches),
+            'data': matches
+        })
+    except Exception as e:
+        print(f"❌ Error in similar_plates: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': []
+        }), 200
+
 # ==================== STATS ENDPOINTS ====================
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get statistics"""
     try:
+        # In-memory counters (O(1)), reconciled periodically against the table
+        if db:
+            return jsonify({
+                'success': True,
+                'data': db.get_statistics()
+            })
+        
         conn = get_db_connection()
         if not conn:
             return jsonify({
@@ -191,8 +318,8 @@ def get_stats():
         # Today's count
         stats['today'] = conn.execute('''
             SELECT COUNT(*) FROM detected_plates 
-            WHERE DATE(timestamp) = DATE('now')
-        ''').fetchone()[0]
+            WHERE timestamp >= ? AND timestamp < ?
+        ''', text_day_range(datetime.now().strftime('%Y-%m-%d'))).fetchone()[0]
         
         # Top plates
         top = conn.execute('''
@@ -204,8 +331,6 @@ def get_stats():
         ''').fetchall()
         stats['top_plates'] = [{'plate': row[0], 'count': row[1]} for row in top]
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'data': stats
@@ -224,11 +349,106 @@ def get_stats():
             }
         })
 
+@app.route('/api/stats/timeseries', methods=['GET'])
+def get_stats_timeseries():
+    """Detections/watchlist hits/alerts per hour or day from the rollup tables
+    (?from=&to=YYYY-MM-DD inclusive, default last 7 days; ?bucket=hour|day; ?source=; ?tz=Area/City)"""
+    try:
+        if not db:
+            return jsonify({
+                'success': False,
+                'message': 'Database manager not available',
+                'data': []
+            }), 500
+        
+        bucket = request.args.get('bucket', 'hour')
+        if bucket not in ('hour', 'day'):
+            return jsonify({
+                'success': False,
+                'message': 'bucket must be hour or day',
+                'data': []
+            }), 400
+        
+        try:
+            tz = request_timezone()
+            end_day = request_day('to')
+            start_day = request_day('from')
+        except ValueError as e:
+            return bad_request(str(e))
+        end_day = end_day or datetime.now(tz).strftime('%Y-%m-%d')
+        start_day = start_day or (datetime.strptime(end_day, '%Y-%m-%d') - timedelta(days=6)).strftime('%Y-%m-%d')
+        start_ms = day_range_ms(start_day, tz)[0]
+        end_ms = day_range_ms(end_day, tz)[1]
+        series = db.get_timeseries(start_ms, end_ms, bucket, request.args.get('source'), tz)
+        
+        return jsonify({
+            'success': True,
+            'from': start_day,
+            'to': end_day,
+            'bucket': bucket,
+            'data': series
+        })
+    except Exception as e:
+        print(f"❌ Error in get_stats_timeseries: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': []
+        }), 200
+
+@app.route('/api/stats/top', methods=['GET'])
+def get_stats_top():
+    """Most detected plates from the rollup tables (?limit=10; ?from=&to=YYYY-MM-DD inclusive, default all time)"""
+    try:
+        if not db:
+            return jsonify({
+                'success': False,
+                'message': 'Database manager not available',
+                'data': []
+            }), 500
+        
+        limit = request.args.get('limit', 10, type=int)
+        try:
+            start_day = request_day('from')
+            end_day = request_day('to')
+        except ValueError as e:
+            return bad_request(str(e))
+        if end_day:
+            # inclusive for the caller, exclusive for the rollup query
+            end_day = (datetime.strptime(end_day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        return jsonify({
+            'success': True,
+            'data': db.get_top_plates(limit, start_day, end_day)
+        })
+    except Exception as e:
+        print(f"❌ Error in get_stats_top: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': []
+        }), 200
+
 @app.route('/api/stats/today', methods=['GET'])
 def get_today_stats():
-    """Get today's statistics"""
+    """Get today's statistics (?date=YYYY-MM-DD for another day, ?tz=Area/City for its boundaries)"""
+    try:
+        tz = request_timezone()
+        day = request_day('date')
+    except ValueError as e:
+        return bad_request(str(e))
     try:
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = day or datetime.now(tz).strftime('%Y-%m-%d')
+        
+        # Range scan on the indexed epoch-ms column, day boundaries in the requested timezone
+        if db:
+            start_ms, end_ms = day_range_ms(today, tz)
+            return jsonify({
+                'success': True,
+                'date': today,
+                'count': db.count_between(start_ms, end_ms),
+                'data': db.get_plates_between(start_ms, end_ms)
+            })
         
         conn = get_db_connection()
         if not conn:
@@ -241,16 +461,14 @@ def get_today_stats():
         
         count = conn.execute('''
             SELECT COUNT(*) FROM detected_plates 
-            WHERE DATE(timestamp) = ?
-        ''', (today,)).fetchone()[0]
+            WHERE timestamp >= ? AND timestamp < ?
+        ''', text_day_range(today)).fetchone()[0]
         
         plates = conn.execute('''
             SELECT * FROM detected_plates 
-            WHERE DATE(timestamp) = ?
+            WHERE timestamp >= ? AND timestamp < ?
             ORDER BY timestamp DESC
-        ''', (today,)).fetchall()
-        
-        conn.close()
+        ''', text_day_range(today)).fetchall()
         
         return jsonify({
             'success': True,
@@ -261,8 +479,8 @@ def get_today_stats():
     except Exception as e:
         print(f"❌ Error in get_today_stats: {e}")
         return jsonify({
-            'success': True,
-            'date': datetime.now().strftime('%Y-%m-%d'),
+            'success': False,
+            'message': str(e),
             'count': 0,
             'data': []
         })
@@ -284,15 +502,12 @@ def get_watchlist():
             watchlist = conn.execute('SELECT * FROM watchlist WHERE active = 1 ORDER BY added_date DESC').fetchall()
         except:
             # Table doesn't exist yet
-            conn.close()
             return jsonify({
                 'success': True,
                 'count': 0,
                 'data': []
             })
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'count': len(watchlist),
@@ -393,15 +608,12 @@ def get_alerts():
         try:
             alerts = conn.execute('SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC').fetchall()
         except:
-            conn.close()
             return jsonify({
                 'success': True,
                 'count': 0,
                 'data': []
             })
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'count': len(alerts),
@@ -428,7 +640,6 @@ def get_plate_image(plate_id):
             }), 404
         
         plate = conn.execute('SELECT image_path FROM detected_plates WHERE id = ?', (plate_id,)).fetchone()
-        conn.close()
         
         if plate is None or plate['image_path'] is None:
             return jsonify({
@@ -438,13 +649,23 @@ def get_plate_image(plate_id):
         
         image_path = plate['image_path']
         
+        if image_path.startswith(SEGMENT_PREFIX):
+            data, mimetype = segment_store.read(image_path) if segment_store else (None, None)
+            if data is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Image file does not exist'
+                }), 404
+            return Response(data, mimetype=mimetype)
+        
         if not os.path.exists(image_path):
             return jsonify({
                 'success': False,
                 'message': 'Image file does not exist'
             }), 404
         
-        return send_file(image_path, mimetype='image/jpeg')
+        # mimetype from the extension: crops may be .jpg or .webp
+        return send_file(image_path)
     except Exception as e:
         print(f"❌ Error in get_plate_image: {e}")
         return jsonify({
@@ -0,0 +1,603 @@
+"""Đo hiệu năng các thành phần nhận dạng biển số.
+
+    python benchmark.py decode                 # giải mã bố cục biển số trên ảnh trong detected_plates/
+    python benchmark.py decode --synthetic 5000
+    python benchmark.py engines --engines torch onnxruntime   # so sánh backend trên cùng bộ ảnh
+    python benchmark.py pipeline --video test.mp4 --json result.json
+    python benchmark.py pipeline --folder detected_plates --engine onnxruntime
+    python benchmark.py db --readers 4 --seconds 5            # 1 luồng ghi + N luồng đọc SQLite
+    python benchmark.py dedup --folder detected_plates        # số bản ghi/ảnh trước và sau khi gộp biến thể OCR
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import function.helper as helper
+from function.engine import ENGINES
+
+# ===================== TIỆN ÍCH =====================
+def time_call(fn, repeat):
+    """Chạy fn() repeat lần, trả về (kết quả lần cuối, thời gian tốt nhất tính bằng giây)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def load_torch_model(weights):
+    from function.engine import load_torch
+    return load_torch(weights)
+
+def list_images(folder):
+    # cả ảnh phẳng cũ lẫn thư mục con theo ngày/nguồn của ImageStore
+    paths = []
+    for ext in ('*.jpg', '*.jpeg', '*.png', '*.webp'):
+        paths.extend(glob.glob(os.path.join(folder, '**', ext), recursive=True))
+    return sorted(paths)
+
+# ===================== DECODE =====================
+def synthetic_boxes(count, seed=0):
+    """Sinh ngẫu nhiên khung ký tự của biển 1 dòng và 2 dòng (có nghiêng nhẹ)"""
+    rng = np.random.default_rng(seed)
+    boxes_list = []
+    for _ in range(count):
+        n = int(rng.integers(6, 11))
+        two_line = rng.random() < 0.5
+        slope = rng.uniform(-0.1, 0.1)
+        rows = []
+        for k in range(n):
+            if two_line:
+                half = (n + 1) // 2
+                col, line = (k, 0) if k < half else (k - half, 1)
+                x = 5 + col * 14 + rng.uniform(-1, 1)
+                y = 10 + line * 30 + slope * x + rng.uniform(-1, 1)
+            else:
+                x = 5 + k * 12 + rng.uniform(-1, 1)
+                y = 20 + slope * x + rng.uniform(-1, 1)
+            rows.append([x - 5, y - 9, x + 5, y + 9, rng.uniform(0.6, 1.0), rng.integers(0, 30)])
+        rng.shuffle(rows)
+        boxes_list.append(np.array(rows, dtype=np.float32).reshape(-1, 6))
+    lut = np.array(list('0123456789ABCDEFGHKLMNPRSTUVXYZ')[:30], dtype=object)
+    return boxes_list, lut
+
+def real_boxes(folder, ocr_weights):
+    """Chạy OCR 1 lần trên ảnh crop đã lưu để lấy khung ký tự thật"""
+    import cv2
+    model = load_torch_model(ocr_weights)
+    model.conf = 0.60
+    images = [cv2.imread(p) for p in list_images(folder)]
+    images = [im for im in images if im is not None]
+    boxes_list = []
+    for i in range(0, len(images), 32):
+        boxes_list.extend(helper.result_arrays(model(images[i:i+32])))
+    return boxes_list, helper.char_lookup(model)
+
+def bench_decode(args):
+    if args.synthetic:
+        boxes_list, lut = synthetic_boxes(args.synthetic)
+        print(f"🧪 {len(boxes_list)} biển số tổng hợp")
+    else:
+        boxes_list, lut = real_boxes(args.folder, args.ocr_weights)
+        print(f"🖼️  {len(boxes_list)} ảnh crop từ {args.folder}")
+    if not boxes_list:
+        print("❌ Không có dữ liệu để đo")
+        return
+
+    n = len(boxes_list)
+    reference = [helper.decode_plate(helper.boxes_to_bb_list(b, lut)) for b in boxes_list]
+    mismatches = []
+    # read_plates decodes one OCR batch per call: compare per batch size, the vectorized
+    # path only pays off past its fixed setup cost (helper.VECTORIZE_MIN_BATCH)
+    print(f"   {'lô':>5} {'vòng lặp':>12} {'NumPy':>12} {'decode_plates':>15}   (µs/biển)")
+    for size in args.batch_sizes:
+        chunks = [boxes_list[i:i+size] for i in range(0, n, size)]
+        _, t_loop = time_call(
+            lambda: [helper.decode_plate(helper.boxes_to_bb_list(b, lut)) for c in chunks for b in c], args.repeat)
+        vectorized, t_vec = time_call(
+            lambda: [p for c in chunks for p in helper.decode_plates_vectorized(c, lut)], args.repeat)
+        chosen, t_chosen = time_call(lambda: [p for c in chunks for p in helper.decode_plates(c, lut)], args.repeat)
+        print(f"   {size:>5} {t_loop / n * 1e6:>12.1f} {t_vec / n * 1e6:>12.1f} {t_chosen / n * 1e6:>15.1f}")
+        mismatches.extend((size, r, v, c) for r, v, c in zip(reference, vectorized, chosen) if not (r == v == c))
+    print(f"   Trùng khớp: {len(args.batch_sizes) * n - len(mismatches)}/{len(args.batch_sizes) * n}")
+    for size, r, v, c in mismatches[:5]:
+        print(f"   ≠ lô {size}: {r!r} / {v!r} / {c!r}")
+
+# ===================== ENGINES =====================
+def bench_engines(args):
+    import cv2
+    from function.engine import load_engine
+
+    images = [cv2.imread(p) for p in list_images(args.folder)]
+    images = [im for im in images if im is not None][:args.limit]
+    if not images:
+        print(f"❌ Không có ảnh trong {args.folder}")
+        return
+    print(f"🖼️  {len(images)} ảnh từ {args.folder}")
+
+    reads = {}
+    for engine in args.engines:
+        try:
+            detector = load_engine(args.detector_weights, engine)
+            ocr = load_engine(args.ocr_weights, engine)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"⚠️  Bỏ qua {engine}: {e}")
+            continue
+        ocr.conf = 0.60
+        # warm-up: the first calls allocate buffers / pick kernels
+        detector(images[:1], size=640)
+        helper.read_plates_cascade(ocr, images[:1])
+
+        _, t_det = time_call(lambda: [detector(images[i:i+args.batch], size=640)
+                                      for i in range(0, len(images), args.batch)], args.repeat)
+        lps, t_ocr = time_call(lambda: [lp for i in range(0, len(images), args.batch)
+                                        for lp in helper.read_plates_cascade(ocr, images[i:i+args.batch])],
+                               args.repeat)
+        reads[engine] = lps
+        n = len(images)
+        print(f"   {engine:<12} detector {t_det / n * 1e3:7.2f} ms/ảnh | OCR {t_ocr / n * 1e3:7.2f} ms/ảnh"
+              f" | đọc được {sum(lp != 'unknown' for lp in lps)}/{n}")
+        # batching pads every crop of a batch to the largest one: the reads must not change
+        single = [helper.read_plate_cascade(ocr, im) for im in images]
+        same = sum(a == b for a, b in zip(single, lps))
+        print(f"   {'':<12} theo lô vs từng ảnh: trùng {same}/{n} biển số")
+        for a, b in [(a, b) for a, b in zip(single, lps) if a != b][:5]:
+            print(f"   ≠ {a!r} (từng ảnh) / {b!r} (lô)")
+
+    # the first engine that ran is the reference for plate-string agreement
+    if len(reads) > 1:
+        ref_name, ref = next(iter(reads.items()))
+        for engine, lps in reads.items():
+            if engine == ref_name:
+                continue
+            same = sum(a == b for a, b in zip(ref, lps))
+            print(f"   {engine} vs {ref_name}: trùng {same}/{len(ref)} biển số")
+            for a, b in [(a, b) for a, b in zip(ref, lps) if a != b][:5]:
+                print(f"   ≠ {a!r} / {b!r}")
+
+# ===================== PIPELINE =====================
+class StageTimes:
+    """Thời gian từng lần chạy của mỗi stage (giây)"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self):
+        result = {}
+        for stage, values in self.samples.items():
+            ms = np.array(values) * 1e3
+            result[stage] = {
+                'count': len(values),
+                'total_ms': round(float(ms.sum()), 3),
+                'mean_ms': round(float(ms.mean()), 3),
+                'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                'p95_ms': round(float(np.percentile(ms, 95)), 3),
+                'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            }
+        return result
+
+def peak_rss_mb():
+    """RSS cao nhất của tiến trình (MB), None nếu không đo được trên hệ điều hành này"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về byte
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def iter_frames(args):
+    """(frame_number, frame, mới_bắt_đầu_cảnh) từ video hoặc thư mục ảnh.
+    Ảnh rời là các cảnh độc lập nên tracker được đặt lại cho từng ảnh"""
+    import cv2
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        frame_number = 0
+        while args.limit <= 0 or frame_number < args.limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_number += 1
+            yield frame_number, frame, frame_number == 1
+        cap.release()
+    else:
+        paths = list_images(args.folder)
+        if args.limit > 0:
+            paths = paths[:args.limit]
+        for frame_number, path in enumerate(paths, 1):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield frame_number, frame, True
+
+def bench_pipeline(args):
+    """detect → deskew → OCR → dedup (tracker + bình chọn) → ghi DB, không GUI"""
+    from function.engine import load_engine
+    from function.tracker import PlateTracker
+    from function.dedup import IngestDedup
+    from database_manager import AdvancedLicensePlateDB
+
+    load_start = time.perf_counter()
+    detector = load_engine(args.detector_weights, args.engine)
+    ocr = load_engine(args.ocr_weights, args.engine)
+    ocr.conf = 0.60
+    load_time = time.perf_counter() - load_start
+
+    # Ghi vào DB tạm để không làm bẩn license_plates.db
+    tmp_dir = tempfile.mkdtemp(prefix='lpr_bench_')
+    db = AdvancedLicensePlateDB(args.db or os.path.join(tmp_dir, 'bench.db'))
+
+    times = StageTimes()
+    tracker = None
+    dedup = IngestDedup(args.dedup_window)
+    frames = 0
+    ocr_calls = 0
+    ocr_crops = 0
+    ocr_unknown = 0
+    tracks_read = 0
+    first_frame = None
+    start = time.perf_counter()
+    try:
+        for frame_number, frame, new_scene in iter_frames(args):
+            frame_start = time.perf_counter()
+            if new_scene or tracker is None:
+                tracker = PlateTracker(args.track_iou, args.track_max_missed, args.ocr_interval)
+
+            t = time.perf_counter()
+            boxes = helper.result_arrays(detector([frame], size=640))[0]
+            times.add('detect', time.perf_counter() - t)
+
+            matches = tracker.update([b[:4] for b in boxes], frame_number)
+            jobs = []
+            crops = []
+            for b, (track, needs_ocr) in zip(boxes, matches):
+                x1, y1, x2, y2 = (int(v) for v in b[:4])
+                if needs_ocr and x2 > x1 and y2 > y1:
+                    track.last_ocr_frame = frame_number
+                    jobs.append((track, float(b[4])))
+                    crops.append(frame[y1:y2, x1:x2])
+
+            if crops:
+                lps = helper.read_plates_cascade(ocr, crops, on_stage=times.add)
+                ocr_calls += 1
+                ocr_crops += len(crops)
+                ocr_unknown += sum(lp == "unknown" for lp in lps)
+
+                t = time.perf_counter()
+                for (track, confidence), lp in zip(jobs, lps):
+                    if lp != "unknown":
+                        if not track.votes:
+                            tracks_read += 1
+                        track.add_read(lp, confidence)
+                times.add('dedup', time.perf_counter() - t)
+
+            t = time.perf_counter()
+            writes = 0
+            for b, (track, _) in zip(boxes, matches):
+                lp = track.best_plate()
+                if lp is None:
+                    continue
+                box = (b[0], b[1], b[2] - b[0], b[3] - b[1])
+                event = track.event
+                if event is None:
+                    event = dedup.match('benchmark', lp, box)
+                    if event is not None:
+                        dedup.merge(event, track, track.votes, box)
+                        track.event = event
+                else:
+                    event.update(track, track.votes)
+                    event.touch(box, time.monotonic())
+                if event is None:
+                    event = track.event = dedup.open('benchmark', track, track.votes, box)
+                    event.plate_id, _ = db.save_plate(lp, frame_number, track.confidence, None, 'benchmark')
+                else:
+                    lp = event.best_plate()
+                    if lp == event.saved_plate:
+                        continue
+                    db.update_plate_number(event.plate_id, lp, track.confidence)
+                event.saved_plate = lp
+                writes += 1
+            if writes:
+                times.add('db_write', time.perf_counter() - t)
+
+            times.add('end_to_end', time.perf_counter() - frame_start)
+            frames += 1
+            if first_frame is None:
+                first_frame = time.perf_counter() - start
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+
+    if not frames:
+        print("❌ Không có frame nào để đo")
+        return
+
+    result = {
+        'config': {
+            'source': args.video or args.folder,
+            'engine': args.engine,
+            'ocr_interval': args.ocr_interval,
+            'track_iou': args.track_iou,
+            'track_max_missed': args.track_max_missed,
+            'dedup_window': args.dedup_window,
+            'limit': args.limit,
+        },
+        'environment': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'frames': frames,
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(frames / elapsed, 2),
+        'model_load_s': round(load_time, 3),
+        'first_frame_s': round(first_frame, 3),
+        'plates': tracks_read,
+        'db_rows': tracks_read - dedup.merged,
+        'ocr_calls': ocr_calls,
+        'ocr_crops': ocr_crops,
+        'ocr_crops_per_plate': round(ocr_crops / tracks_read, 2) if tracks_read else None,
+        'unknown_rate': round(ocr_unknown / ocr_crops, 4) if ocr_crops else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': times.summary(),
+    }
+
+    print(f"🎞️  {frames} frame trong {elapsed:.2f}s → {result['fps']} FPS "
+          f"(tải model {load_time:.1f}s, frame đầu {first_frame:.2f}s)")
+    print(f"   {'stage':<11} {'lần':>6} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for stage, st in result['stages'].items():
+        print(f"   {stage:<11} {st['count']:>6} {st['p50_ms']:>9.2f} {st['p95_ms']:>9.2f} {st['p99_ms']:>9.2f}")
+    print(f"   Biển số: {tracks_read} | crop OCR/biển: {result['ocr_crops_per_plate']} | "
+          f"tỉ lệ unknown: {result['unknown_rate']} | RSS đỉnh: {result['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi kết quả: {args.json}")
+
+# ===================== DB =====================
+DB_READ_QUERIES = (
+    'SELECT * FROM detected_plates ORDER BY timestamp DESC LIMIT 10',
+    "SELECT * FROM detected_plates WHERE plate_number LIKE '%123%' ORDER BY timestamp DESC LIMIT 50",
+    'SELECT COUNT(*) FROM alerts WHERE resolved = 0',
+)
+
+def seed_db(path, rows, journal_mode):
+    from database_manager import AdvancedLicensePlateDB, now_stamp
+    AdvancedLicensePlateDB(path).connections.close()
+    timestamp, ts_ms = now_stamp()
+    conn = sqlite3.connect(path)
+    conn.executemany('''
+        INSERT INTO detected_plates (plate_number, timestamp, ts_ms, frame_number, confidence, source)
+        VALUES (?, ?, ?, ?, 0.9, 'benchmark')
+    ''', [(f"{30 + i % 60}A-{i % 99999:05d}", timestamp, ts_ms, i) for i in range(rows)])
+    conn.commit()
+    # AdvancedLicensePlateDB đã bật WAL, DB của chế độ cũ quay lại journal mặc định
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    conn.close()
+
+def run_db_load(path, readers, seconds, mode):
+    """mode 'legacy': mở/đóng kết nối mỗi thao tác, journal mặc định (như code cũ);
+    mode 'pooled': kết nối cố định theo luồng từ ConnectionManager (WAL + pragma)"""
+    from database_manager import get_connection_manager
+    manager = get_connection_manager(path) if mode == 'pooled' else None
+
+    def connect():
+        return manager.connection() if manager else sqlite3.connect(path)
+
+    def release(conn):
+        if manager is None:
+            conn.close()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    write_latency = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn = connect()
+            try:
+                conn.execute('''
+                    INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, source)
+                    VALUES (?, ?, ?, 0.9, 'writer')
+                ''', (f"99W-{i:05d}", time.strftime('%Y-%m-%d %H:%M:%S'), i))
+                conn.commit()
+                write_latency.append(time.perf_counter() - start)
+                i += 1
+                with lock:
+                    counts['writes'] += 1
+            except sqlite3.OperationalError:
+                conn.rollback()
+                with lock:
+                    counts['errors'] += 1
+            finally:
+                release(conn)
+
+    def reader():
+        n = 0
+        while not stop.is_set():
+            conn = connect()
+            try:
+                conn.execute(DB_READ_QUERIES[n % len(DB_READ_QUERIES)]).fetchall()
+                n += 1
+                with lock:
+                    counts['reads'] += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    counts['errors'] += 1
+            finally:
+                release(conn)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    ms = np.array(write_latency or [0.0]) * 1e3
+    return {
+        'writes_per_s': round(counts['writes'] / seconds, 1),
+        'reads_per_s': round(counts['reads'] / seconds, 1),
+        'lock_errors': counts['errors'],
+        'write_p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'write_p99_ms': round(float(np.percentile(ms, 99)), 3),
+    }
+
+def bench_db(args):
+    print(f"🗃️  {args.rows} bản ghi, 1 luồng ghi + {args.readers} luồng đọc, {args.seconds:g}s mỗi chế độ")
+    tmp_dir = tempfile.mkdtemp(prefix='lpr_dbbench_')
+    try:
+        results = {}
+        for mode, journal_mode in (('legacy', 'DELETE'), ('pooled', 'WAL')):
+            path = os.path.join(tmp_dir, f'{mode}.db')
+            seed_db(path, args.rows, journal_mode)
+            r = results[mode] = run_db_load(path, args.readers, args.seconds, mode)
+            print(f"   {mode:<7} ghi {r['writes_per_s']:>8.1f}/s (p50 {r['write_p50_ms']:.2f} ms, "
+                  f"p99 {r['write_p99_ms']:.2f} ms) | đọc {r['reads_per_s']:>8.1f}/s | lỗi khóa {r['lock_errors']}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'rows': args.rows, 'readers': args.readers, 'seconds': args.seconds,
+                           'git_revision': git_revision(), 'results': results}, f, indent=2)
+            print(f"💾 Đã ghi kết quả: {args.json}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# ===================== DEDUP =====================
+def iter_crop_reads(folder):
+    """(thời điểm, biển số) của ảnh crop {plate}_{YYYYmmdd_HHMMSS}.jpg, theo thời gian"""
+    reads = []
+    for path in glob.glob(os.path.join(folder, '*.jpg')):
+        plate, _, stamp = os.path.splitext(os.path.basename(path))[0].rpartition('_')
+        plate, _, day = plate.rpartition('_')
+        try:
+            reads.append((time.mktime(time.strptime(day + stamp, '%Y%m%d%H%M%S')), plate))
+        except ValueError:
+            continue
+    return sorted(reads)
+
+def bench_dedup(args):
+    """Phát lại các ảnh crop đã lưu (mỗi ảnh = 1 bản ghi + 1 ảnh khi chưa gộp) qua IngestDedup.
+    Ảnh không có vị trí khung nên chỉ gộp theo nguồn, thời gian và khoảng cách sửa"""
+    from function.dedup import IngestDedup
+    from function.tracker import Track
+
+    reads = iter_crop_reads(args.folder)
+    if not reads:
+        print(f"❌ Không có ảnh {{biển số}}_{{YYYYmmdd_HHMMSS}}.jpg trong {args.folder}")
+        return
+    dedup = IngestDedup(args.window, args.distance)
+    events = []
+    for k, (ts, plate) in enumerate(reads):
+        track = Track(k, (0, 0, 0, 0), k)
+        track.add_read(plate, 1.0)
+        event = dedup.match('replay', plate, None, ts)
+        if event is None:
+            events.append(dedup.open('replay', track, track.votes, None, ts))
+        else:
+            dedup.merge(event, track, track.votes, None, ts)
+
+    print(f"🔗 {len(reads)} lần đọc → {len(events)} bản ghi/ảnh "
+          f"(giảm {len(reads) / len(events):.1f}x, cửa sổ {args.window:g}s, khoảng cách <= {args.distance})")
+    for event in events:
+        if len(event.votes) > 1:
+            print(f"   {event.best_plate():<12} ← {', '.join(sorted(event.plates()))}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'reads': len(reads), 'events': len(events), 'window': args.window,
+                       'distance': args.distance, 'git_revision': git_revision(),
+                       'merged': [sorted(e.plates()) for e in events if len(e.votes) > 1]},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi kết quả: {args.json}")
+
+# ===================== MAIN =====================
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark nhận dạng biển số')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('decode', help='So sánh decode_plate (vòng lặp) với decode_plates (NumPy)')
+    p.add_argument('--folder', default='detected_plates', help='Thư mục ảnh crop biển số')
+    p.add_argument('--ocr-weights', default='model/LP_ocr.pt')
+    p.add_argument('--synthetic', type=int, default=0, help='Dùng N biển số tổng hợp thay vì chạy model OCR')
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                   help='Số crop mỗi lần gọi (như 1 lô OCR của read_plates)')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser('engines', help='So sánh tốc độ và kết quả đọc biển giữa các backend suy luận')
+    p.add_argument('--engines', nargs='+', default=['torch', 'onnxruntime', 'openvino'])
+    p.add_argument('--folder', default='detected_plates', help='Thư mục ảnh dùng để đo')
+    p.add_argument('--detector-weights', default='model/LP_detector.pt')
+    p.add_argument('--ocr-weights', default='model/LP_ocr.pt')
+    p.add_argument('--limit', type=int, default=200, help='Số ảnh tối đa')
+    p.add_argument('--batch', type=int, default=8)
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_engines)
+
+    p = sub.add_parser('pipeline', help='Chạy toàn bộ pipeline không GUI, đo độ trễ từng stage')
+    src = p.add_mutually_exclusive_group()
+    src.add_argument('--video', help='File video phát lại')
+    src.add_argument('--folder', default='detected_plates', help='Thư mục ảnh (mỗi ảnh là 1 cảnh riêng)')
+    p.add_argument('--engine', choices=ENGINES, default='torch')
+    p.add_argument('--detector-weights', default='model/LP_detector.pt')
+    p.add_argument('--ocr-weights', default='model/LP_ocr.pt')
+    p.add_argument('--ocr-interval', type=int, default=10)
+    p.add_argument('--track-iou', type=float, default=0.3)
+    p.add_argument('--track-max-missed', type=int, default=15)
+    p.add_argument('--dedup-window', type=float, default=5.0)
+    p.add_argument('--limit', type=int, default=0, help='Số frame/ảnh tối đa, 0 = tất cả')
+    p.add_argument('--db', help='Ghi vào file DB này thay vì DB tạm')
+    p.add_argument('--json', help='Ghi kết quả ra file JSON')
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('db', help='1 luồng ghi + N luồng đọc: kết nối cũ so với ConnectionManager')
+    p.add_argument('--readers', type=int, default=4)
+    p.add_argument('--seconds', type=float, default=5.0)
+    p.add_argument('--rows', type=int, default=50000, help='Số bản ghi có sẵn trong DB thử')
+    p.add_argument('--json', help='Ghi kết quả ra file JSON')
+    p.set_defaults(func=bench_db)
+
+    p = sub.add_parser('dedup', help='Phát lại ảnh crop đã lưu qua bộ gộp biến thể OCR')
+    p.add_argument('--folder', default='detected_plates', help='Thư mục ảnh {biển số}_{YYYYmmdd_HHMMSS}.jpg')
+    p.add_argument('--window', type=float, default=5.0, help='Cửa sổ gộp (giây)')
+    p.add_argument('--distance', type=int, default=2, help='Khoảng cách sửa tối đa')
+    p.add_argument('--json', help='Ghi kết quả ra file JSON')
+    p.set_defaults(func=bench_dedup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
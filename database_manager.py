@@ -1,20 +1,131 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import queue
+import threading
+import time
 from difflib import SequenceMatcher
+from collections import Counter
 
-class AdvancedLicensePlateDB:
-    def __init__(self, db_path='license_plates.db'):
-        self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Khởi tạo database với các bảng mở rộng"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+from function.plate_text import edit_distance, normalize_plate
+
+# ==================== MIGRATIONS ====================
+# Mỗi migration: (phiên bản, mô tả, danh sách câu lệnh SQL hoặc hàm nhận conn). PRAGMA user_version lưu phiên bản
+# đã áp dụng; DB cũ (user_version = 0, đã có bảng) đi qua migration 1 không đổi gì vì IF NOT EXISTS.
+# Chỉ thêm migration mới vào cuối, không sửa migration đã phát hành.
+def _index_existing_plates(conn):
+    # các biển số đã có trước khi có bảng plate_search
+    index_plates(conn, [row[0] for row in conn.execute('SELECT DISTINCT plate_number FROM detected_plates')])
+
+def _watchlist_version_triggers():
+    statements = []
+    for event in ('INSERT', 'DELETE', 'UPDATE OF plate_number, reason, alert_type, active'):
+        name = 'watchlist_version_' + event.split()[0].lower()
+        statements.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON watchlist
+            BEGIN
+                UPDATE watchlist_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+    return statements
+
+# ---------- bảng tổng hợp (rollup) cho thống kê ----------
+# đầu giờ (epoch ms UTC) của 1 bản ghi; timestamp không đọc được thì vào giờ 0
+def _rollup_hour(row):
+    return f'''(COALESCE({row}.ts_ms, CAST(strftime('%s', {row}.timestamp, 'utc') AS INTEGER) * 1000, 0)
+               / 3600000 * 3600000)'''
+
+def _rollup_plate_statements(row, delta):
+    # cộng (delta = 1) hoặc trừ (delta = -1) 1 bản ghi detected_plates vào các bảng rollup
+    hit = f'(COALESCE({row}.is_watchlist, 0) != 0)'
+    statements = [
+        f'''INSERT INTO rollup_hourly (hour_ms, source, detections, watchlist_hits)
+            VALUES ({_rollup_hour(row)}, COALESCE({row}.source, ''), {delta}, {delta} * {hit})
+            ON CONFLICT (hour_ms, source) DO UPDATE
+            SET detections = detections + excluded.detections, watchlist_hits = watchlist_hits + excluded.watchlist_hits''',
+        f'''INSERT INTO rollup_daily (day, source, detections, watchlist_hits)
+            VALUES (substr({row}.timestamp, 1, 10), COALESCE({row}.source, ''), {delta}, {delta} * {hit})
+            ON CONFLICT (day, source) DO UPDATE
+            SET detections = detections + excluded.detections, watchlist_hits = watchlist_hits + excluded.watchlist_hits''',
+        f'''INSERT INTO rollup_daily_plates (day, plate_number, count)
+            VALUES (substr({row}.timestamp, 1, 10), {row}.plate_number, {delta})
+            ON CONFLICT (day, plate_number) DO UPDATE SET count = count + excluded.count''',
+        f'''INSERT INTO rollup_plates (plate_number, count) VALUES ({row}.plate_number, {delta})
+            ON CONFLICT (plate_number) DO UPDATE SET count = count + excluded.count''',
+    ]
+    if delta < 0:
+        # bỏ dòng đã về 0 để COUNT(*) của rollup_plates là số biển số khác nhau
+        statements += [
+            f'DELETE FROM rollup_hourly WHERE hour_ms = {_rollup_hour(row)} AND source = COALESCE({row}.source, \'\') AND detections <= 0',
+            f'DELETE FROM rollup_daily WHERE day = substr({row}.timestamp, 1, 10) AND source = COALESCE({row}.source, \'\') AND detections <= 0',
+            f'DELETE FROM rollup_daily_plates WHERE day = substr({row}.timestamp, 1, 10) AND plate_number = {row}.plate_number AND count <= 0',
+            f'DELETE FROM rollup_plates WHERE plate_number = {row}.plate_number AND count <= 0',
+        ]
+    return statements
+
+def _rollup_alert_statement(row, delta):
+    return f'''INSERT INTO rollup_alerts_hourly (hour_ms, alert_type, count)
+               VALUES (COALESCE(CAST(strftime('%s', {row}.timestamp, 'utc') AS INTEGER) * 1000, 0) / 3600000 * 3600000,
+                       COALESCE({row}.alert_type, ''), {delta})
+               ON CONFLICT (hour_ms, alert_type) DO UPDATE SET count = count + excluded.count'''
+
+def _rollup_triggers():
+    # cập nhật rollup trong cùng giao dịch với thay đổi của bảng gốc (mọi đường ghi: save_plate,
+    # ghi theo lô, xóa, retention, công cụ ngoài), nên rollup luôn khớp từng bản ghi
+    def trigger(name, event, table, statements, when=''):
+        body = ''.join(f'{sql};\n' for sql in statements)
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} {when}
+            BEGIN
+                {body}
+            END
+        '''
+    return [
+        trigger('rollup_plates_insert', 'INSERT', 'detected_plates', _rollup_plate_statements('NEW', 1)),
+        trigger('rollup_plates_delete', 'DELETE', 'detected_plates', _rollup_plate_statements('OLD', -1)),
+        # đổi biển số/nguồn/thời gian: trừ bản cũ, cộng bản mới (ts_ms suy ra từ timestamp nên không cần theo dõi)
+        trigger('rollup_plates_update', 'UPDATE OF plate_number, source, timestamp, is_watchlist', 'detected_plates',
+                _rollup_plate_statements('OLD', -1) + _rollup_plate_statements('NEW', 1),
+                '''WHEN OLD.plate_number IS NOT NEW.plate_number OR OLD.source IS NOT NEW.source
+                   OR OLD.timestamp IS NOT NEW.timestamp OR OLD.is_watchlist IS NOT NEW.is_watchlist'''),
+        trigger('rollup_alerts_insert', 'INSERT', 'alerts', [_rollup_alert_statement('NEW', 1)]),
+        trigger('rollup_alerts_delete', 'DELETE', 'alerts', [_rollup_alert_statement('OLD', -1)]),
+    ]
+
+def rebuild_rollups(conn):
+    """Tính lại toàn bộ bảng rollup từ bảng gốc (migration, sửa chữa). Người gọi tự commit"""
+    for table in ('rollup_hourly', 'rollup_daily', 'rollup_daily_plates', 'rollup_plates', 'rollup_alerts_hourly'):
+        conn.execute(f'DELETE FROM {table}')
+    hour = _rollup_hour('detected_plates')
+    conn.execute(f'''
+        INSERT INTO rollup_hourly (hour_ms, source, detections, watchlist_hits)
+        SELECT {hour}, COALESCE(source, ''), COUNT(*), SUM(COALESCE(is_watchlist, 0) != 0)
+        FROM detected_plates GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO rollup_daily (day, source, detections, watchlist_hits)
+        SELECT substr(timestamp, 1, 10), COALESCE(source, ''), COUNT(*), SUM(COALESCE(is_watchlist, 0) != 0)
+        FROM detected_plates GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO rollup_daily_plates (day, plate_number, count)
+        SELECT substr(timestamp, 1, 10), plate_number, COUNT(*) FROM detected_plates GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO rollup_plates (plate_number, count)
+        SELECT plate_number, COUNT(*) FROM detected_plates GROUP BY 1
+    ''')
+    conn.execute('''
+        INSERT INTO rollup_alerts_hourly (hour_ms, alert_type, count)
+        SELECT COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000, 0) / 3600000 * 3600000,
+               COALESCE(alert_type, ''), COUNT(*)
+        FROM alerts GROUP BY 1, 2
+    ''')
+
+MIGRATIONS = [
+    (1, 'Bảng gốc', [
         # Bảng biển số đã phát hiện
-        cursor.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS detected_plates (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 plate_number TEXT NOT NULL,
@@ -26,10 +137,9 @@ class AdvancedLicensePlateDB:
                 is_watchlist INTEGER DEFAULT 0,
                 alert_triggered INTEGER DEFAULT 0
             )
-        ''')
-        
+        ''',
         # Bảng danh sách theo dõi (watchlist)
-        cursor.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS watchlist (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 plate_number TEXT UNIQUE NOT NULL,
@@ -40,10 +150,19 @@ class AdvancedLicensePlateDB:
                 detection_count INTEGER DEFAULT 0,
                 active INTEGER DEFAULT 1
             )
-        ''')
-        
+        ''',
+        # Số phiên bản watchlist: tăng mỗi khi danh sách đổi (kể cả từ tiến trình khác),
+        # để WatchlistIndex biết khi nào cần tải lại
+        '''
+            CREATE TABLE IF NOT EXISTS watchlist_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''',
+        'INSERT OR IGNORE INTO watchlist_version (id, version) VALUES (1, 0)',
+        *_watchlist_version_triggers(),
         # Bảng cảnh báo
-        cursor.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS alerts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 plate_number TEXT NOT NULL,
@@ -52,10 +171,9 @@ class AdvancedLicensePlateDB:
                 message TEXT,
                 resolved INTEGER DEFAULT 0
             )
-        ''')
-        
+        ''',
         # Bảng lịch sử xóa (để khôi phục)
-        cursor.execute('''
+        '''
             CREATE TABLE IF NOT EXISTS deleted_plates (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 original_id INTEGER,
@@ -64,31 +182,445 @@ class AdvancedLicensePlateDB:
                 deleted_date TEXT,
                 deleted_reason TEXT
             )
-        ''')
-        
-        conn.commit()
+        ''',
+    ]),
+    (2, 'Index cho các truy vấn thường dùng', [
+        # gần nhất, theo khoảng thời gian, xóa bản ghi cũ
+        'CREATE INDEX IF NOT EXISTS idx_detected_plates_timestamp ON detected_plates (timestamp)',
+        # lịch sử 1 biển số, đếm theo biển số (covering cho COUNT/GROUP BY plate_number)
+        'CREATE INDEX IF NOT EXISTS idx_detected_plates_plate ON detected_plates (plate_number, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_detected_plates_confidence ON detected_plates (confidence)',
+        # cảnh báo chưa xử lý, mới nhất trước
+        'CREATE INDEX IF NOT EXISTS idx_alerts_resolved ON alerts (resolved, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_watchlist_active ON watchlist (active, added_date)',
+    ]),
+    (3, 'Cột ts_ms (epoch mili giây) cho truy vấn theo khoảng thời gian', [
+        'ALTER TABLE detected_plates ADD COLUMN ts_ms INTEGER',
+        # timestamp TEXT là giờ địa phương: 'utc' đổi sang UTC theo múi giờ của máy
+        '''
+            UPDATE detected_plates
+            SET ts_ms = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000
+            WHERE ts_ms IS NULL
+        ''',
+        # bản ghi chèn không kèm ts_ms (khôi phục, công cụ ngoài) vẫn có ts_ms
+        '''
+            CREATE TRIGGER IF NOT EXISTS detected_plates_ts_ms AFTER INSERT ON detected_plates
+            WHEN NEW.ts_ms IS NULL
+            BEGIN
+                UPDATE detected_plates
+                SET ts_ms = CAST(strftime('%s', NEW.timestamp, 'utc') AS INTEGER) * 1000
+                WHERE id = NEW.id;
+            END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_detected_plates_ts_ms ON detected_plates (ts_ms)',
+    ]),
+    (4, 'Chỉ mục tìm biển số gần đúng', [
+        # mỗi biển số khác nhau 1 dòng
+        '''
+            CREATE TABLE IF NOT EXISTS plate_search (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                plate_number TEXT UNIQUE NOT NULL,
+                normalized TEXT NOT NULL
+            )
+        ''',
+        # khóa xóa-ký-tự (xem deletion_keys) -> plate_search.id
+        '''
+            CREATE TABLE IF NOT EXISTS plate_search_keys (
+                key TEXT NOT NULL,
+                plate_id INTEGER NOT NULL,
+                PRIMARY KEY (key, plate_id)
+            ) WITHOUT ROWID
+        ''',
+        _index_existing_plates,
+    ]),
+    (5, 'Kho ảnh dạng segment (nhiều ảnh trong 1 file lớn)', [
+        # file segment chỉ ghi nối thêm; sealed: 0 = đang ghi, 1 = đã đóng, 2 = đã nén, chờ xóa file
+        '''
+            CREATE TABLE IF NOT EXISTS image_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                sealed INTEGER NOT NULL DEFAULT 0
+            )
+        ''',
+        # vị trí từng ảnh; detected_plates.image_path = 'segment:<id>'
+        '''
+            CREATE TABLE IF NOT EXISTS image_blobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                segment_id INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                format TEXT,
+                ts_ms INTEGER NOT NULL
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_image_blobs_segment ON image_blobs (segment_id, offset)',
+        # tìm bản ghi đang dùng 1 ảnh (nén segment, dọn ảnh mồ côi)
+        'CREATE INDEX IF NOT EXISTS idx_detected_plates_image_path ON detected_plates (image_path)',
+    ]),
+    (6, 'Bảng tổng hợp theo giờ/ngày cho thống kê', [
+        # số lần phát hiện theo giờ và nguồn (biểu đồ theo thời gian)
+        '''
+            CREATE TABLE IF NOT EXISTS rollup_hourly (
+                hour_ms INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                detections INTEGER NOT NULL DEFAULT 0,
+                watchlist_hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour_ms, source)
+            ) WITHOUT ROWID
+        ''',
+        # như rollup_hourly nhưng theo ngày (giờ địa phương, như timestamp): biểu đồ dài hạn
+        '''
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                day TEXT NOT NULL,
+                source TEXT NOT NULL,
+                detections INTEGER NOT NULL DEFAULT 0,
+                watchlist_hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, source)
+            ) WITHOUT ROWID
+        ''',
+        # số lần xuất hiện của từng biển số theo ngày (top N trong 1 khoảng ngày), day theo giờ địa phương
+        '''
+            CREATE TABLE IF NOT EXISTS rollup_daily_plates (
+                day TEXT NOT NULL,
+                plate_number TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, plate_number)
+            ) WITHOUT ROWID
+        ''',
+        # tổng toàn thời gian của từng biển số (top N, số biển số khác nhau)
+        '''
+            CREATE TABLE IF NOT EXISTS rollup_plates (
+                plate_number TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_rollup_plates_count ON rollup_plates (count)',
+        '''
+            CREATE TABLE IF NOT EXISTS rollup_alerts_hourly (
+                hour_ms INTEGER NOT NULL,
+                alert_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour_ms, alert_type)
+            ) WITHOUT ROWID
+        ''',
+        rebuild_rollups,
+        *_rollup_triggers(),
+    ]),
+    (7, 'Bộ đếm số lần xóa bản ghi cho thống kê trong bộ nhớ', [
+        '''
+            CREATE TABLE IF NOT EXISTS plate_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''',
+        "INSERT OR IGNORE INTO plate_counters (name, value) VALUES ('deleted', 0)",
+        # mọi kiểu xóa (delete_plate, xóa hàng loạt, retention, tiến trình khác) đều được đếm
+        '''
+            CREATE TRIGGER IF NOT EXISTS detected_plates_count_deleted AFTER DELETE ON detected_plates
+            BEGIN
+                UPDATE plate_counters SET value = value + 1 WHERE name = 'deleted';
+            END
+        ''',
+    ]),
+]
+
+# ảnh nằm trong kho segment (function/segment_store.py) thay vì 1 file riêng
+SEGMENT_PREFIX = 'segment:'
+
+def segment_blob_id(image_path):
+    """id trong image_blobs nếu image_path trỏ vào kho segment, ngược lại None"""
+    if image_path and image_path.startswith(SEGMENT_PREFIX):
+        return int(image_path[len(SEGMENT_PREFIX):])
+    return None
+
+# ==================== THỜI GIAN ====================
+# timestamp TEXT ('%Y-%m-%d %H:%M:%S', giờ địa phương) để hiển thị, ts_ms (epoch mili giây, UTC)
+# để lọc: "hôm nay", "N phút gần đây", xóa bản ghi cũ đều là khoảng [start, end) trên index ts_ms
+def now_stamp():
+    """(timestamp TEXT giờ địa phương, ts_ms) của cùng 1 thời điểm"""
+    now = datetime.now()
+    return now.strftime('%Y-%m-%d %H:%M:%S'), int(now.timestamp() * 1000)
+
+def to_ms(dt):
+    """datetime -> epoch mili giây (datetime không có tzinfo được hiểu là giờ địa phương)"""
+    return int(dt.timestamp() * 1000)
+
+def day_range_ms(day=None, tz=None):
+    """[start, end) epoch mili giây của 1 ngày theo múi giờ tz (None = múi giờ của máy).
+    day: date hoặc 'YYYY-MM-DD', mặc định là hôm nay theo tz. Ngày đổi giờ (23h/25h) vẫn đúng
+    vì 2 mốc được tính riêng từ nửa đêm"""
+    if day is None:
+        day = datetime.now(tz).date()
+    elif isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    if tz is None:
+        return to_ms(start.astimezone()), to_ms(end.astimezone())
+    return to_ms(start.replace(tzinfo=tz)), to_ms(end.replace(tzinfo=tz))
+
+def since_ms(minutes=0, days=0):
+    """epoch mili giây của thời điểm cách đây minutes phút + days ngày"""
+    return int((time.time() - minutes * 60 - days * 86400) * 1000)
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Áp dụng các migration chưa chạy, mỗi migration trong 1 giao dịch. Trả về [(phiên bản, mô tả)]"""
+    applied = []
+    current = schema_version(conn)
+    for version, description, statements in migrations:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # tiến trình khác có thể vừa nâng cấp xong trong lúc chờ khóa ghi
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for sql in statements:
+                # bước cần Python (VD: tính dữ liệu cho bảng mới) là 1 hàm nhận conn
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    if applied:
+        conn.execute('PRAGMA optimize')
+    return applied
+
+def enable_incremental_vacuum(conn):
+    """Chuyển DB sang auto_vacuum=INCREMENTAL để PRAGMA incremental_vacuum trả dung lượng trống về
+    cho hệ điều hành. DB tạo trước đó phải VACUUM lại toàn bộ 1 lần (khóa DB, cần thêm dung lượng
+    bằng kích thước DB). Trả về True nếu đã phải VACUUM"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+# ==================== KIỂM TRA QUERY PLAN ====================
+# Truy vấn nóng phải dùng index: (tên, SQL, tham số, có ORDER BY cần lấy thẳng từ index).
+# Tìm kiếm LIKE '%...%' không dùng được index B-tree nên không nằm trong danh sách này
+HOT_QUERIES = [
+    ('recent_plates', 'SELECT * FROM detected_plates ORDER BY timestamp DESC LIMIT ?', (10,), True),
+    ('plate_history', 'SELECT * FROM detected_plates WHERE plate_number = ? ORDER BY timestamp DESC',
+     ('29A-12345',), True),
+    ('keep_latest', '''
+        DELETE FROM detected_plates 
+        WHERE plate_number = ? AND id NOT IN (
+            SELECT id FROM detected_plates WHERE plate_number = ? ORDER BY timestamp DESC LIMIT 1
+        )
+    ''', ('29A-12345', '29A-12345'), False),
+    ('duplicates_window', '''
+        SELECT plate_number, COUNT(*) as count, MIN(timestamp), MAX(timestamp)
+        FROM detected_plates WHERE ts_ms >= ? GROUP BY plate_number HAVING count > 1
+    ''', (0,), False),
+    ('expired_plates', 'SELECT * FROM detected_plates WHERE ts_ms < ? ORDER BY ts_ms LIMIT ?', (0, 500), True),
+    ('purge_plate', 'DELETE FROM detected_plates WHERE id = ?', (1,), False),
+    ('count_range', 'SELECT COUNT(*) FROM detected_plates WHERE ts_ms >= ? AND ts_ms < ?', (0, 1), False),
+    ('plates_range', 'SELECT * FROM detected_plates WHERE ts_ms >= ? AND ts_ms < ? ORDER BY ts_ms DESC',
+     (0, 1), True),
+    ('rollup_series', '''
+        SELECT hour_ms, source, detections, watchlist_hits FROM rollup_hourly
+        WHERE hour_ms >= ? AND hour_ms < ? ORDER BY hour_ms
+    ''', (0, 1), True),
+    ('rollup_daily', 'SELECT day, source, detections, watchlist_hits FROM rollup_daily WHERE day >= ? AND day <= ?',
+     ('2024-01-01', '2024-12-31'), False),
+    ('rollup_alerts', '''
+        SELECT hour_ms, SUM(count) FROM rollup_alerts_hourly WHERE hour_ms >= ? AND hour_ms < ? GROUP BY hour_ms
+    ''', (0, 1), False),
+    ('rollup_top', 'SELECT plate_number, count FROM rollup_plates ORDER BY count DESC LIMIT ?', (5,), True),
+    ('deleted_counter', "SELECT value FROM plate_counters WHERE name = ?", ('deleted',), False),
+    ('rollup_top_days', '''
+        SELECT plate_number, SUM(count) FROM rollup_daily_plates WHERE day >= ? AND day < ? GROUP BY plate_number
+    ''', ('2024-01-01', '2024-02-01'), False),
+    ('delete_low_confidence', 'DELETE FROM detected_plates WHERE confidence < ?', (0.5,), False),
+    ('update_plate', 'UPDATE detected_plates SET plate_number = ? WHERE id = ?', ('29A-12345', 1), False),
+    ('stats_tail', 'SELECT id, plate_number, timestamp FROM detected_plates WHERE id > ? ORDER BY id',
+     (0,), True),
+    ('alerts_pending', 'SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC', (), True),
+    ('alerts_pending_count', 'SELECT COUNT(*) FROM alerts WHERE resolved = 0', (), False),
+    ('watchlist_active', 'SELECT * FROM watchlist WHERE active = 1 ORDER BY added_date DESC', (), True),
+    ('watchlist_plate', 'SELECT * FROM watchlist WHERE plate_number = ? AND active = 1', ('29A-12345',), False),
+    ('similar_keys', 'SELECT plate_id FROM plate_search_keys WHERE key IN (?, ?)', ('29A1234', '29A1235'), False),
+    ('similar_plates', 'SELECT plate_number, normalized FROM plate_search WHERE id IN (?, ?)', (1, 2), False),
+    ('index_plate', 'SELECT id FROM plate_search WHERE plate_number = ?', ('29A-12345',), False),
+    ('image_blob', 'SELECT segment_id, offset, length, format FROM image_blobs WHERE id = ?', (1,), False),
+    ('image_owner', 'SELECT 1 FROM detected_plates WHERE image_path = ?', ('segment:1',), False),
+    ('segment_blobs', 'SELECT id, offset, length FROM image_blobs WHERE segment_id = ? ORDER BY offset',
+     (1,), True),
+    ('watchlist_touch', '''
+        UPDATE watchlist SET last_seen = ?, detection_count = detection_count + 1 WHERE plate_number = ?
+    ''', ('2024-01-01 00:00:00', '29A-12345'), False),
+]
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """EXPLAIN QUERY PLAN cho từng truy vấn nóng. Trả về [(tên, lý do, plan)] của các truy vấn
+    quét toàn bảng (SCAN không qua index) hoặc phải sắp xếp lại kết quả (TEMP B-TREE FOR ORDER BY)"""
+    problems = []
+    for name, sql, params, ordered in queries:
+        plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+        for detail in plan:
+            words = detail.split()
+            # "SCAN detected_plates" / "SCAN TABLE detected_plates" (SQLite cũ), không có "USING ... INDEX"
+            if words and words[0] == 'SCAN' and 'INDEX' not in words:
+                problems.append((name, 'quét toàn bảng', plan))
+                break
+            if ordered and 'TEMP B-TREE FOR ORDER BY' in detail:
+                problems.append((name, 'sắp xếp không theo index', plan))
+                break
+    return problems
+
+# ==================== KẾT NỐI ====================
+class ConnectionManager:
+    """Kết nối SQLite dùng lại được, đã chỉnh pragma cho 1 luồng ghi + nhiều luồng đọc.
+    
+    - connection(): 1 kết nối cố định cho mỗi luồng (luồng sống lâu: frame loop, writer...)
+    - acquire()/release(): mượn/trả từ pool (luồng ngắn hạn: mỗi request của Flask)
+    - open(): kết nối riêng, người gọi tự đóng
+    - bind(scoped): connection() dùng kết nối của phạm vi hiện tại (VD: request Flask
+      mượn từ pool) thay vì mở kết nối riêng cho luồng
+    
+    WAL cho phép đọc trong lúc đang ghi; synchronous=NORMAL an toàn với WAL (chỉ có thể
+    mất giao dịch cuối khi mất điện, không hỏng DB). Câu lệnh đã biên dịch được cache
+    theo từng kết nối (cached_statements), nên chỉ có lợi khi kết nối được giữ lại.
+    """
+    
+    PRAGMAS = (
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', 5000),
+        ('cache_size', -65536),       # 64 MB
+        ('mmap_size', 268435456),     # 256 MB
+        ('temp_store', 'MEMORY'),
+    )
+    
+    def __init__(self, db_path, pool_size=8):
+        self.db_path = db_path
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.local = threading.local()
+        self.scoped = None
+        conn = sqlite3.connect(db_path)
+        # chỉ có tác dụng với DB mới (chưa có bảng); DB cũ: enable_incremental_vacuum()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
         conn.close()
-        print(f"✅ Database nâng cao đã sẵn sàng: {self.db_path}")
+        if mode.lower() != 'wal':
+            print(f"⚠️  Không bật được WAL cho {db_path} (journal_mode={mode})")
+    
+    def open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.PRAGMAS:
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+    
+    def bind(self, scoped):
+        """scoped() trả về kết nối của phạm vi hiện tại, hoặc None nếu ngoài phạm vi"""
+        self.scoped = scoped
+    
+    def connection(self):
+        if self.scoped is not None:
+            conn = self.scoped()
+            if conn is not None:
+                return conn
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.open()
+        return conn
+    
+    def acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return self.open()
+    
+    def release(self, conn):
+        # không trả về pool một giao dịch đang dở
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close(self):
+        """Đóng kết nối của luồng hiện tại và các kết nối đang nằm trong pool"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_path):
+    """1 ConnectionManager dùng chung cho mỗi file DB trong tiến trình"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_path)
+        return manager
+
+class AdvancedLicensePlateDB:
+    def __init__(self, db_path='license_plates.db', watchlist_distance=0):
+        self.db_path = db_path
+        self.connections = get_connection_manager(db_path)
+        self.init_database()
+        self.stats = PlateStatistics(db_path)
+        self.watchlist_index = WatchlistIndex(db_path)
+        # 1 = chấp nhận biển số đọc sai/thừa/thiếu 1 ký tự khi so với watchlist
+        self.watchlist_distance = watchlist_distance
+    
+    def connect(self):
+        """Kết nối cố định của luồng hiện tại (không đóng sau khi dùng)"""
+        conn = self.connections.connection()
+        # lần gọi trước bị lỗi giữa chừng: bỏ giao dịch dở dang của nó
+        if conn.in_transaction:
+            conn.rollback()
+        return conn
+    
+    def init_database(self):
+        """Khởi tạo/nâng cấp database lên phiên bản schema mới nhất (xem MIGRATIONS)"""
+        conn = self.connect()
+        applied = migrate(conn)
+        for version, description in applied:
+            print(f"🔧 Migration {version}: {description}")
+        print(f"✅ Database nâng cao đã sẵn sàng: {self.db_path} (schema v{schema_version(conn)})")
     
     # ==================== CHỨC NĂNG LƯU BIỂN SỐ ====================
     def save_plate(self, plate_number, frame_number, confidence=0.0, 
                    image_path=None, source='webcam'):
         """Lưu biển số và kiểm tra watchlist"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp, ts_ms = now_stamp()
         
         # Kiểm tra xem có trong watchlist không
         is_watchlist, watchlist_info = self.check_watchlist(plate_number)
         
         cursor.execute('''
             INSERT INTO detected_plates 
-            (plate_number, timestamp, frame_number, confidence, image_path, source, is_watchlist)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (plate_number, timestamp, frame_number, confidence, image_path, source, int(is_watchlist)))
+            (plate_number, timestamp, ts_ms, frame_number, confidence, image_path, source, is_watchlist)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (plate_number, timestamp, ts_ms, frame_number, confidence, image_path, source, int(is_watchlist)))
         
         plate_id = cursor.lastrowid
+        index_plates(conn, [plate_number])
         
         # Nếu trong watchlist, tạo cảnh báo
         if is_watchlist:
@@ -101,12 +633,12 @@ class AdvancedLicensePlateDB:
             ''', (plate_number, timestamp, alert_type, 
                   f"Phát hiện biển số trong danh sách theo dõi: {reason}"))
             
-            # Cập nhật watchlist
+            # Cập nhật watchlist (bản ghi khớp, có thể khác 1 ký tự nếu so gần đúng)
             cursor.execute('''
                 UPDATE watchlist 
                 SET last_seen = ?, detection_count = detection_count + 1
                 WHERE plate_number = ?
-            ''', (timestamp, plate_number))
+            ''', (timestamp, watchlist_info['plate_number']))
             
             # Đánh dấu đã kích hoạt cảnh báo
             cursor.execute('''
@@ -114,14 +646,71 @@ class AdvancedLicensePlateDB:
             ''', (plate_id,))
         
         conn.commit()
-        conn.close()
         
         return plate_id, is_watchlist
     
+    def update_plate_number(self, plate_id, plate_number, confidence=None):
+        """Cập nhật biển số của 1 bản ghi (VD: kết quả bình chọn của track thay đổi)"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT alert_triggered, plate_number FROM detected_plates WHERE id = ?', (plate_id,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        already_alerted = bool(row[0])
+        old_plate = row[1]
+        
+        is_watchlist, watchlist_info = self.check_watchlist(plate_number)
+        
+        if confidence is None:
+            cursor.execute('''
+                UPDATE detected_plates SET plate_number = ?, is_watchlist = ? WHERE id = ?
+            ''', (plate_number, int(is_watchlist), plate_id))
+        else:
+            cursor.execute('''
+                UPDATE detected_plates SET plate_number = ?, is_watchlist = ?, confidence = ? WHERE id = ?
+            ''', (plate_number, int(is_watchlist), confidence, plate_id))
+        index_plates(conn, [plate_number])
+        
+        # Biển số mới nằm trong watchlist và bản ghi chưa từng cảnh báo -> tạo cảnh báo
+        triggered_alert = is_watchlist and not already_alerted
+        if triggered_alert:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+                INSERT INTO alerts (plate_number, timestamp, alert_type, message)
+                VALUES (?, ?, ?, ?)
+            ''', (plate_number, timestamp, watchlist_info['alert_type'],
+                  f"Phát hiện biển số trong danh sách theo dõi: {watchlist_info['reason']}"))
+            
+            # Cập nhật watchlist
+            cursor.execute('''
+                UPDATE watchlist
+                SET last_seen = ?, detection_count = detection_count + 1
+                WHERE plate_number = ?
+            ''', (timestamp, watchlist_info['plate_number']))
+            
+            # Đánh dấu đã kích hoạt cảnh báo
+            cursor.execute('''
+                UPDATE detected_plates SET alert_triggered = 1 WHERE id = ?
+            ''', (plate_id,))
+        
+        with self.stats.lock:
+            conn.commit()
+            self.stats.on_rename(plate_id, old_plate, plate_number)
+        
+        return triggered_alert
+    
+    def set_image_path(self, plate_id, image_path):
+        """Gắn ảnh crop cho bản ghi, gọi sau khi file ảnh đã ghi xong"""
+        conn = self.connect()
+        conn.execute('UPDATE detected_plates SET image_path = ? WHERE id = ?', (image_path, plate_id))
+        conn.commit()
+    
     # ==================== WATCHLIST ====================
     def add_to_watchlist(self, plate_number, reason='', alert_type='warning'):
         """Thêm biển số vào danh sách theo dõi"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -133,29 +722,28 @@ class AdvancedLicensePlateDB:
             ''', (plate_number, reason, alert_type, timestamp))
             conn.commit()
             watchlist_id = cursor.lastrowid
-            conn.close()
+            self.watchlist_index.invalidate()
             return True, watchlist_id
         except sqlite3.IntegrityError:
-            conn.close()
+            conn.rollback()
             return False, "Biển số đã có trong watchlist"
     
     def remove_from_watchlist(self, plate_number):
         """Xóa biển số khỏi watchlist"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM watchlist WHERE plate_number = ?', (plate_number,))
         deleted = cursor.rowcount
         
         conn.commit()
-        conn.close()
+        self.watchlist_index.invalidate()
         
         return deleted > 0
     
     def get_watchlist(self, active_only=True):
         """Lấy danh sách watchlist"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.connect()
         cursor = conn.cursor()
         
         if active_only:
@@ -164,46 +752,46 @@ class AdvancedLicensePlateDB:
             cursor.execute('SELECT * FROM watchlist ORDER BY added_date DESC')
         
         watchlist = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in watchlist]
     
-    def check_watchlist(self, plate_number):
-        """Kiểm tra biển số có trong watchlist không"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM watchlist WHERE plate_number = ? AND active = 1', (plate_number,))
-        result = cursor.fetchone()
-        
-        conn.close()
-        
+    def check_watchlist(self, plate_number, max_distance=None):
+        """Kiểm tra biển số có trong watchlist không (tra trong bộ nhớ, không truy vấn DB)"""
+        if max_distance is None:
+            max_distance = self.watchlist_distance
+        result = self.watchlist_index.lookup(plate_number, max_distance)
         if result:
-            return True, dict(result)
+            return True, result
         return False, None
     
     # ==================== SO SÁNH BIỂN SỐ ====================
+    def search_similar(self, plate_number, limit=10, max_distance=2):
+        """Top-k biển số đã phát hiện gần plate_number nhất (khoảng cách sửa trên biển số đã chuẩn hóa),
+        xếp theo khoảng cách rồi số lần xuất hiện. Dùng chỉ mục plate_search, không quét bảng.
+        max_distance tối đa SIMILAR_MAX_DISTANCE (ValueError nếu lớn hơn)"""
+        matches = search_plate_index(self.connect(), plate_number, max_distance)
+        counts = self.stats.counts([plate for plate, _ in matches])
+        results = [{'plate_number': plate, 'distance': distance, 'count': counts.get(plate, 0)}
+                   for plate, distance in matches if plate != plate_number]
+        # biển số chỉ còn trong chỉ mục (mọi bản ghi đã bị xóa) không trả về
+        results = [r for r in results if r['count'] > 0]
+        results.sort(key=lambda r: (r['distance'], -r['count'], r['plate_number']))
+        return results[:limit]
+    
     def find_similar_plates(self, plate_number, threshold=0.8):
         """Tìm biển số tương tự (fuzzy matching)"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT DISTINCT plate_number FROM detected_plates')
-        all_plates = cursor.fetchall()
-        conn.close()
-        
         similar_plates = []
         
-        for row in all_plates:
-            existing_plate = row['plate_number']
+        # ứng viên lấy từ chỉ mục, chỉ tính tỉ lệ giống nhau trên vài biển số này
+        for match in self.search_similar(plate_number, limit=None):
+            existing_plate = match['plate_number']
             similarity = self.calculate_similarity(plate_number, existing_plate)
             
-            if similarity >= threshold and existing_plate != plate_number:
+            if similarity >= threshold:
                 similar_plates.append({
                     'plate_number': existing_plate,
-                    'similarity': similarity
+                    'similarity': similarity,
+                    'distance': match['distance']
                 })
         
         return sorted(similar_plates, key=lambda x: x['similarity'], reverse=True)
@@ -214,8 +802,7 @@ class AdvancedLicensePlateDB:
     
     def find_duplicates(self, time_window_minutes=5):
         """Tìm biển số trùng lặp trong khoảng thời gian"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -223,21 +810,20 @@ class AdvancedLicensePlateDB:
                    MIN(timestamp) as first_seen, 
                    MAX(timestamp) as last_seen
             FROM detected_plates
-            WHERE timestamp >= datetime('now', '-' || ? || ' minutes')
+            WHERE ts_ms >= ?
             GROUP BY plate_number
             HAVING count > 1
             ORDER BY count DESC
-        ''', (time_window_minutes,))
+        ''', (since_ms(minutes=time_window_minutes),))
         
         duplicates = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in duplicates]
     
     # ==================== XÓA THÔNG MINH ====================
     def delete_plate(self, plate_id, reason=''):
         """Xóa biển số với lý do và backup"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Lấy thông tin trước khi xóa
@@ -245,7 +831,6 @@ class AdvancedLicensePlateDB:
         plate_data = cursor.fetchone()
         
         if not plate_data:
-            conn.close()
             return False, "Không tìm thấy biển số"
         
         # Backup vào bảng deleted
@@ -256,21 +841,23 @@ class AdvancedLicensePlateDB:
             VALUES (?, ?, ?, ?, ?)
         ''', (plate_data[0], plate_data[1], plate_data[2], timestamp, reason))
         
-        # Xóa file ảnh nếu có
-        if plate_data[5] and os.path.exists(plate_data[5]):
+        # Xóa file ảnh nếu có (ảnh trong kho segment: bỏ khỏi chỉ mục, dung lượng thu hồi khi nén)
+        blob_id = segment_blob_id(plate_data[5])
+        if blob_id is not None:
+            cursor.execute('DELETE FROM image_blobs WHERE id = ?', (blob_id,))
+        elif plate_data[5] and os.path.exists(plate_data[5]):
             os.remove(plate_data[5])
         
         # Xóa record
         cursor.execute('DELETE FROM detected_plates WHERE id = ?', (plate_id,))
         
         conn.commit()
-        conn.close()
         
         return True, "Đã xóa thành công"
     
     def delete_by_plate_number(self, plate_number, keep_latest=True):
         """Xóa tất cả records của 1 biển số (có tùy chọn giữ lại bản mới nhất)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         if keep_latest:
@@ -290,29 +877,67 @@ class AdvancedLicensePlateDB:
         
         deleted_count = cursor.rowcount
         conn.commit()
-        conn.close()
+        if deleted_count:
+            self.stats.mark_stale()
         
         return deleted_count
     
-    def delete_old_records(self, days=30):
-        """Xóa records cũ hơn X ngày"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM detected_plates 
-            WHERE timestamp < datetime('now', '-' || ? || ' days')
-        ''', (days,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+    def delete_old_records(self, days=30, batch_size=500):
+        """Xóa records cũ hơn X ngày (kèm ảnh), từng lô để không giữ khóa ghi lâu.
+        Lưu trữ trước khi xóa, giới hạn I/O, chạy nền: function/retention.py"""
+        cutoff = since_ms(days=days)
+        deleted_count = 0
+        while True:
+            rows = self.expired_plates(cutoff, batch_size)
+            if not rows:
+                break
+            deleted_count += self.purge_plates(rows)[0]
         
         return deleted_count
     
+    def expired_plates(self, cutoff_ms, limit=500):
+        """Các record cũ nhất có ts_ms < cutoff_ms (đầy đủ cột, để lưu trữ trước khi xóa)"""
+        conn = self.connect()
+        return conn.execute('''
+            SELECT * FROM detected_plates WHERE ts_ms < ? ORDER BY ts_ms LIMIT ?
+        ''', (cutoff_ms, limit)).fetchall()
+    
+    def purge_plates(self, rows):
+        """Xóa hẳn các record (không qua deleted_plates) cùng ảnh của chúng.
+        Trả về (số record đã xóa, số byte ảnh file đã xóa)"""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('DELETE FROM detected_plates WHERE id = ?', [(row['id'],) for row in rows])
+            # ảnh trong kho segment: bỏ khỏi chỉ mục, dung lượng thu hồi khi nén segment
+            conn.executemany('DELETE FROM image_blobs WHERE id = ?',
+                             [(segment_blob_id(row['image_path']),) for row in rows
+                              if segment_blob_id(row['image_path']) is not None])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        # file ảnh chỉ xóa sau khi giao dịch đã commit
+        freed = 0
+        for row in rows:
+            path = row['image_path']
+            if not path or segment_blob_id(path) is not None:
+                continue
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        if rows:
+            self.stats.mark_stale()
+        
+        return len(rows), freed
+    
     def bulk_delete_by_confidence(self, min_confidence=0.5):
         """Xóa hàng loạt theo độ tin cậy thấp"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -321,21 +946,21 @@ class AdvancedLicensePlateDB:
         
         deleted_count = cursor.rowcount
         conn.commit()
-        conn.close()
+        if deleted_count:
+            self.stats.mark_stale()
         
         return deleted_count
     
     # ==================== KHÔI PHỤC ====================
     def restore_deleted_plate(self, deleted_id):
         """Khôi phục biển số đã xóa"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM deleted_plates WHERE id = ?', (deleted_id,))
         deleted_data = cursor.fetchone()
         
         if not deleted_data:
-            conn.close()
             return False, "Không tìm thấy bản ghi đã xóa"
         
         # Khôi phục vào bảng chính (không có ảnh)
@@ -344,20 +969,19 @@ class AdvancedLicensePlateDB:
             (plate_number, timestamp, frame_number, confidence, source)
             VALUES (?, ?, 0, 0.0, 'restored')
         ''', (deleted_data[2], deleted_data[3]))
+        index_plates(conn, [deleted_data[2]])
         
         # Xóa khỏi bảng deleted
         cursor.execute('DELETE FROM deleted_plates WHERE id = ?', (deleted_id,))
         
         conn.commit()
-        conn.close()
         
         return True, "Khôi phục thành công"
     
     # ==================== CẢNH BÁO ====================
     def get_alerts(self, unresolved_only=True):
         """Lấy danh sách cảnh báo"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.connect()
         cursor = conn.cursor()
         
         if unresolved_only:
@@ -366,23 +990,25 @@ class AdvancedLicensePlateDB:
             cursor.execute('SELECT * FROM alerts ORDER BY timestamp DESC LIMIT 100')
         
         alerts = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in alerts]
     
     def resolve_alert(self, alert_id):
         """Đánh dấu cảnh báo đã xử lý"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('UPDATE alerts SET resolved = 1 WHERE id = ?', (alert_id,))
         conn.commit()
-        conn.close()
     
     # ==================== THỐNG KÊ ====================
-    def get_statistics(self):
-        """Lấy thống kê chi tiết"""
-        conn = sqlite3.connect(self.db_path)
+    def get_statistics(self, top_plates=True):
+        """Lấy thống kê chi tiết (bộ đếm trong bộ nhớ, O(1); top_plates đọc từ index của rollup)"""
+        return self.stats.get(top_plates)
+    
+    def compute_statistics(self):
+        """Tính lại thống kê từ toàn bộ bảng (chậm với bảng lớn, dùng để đối chiếu)"""
+        conn = self.connect()
         cursor = conn.cursor()
         
         stats = {}
@@ -394,10 +1020,7 @@ class AdvancedLicensePlateDB:
         stats['alerts_pending'] = cursor.execute('SELECT COUNT(*) FROM alerts WHERE resolved = 0').fetchone()[0]
         
         # Hôm nay
-        stats['today'] = cursor.execute('''
-            SELECT COUNT(*) FROM detected_plates 
-            WHERE DATE(timestamp) = DATE('now')
-        ''').fetchone()[0]
+        stats['today'] = self.count_between(*day_range_ms())
         
         # Top biển số
         cursor.execute('''
@@ -409,21 +1032,105 @@ class AdvancedLicensePlateDB:
         ''')
         stats['top_plates'] = [{'plate': row[0], 'count': row[1]} for row in cursor.fetchall()]
         
-        conn.close()
         return stats
     
     def get_total_count(self):
         """Đếm tổng số biển số"""
-        conn = sqlite3.connect(self.db_path)
+        return self.stats.get(top_plates=False)['total']
+    
+    def count_between(self, start_ms, end_ms):
+        """Số bản ghi có start_ms <= ts_ms < end_ms (quét khoảng trên index)"""
+        conn = self.connect()
+        return conn.execute('''
+            SELECT COUNT(*) FROM detected_plates WHERE ts_ms >= ? AND ts_ms < ?
+        ''', (start_ms, end_ms)).fetchone()[0]
+    
+    def get_plates_between(self, start_ms, end_ms, limit=None):
+        """Bản ghi có start_ms <= ts_ms < end_ms, mới nhất trước"""
+        conn = self.connect()
         cursor = conn.cursor()
-        count = cursor.execute('SELECT COUNT(*) FROM detected_plates').fetchone()[0]
-        conn.close()
-        return count
+        
+        cursor.execute('''
+            SELECT * FROM detected_plates 
+            WHERE ts_ms >= ? AND ts_ms < ?
+            ORDER BY ts_ms DESC 
+            LIMIT ?
+        ''', (start_ms, end_ms, -1 if limit is None else limit))
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    # ==================== THỐNG KÊ TỪ ROLLUP ====================
+    def get_timeseries(self, start_ms, end_ms, bucket='hour', source=None, tz=None):
+        """Số phát hiện, lượt watchlist, cảnh báo theo giờ (time = đầu giờ, epoch ms) hoặc ngày
+        (date theo múi giờ tz, None = giờ máy) trong [start_ms, end_ms), đọc từ bảng rollup.
+        Cảnh báo không gắn với nguồn nên không lọc theo source"""
+        conn = self.connect()
+        start_ms -= start_ms % 3600000
+        if end_ms <= start_ms:
+            return []
+        
+        hours = range(start_ms, end_ms, 3600000)
+        to_key = None
+        alerts_key = 'hour_ms'
+        if bucket == 'day' and tz is None:
+            # ngày theo giờ máy (như cột timestamp): đọc thẳng bảng theo ngày
+            first = datetime.fromtimestamp(start_ms / 1000).date()
+            days = (datetime.fromtimestamp((end_ms - 1) / 1000).date() - first).days + 1
+            keys = [(first + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+            sql = 'SELECT day, source, detections, watchlist_hits FROM rollup_daily WHERE day >= ? AND day <= ?'
+            params = [keys[0], keys[-1]]
+            alerts_key = "date(hour_ms / 1000, 'unixepoch', 'localtime')"
+        else:
+            sql = 'SELECT hour_ms, source, detections, watchlist_hits FROM rollup_hourly WHERE hour_ms >= ? AND hour_ms < ?'
+            params = [start_ms, end_ms]
+            if bucket == 'hour':
+                keys = list(hours)
+            else:
+                # ngày theo múi giờ tz: gộp các giờ, tính ngày 1 lần cho mỗi giờ
+                to_key = {hour_ms: datetime.fromtimestamp(hour_ms / 1000, tz).strftime('%Y-%m-%d') for hour_ms in hours}
+                keys = list(dict.fromkeys(to_key.values()))
+        if source is not None:
+            sql += ' AND source = ?'
+            params.append(source)
+        
+        # mọi khoảng thời gian đều có mặt, kể cả khi không có phát hiện nào
+        series = {k: {'detections': 0, 'watchlist_hits': 0, 'alerts': 0, 'sources': {}} for k in keys}
+        for k, src, detections, hits in conn.execute(sql, params):
+            point = series.get(to_key[k] if to_key else k)
+            if point is None:
+                continue
+            point['detections'] += detections
+            point['watchlist_hits'] += hits
+            point['sources'][src] = point['sources'].get(src, 0) + detections
+        for k, count in conn.execute(f'''
+            SELECT {alerts_key}, SUM(count) FROM rollup_alerts_hourly WHERE hour_ms >= ? AND hour_ms < ? GROUP BY 1
+        ''', (start_ms, end_ms)):
+            point = series.get(to_key[k] if to_key else k)
+            if point is not None:
+                point['alerts'] += count
+        
+        label = 'time' if bucket == 'hour' else 'date'
+        return [{label: k, **point} for k, point in series.items()]
+    
+    def get_top_plates(self, limit=10, start_day=None, end_day=None):
+        """Biển số xuất hiện nhiều nhất, toàn thời gian hoặc trong các ngày [start_day, end_day)
+        ('YYYY-MM-DD' giờ địa phương), đọc từ bảng rollup"""
+        conn = self.connect()
+        if start_day is None and end_day is None:
+            rows = conn.execute('''
+                SELECT plate_number, count FROM rollup_plates ORDER BY count DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT plate_number, SUM(count) AS count FROM rollup_daily_plates
+                WHERE day >= ? AND day < ?
+                GROUP BY plate_number ORDER BY count DESC LIMIT ?
+            ''', (start_day or '0000-00-00', end_day or '9999-99-99', limit)).fetchall()
+        return [{'plate': row[0], 'count': row[1]} for row in rows]
     
     def get_recent_plates(self, limit=10):
         """Lấy biển số gần nhất"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -433,6 +1140,649 @@ class AdvancedLicensePlateDB:
         ''', (limit,))
         
         plates = cursor.fetchall()
+        
+        return [dict(row) for row in plates]
+
+# ==================== WATCHLIST TRONG BỘ NHỚ ====================
+def within_one_edit(a, b):
+    """Khoảng cách Levenshtein giữa a và b <= 1"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i+1:] == b[i+1:]
+    return a[i:] == b[i+1:]
+
+class WatchlistIndex:
+    """Watchlist đang hoạt động giữ trong bộ nhớ.
+    
+    - Khớp chính xác: dict plate_number -> bản ghi.
+    - Khớp gần đúng (sai/thừa/thiếu 1 ký tự): chỉ mục xóa-1-ký-tự trên biển số đã chuẩn hóa;
+      2 chuỗi cách nhau <= 1 phép sửa luôn có chung 1 khóa trong chỉ mục này.
+    - Tải lại khi watchlist_version (tăng bằng trigger) đổi; chỉ kiểm tra khi
+      PRAGMA data_version báo DB có thay đổi, tối đa mỗi check_interval giây.
+    """
+    
+    def __init__(self, db_path, check_interval=0.5):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.swap_lock = threading.Lock()
+        self.conn = None
+        self.version = None
+        self.data_version = None
+        self.last_check = 0.0
+        self.loading = False
+        self.columns = ()
+        self.exact = {}       # plate_number -> hàng (tuple)
+        self.normalized = {}  # biển số chuẩn hóa -> hàng
+        self.deletes = {}     # biển số chuẩn hóa bỏ 1 ký tự -> khóa chuẩn hóa (str, hoặc tuple nếu trùng)
+    
+    def lookup(self, plate_number, max_distance=0):
+        """Bản ghi watchlist khớp với plate_number, None nếu không có"""
+        self._maybe_reload()
+        row = self.exact.get(plate_number)
+        if row is not None:
+            return dict(zip(self.columns, row))
+        if max_distance <= 0:
+            return None
+        
+        key = normalize_plate(plate_number)
+        row = self.normalized.get(key)
+        if row is not None:
+            return dict(zip(self.columns, row), match_distance=0)
+        candidates = set()
+        for variant in self._variants(key) | {key}:
+            found = self.deletes.get(variant)
+            if isinstance(found, tuple):
+                candidates.update(found)
+            elif found is not None:
+                candidates.add(found)
+            if variant in self.normalized:
+                candidates.add(variant)
+        matches = sorted(c for c in candidates if within_one_edit(key, c))
+        if not matches:
+            return None
+        return dict(zip(self.columns, self.normalized[matches[0]]), match_distance=1)
+    
+    @staticmethod
+    def _variants(key):
+        return {key[:i] + key[i+1:] for i in range(len(key))}
+    
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        with self.lock:
+            # đang tải lại ở nền: chưa đọc data_version, để thay đổi commit trong lúc tải
+            # vẫn được thấy ở lần kiểm tra sau khi tải xong
+            if now - self.last_check < self.check_interval or self.loading:
+                return
+            self.last_check = now
+            if self.conn is None:
+                self.conn = get_connection_manager(self.db_path).open()
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version:
+                return
+            version = self.conn.execute('SELECT version FROM watchlist_version WHERE id = 1').fetchone()[0]
+            if version == self.version:
+                self.data_version = data_version
+                return
+            if self.version is None:
+                # lần tải đầu: phải có watchlist trước khi trả lời tra cứu
+                self._load(self.conn, version)
+                self.data_version = data_version
+                return
+            # tải lại ở luồng nền, trong lúc đó vẫn tra bằng chỉ mục cũ
+            self.loading = True
+            threading.Thread(target=self._reload, args=(version, data_version), name='watchlist-reload',
+                             daemon=True).start()
+    
+    def _reload(self, version, data_version):
+        conn = get_connection_manager(self.db_path).open()
+        try:
+            self._load(conn, version)
+            # chỉ đánh dấu đã xử lý data_version khi đã tải thành công
+            self.data_version = data_version
+        except sqlite3.Error as e:
+            print(f"⚠️  Không tải lại được watchlist: {e}")
+        finally:
+            conn.close()
+            self.loading = False
+    
+    def _load(self, conn, version):
+        cursor = conn.execute('SELECT * FROM watchlist WHERE active = 1 ORDER BY id')
+        columns = tuple(d[0] for d in cursor.description)
+        plate_col = columns.index('plate_number')
+        exact = {}
+        normalized = {}
+        deletes = {}
+        for row in cursor:
+            row = tuple(row)
+            exact[row[plate_col]] = row
+            key = normalize_plate(row[plate_col])
+            if key in normalized:
+                continue
+            normalized[key] = row
+            for variant in self._variants(key):
+                found = deletes.get(variant)
+                if found is None:
+                    deletes[variant] = key
+                elif isinstance(found, tuple):
+                    deletes[variant] = found + (key,)
+                elif found != key:
+                    deletes[variant] = (found, key)
+        with self.swap_lock:
+            # 1 lần tải nền bắt đầu trước invalidate() không được ghi đè kết quả mới hơn
+            if self.version is not None and version < self.version:
+                return
+            # thay cả bộ chỉ mục 1 lần để luồng đang tra cứu không thấy trạng thái dở dang
+            self.columns, self.exact, self.normalized, self.deletes = columns, exact, normalized, deletes
+            self.version = version
+    
+    def invalidate(self):
+        """Tải lại ngay (đồng bộ) sau khi chính tiến trình này sửa watchlist: tra cứu kế tiếp đã thấy thay đổi"""
+        with self.lock:
+            if self.conn is None:
+                self.conn = get_connection_manager(self.db_path).open()
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            version = self.conn.execute('SELECT version FROM watchlist_version WHERE id = 1').fetchone()[0]
+            self._load(self.conn, version)
+            if not self.loading:
+                self.data_version = data_version
+            self.last_check = time.monotonic()
+
+# ==================== TÌM BIỂN SỐ GẦN ĐÚNG ====================
+# Chỉ mục xóa-ký-tự (symmetric delete) lưu trong SQLite: mỗi biển số (đã chuẩn hóa) được lưu
+# dưới mọi chuỗi thu được khi xóa <= SIMILAR_MAX_DISTANCE ký tự. Nếu 2 biển số cách nhau <= d
+# phép sửa thì 2 tập khóa (xóa <= d ký tự) luôn giao nhau, nên 1 truy vấn chỉ cần ~37 lần dò
+# khóa chính (biển 8 ký tự) rồi tính khoảng cách thật trên vài ứng viên.
+# Đổi lại ~37 dòng khóa cho mỗi biển số khác nhau (~130MB cho 200k biển số)
+SIMILAR_MAX_DISTANCE = 2
+
+def deletion_keys(normalized, max_distance=SIMILAR_MAX_DISTANCE):
+    keys = {normalized}
+    level = {normalized}
+    for _ in range(max_distance):
+        level = {w[:i] + w[i+1:] for w in level for i in range(len(w))}
+        keys |= level
+    return keys
+
+def index_plates(conn, plate_numbers):
+    """Thêm biển số mới vào chỉ mục (gọi trong giao dịch ghi detected_plates).
+    Biển số đã có chỉ tốn 1 lần dò UNIQUE"""
+    for plate_number in set(plate_numbers):
+        cursor = conn.execute('INSERT OR IGNORE INTO plate_search (plate_number, normalized) VALUES (?, ?)',
+                              (plate_number, normalize_plate(plate_number)))
+        if cursor.rowcount != 1:
+            continue
+        plate_id = cursor.lastrowid
+        conn.executemany('INSERT OR IGNORE INTO plate_search_keys (key, plate_id) VALUES (?, ?)',
+                         [(key, plate_id) for key in deletion_keys(normalize_plate(plate_number))])
+
+def search_plate_index(conn, plate_number, max_distance=SIMILAR_MAX_DISTANCE):
+    """[(plate_number, khoảng cách)] của mọi biển số trong chỉ mục cách plate_number <= max_distance.
+    Chỉ mục chỉ lưu khóa xóa <= SIMILAR_MAX_DISTANCE ký tự nên không tìm xa hơn được"""
+    if not 0 <= max_distance <= SIMILAR_MAX_DISTANCE:
+        raise ValueError(f"max_distance phải trong khoảng 0..{SIMILAR_MAX_DISTANCE}, nhận {max_distance}")
+    normalized = normalize_plate(plate_number)
+    keys = list(deletion_keys(normalized, max_distance))
+    plate_ids = [row[0] for row in conn.execute(f'''
+        SELECT DISTINCT plate_id FROM plate_search_keys WHERE key IN ({','.join('?' * len(keys))})
+    ''', keys)]
+    if not plate_ids:
+        return []
+    matches = []
+    for candidate, candidate_normalized in conn.execute(f'''
+        SELECT plate_number, normalized FROM plate_search WHERE id IN ({','.join('?' * len(plate_ids))})
+    ''', plate_ids):
+        distance = edit_distance(normalized, candidate_normalized, max_distance)
+        if distance <= max_distance:
+            matches.append((candidate, distance))
+    return matches
+
+# ==================== THỐNG KÊ TRONG BỘ NHỚ ====================
+class PlateStatistics:
+    """Bộ đếm thống kê giữ trong bộ nhớ, đọc O(1) cho overlay và /api/stats.
+    
+    - Bản ghi mới (của mọi tiến trình) được cộng dần bằng cách đọc các id mới hơn
+      last_id, chỉ khi PRAGMA data_version báo DB đã đổi.
+    - Bản ghi bị delete_plate xóa được trừ dần qua bảng deleted_plates. Trigger đếm mọi
+      lần xóa (plate_counters), số lần xóa không khớp số dòng deleted_plates mới thì đếm lại.
+    - Đổi biển số (update_plate_number) được báo qua on_rename, gọi cùng lúc commit
+      dưới self.lock.
+    - Xóa hàng loạt, thay đổi từ tiến trình khác mà không có dấu vết: lần đối chiếu
+      định kỳ (reconcile_interval giây, hoặc ngay sau mark_stale) đọc lại từ các bảng
+      rollup (không quét bảng gốc).
+    """
+    
+    def __init__(self, db_path, reconcile_interval=600, refresh_interval=0.25):
+        self.db_path = db_path
+        self.reconcile_interval = reconcile_interval
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.conn = None
+        self.loaded = False
+        self.stale = threading.Event()
+        
+        self.plate_counts = Counter()
+        self.day_counts = Counter()
+        self.total = 0
+        self.watchlist_count = 0
+        self.alerts_pending = 0
+        self.last_id = 0
+        self.last_deleted_id = 0
+        self.data_version = None
+        self.last_refresh = 0.0
+        self.deleted_count = 0  # plate_counters 'deleted' đã trừ tới
+        self.replay = None  # on_rename trong lúc đang đếm lại
+    
+    # ---------- đọc ----------
+    def get(self, top_plates=True):
+        """top_plates=False bỏ qua top 5 (overlay mỗi frame chỉ cần các bộ đếm)"""
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            self._maybe_refresh()
+            stats = {
+                'total': self.total,
+                'unique': len(self.plate_counts),
+                'watchlist_count': self.watchlist_count,
+                'alerts_pending': self.alerts_pending,
+                'today': self.day_counts.get(datetime.now().strftime('%Y-%m-%d'), 0),
+            }
+            if top_plates:
+                # top N lấy thẳng từ index idx_rollup_plates_count, không duyệt mọi biển số
+                stats['top_plates'] = [{'plate': plate, 'count': count} for plate, count in self.conn.execute('''
+                    SELECT plate_number, count FROM rollup_plates ORDER BY count DESC LIMIT 5
+                ''')]
+            return stats
+    
+    def counts(self, plate_numbers):
+        """{plate_number: số lần xuất hiện} cho các biển số cho trước"""
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            self._maybe_refresh()
+            return {plate: self.plate_counts.get(plate, 0) for plate in plate_numbers}
+    
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self.last_refresh >= self.refresh_interval:
+            self.last_refresh = now
+            self._refresh()
+    
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.conn = get_connection_manager(self.db_path).open()
+            self.reconcile()
+            self.loaded = True
+        threading.Thread(target=self._reconcile_loop, name='stats-reconcile', daemon=True).start()
+    
+    # ---------- cập nhật gia tăng ----------
+    def _refresh(self):
+        if self.replay is not None:
+            # đang đếm lại toàn bộ, kết quả mới sẽ thay thế bộ đếm hiện tại
+            return
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self.data_version:
+            return
+        self.data_version = version
+        
+        cursor = self.conn.cursor()
+        # 1 giao dịch đọc để bảng xóa và bảng chính nhất quán với nhau
+        cursor.execute('BEGIN')
+        deleted = cursor.execute('''
+            SELECT id, original_id, plate_number, timestamp FROM deleted_plates WHERE id > ?
+        ''', (self.last_deleted_id,)).fetchall()
+        added = cursor.execute('''
+            SELECT id, plate_number, timestamp FROM detected_plates WHERE id > ? ORDER BY id
+        ''', (self.last_id,)).fetchall()
+        self.watchlist_count = cursor.execute('SELECT COUNT(*) FROM watchlist WHERE active = 1').fetchone()[0]
+        self.alerts_pending = cursor.execute('SELECT COUNT(*) FROM alerts WHERE resolved = 0').fetchone()[0]
+        deleted_count = cursor.execute("SELECT value FROM plate_counters WHERE name = 'deleted'").fetchone()[0]
+        self.conn.commit()
+        
+        # mọi lần xóa đều tăng bộ đếm (trigger); xóa không để lại dòng deleted_plates để trừ
+        # (khôi phục xóa mất dòng đó, xóa hàng loạt, retention ở tiến trình khác): đếm lại sớm
+        if deleted_count - self.deleted_count != len(deleted):
+            self.stale.set()
+        self.deleted_count = deleted_count
+        for deleted_id, original_id, plate_number, timestamp in deleted:
+            self.last_deleted_id = max(self.last_deleted_id, deleted_id)
+            # bản ghi chưa từng được đếm thì không trừ
+            if original_id is not None and original_id <= self.last_id:
+                self._add(plate_number, timestamp, -1)
+        for row_id, plate_number, timestamp in added:
+            self._add(plate_number, timestamp, 1)
+            self.last_id = row_id
+    
+    def _add(self, plate_number, timestamp, delta):
+        self.total += delta
+        self.plate_counts[plate_number] += delta
+        if self.plate_counts[plate_number] <= 0:
+            del self.plate_counts[plate_number]
+        day = (timestamp or '')[:10]
+        self.day_counts[day] += delta
+        if self.day_counts[day] <= 0:
+            del self.day_counts[day]
+    
+    def on_rename(self, row_id, old_plate, new_plate):
+        """Gọi dưới self.lock ngay sau commit UPDATE plate_number"""
+        with self.lock:
+            if old_plate == new_plate or not self.loaded:
+                return
+            if self.replay is not None:
+                self.replay.append((row_id, old_plate, new_plate))
+            self._rename(row_id, old_plate, new_plate, self.last_id)
+    
+    def _rename(self, row_id, old_plate, new_plate, last_id):
+        # bản ghi chưa được đếm sẽ được đọc với biển số mới ở lần _refresh sau
+        if row_id is None or row_id > last_id:
+            return
+        self.plate_counts[old_plate] -= 1
+        if self.plate_counts[old_plate] <= 0:
+            del self.plate_counts[old_plate]
+        self.plate_counts[new_plate] += 1
+    
+    # ---------- đối chiếu ----------
+    def mark_stale(self):
+        """Có thay đổi không theo dõi được (xóa hàng loạt): đếm lại sớm"""
+        self.stale.set()
+    
+    def reconcile(self):
+        """Đọc lại bộ đếm từ các bảng rollup rồi thay bộ đếm hiện tại, sửa mọi sai lệch tích lũy"""
+        conn = get_connection_manager(self.db_path).open()
+        cursor = conn.cursor()
+        with self.lock:
+            # mốc snapshot: các on_rename sau thời điểm này được ghi lại để áp dụng lại
+            cursor.execute('BEGIN')
+            max_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM detected_plates').fetchone()[0]
+            max_deleted_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM deleted_plates').fetchone()[0]
+            deleted_count = cursor.execute("SELECT value FROM plate_counters WHERE name = 'deleted'").fetchone()[0]
+            self.replay = []
+        try:
+            # bảng rollup được trigger cập nhật cùng giao dịch ghi, nên khớp với max_id của
+            # cùng snapshot; chỉ cần số ngày gần đây (get() chỉ dùng hôm nay)
+            plate_counts = Counter(dict(cursor.execute('SELECT plate_number, count FROM rollup_plates').fetchall()))
+            day_counts = Counter(dict(cursor.execute('''
+                SELECT day, SUM(count) FROM rollup_daily_plates WHERE day >= ? GROUP BY day
+            ''', ((datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'),)).fetchall()))
+            conn.commit()
+        finally:
+            conn.close()
+            with self.lock:
+                replay, self.replay = self.replay, None
+        
+        with self.lock:
+            self.plate_counts = plate_counts
+            self.day_counts = day_counts
+            self.total = sum(plate_counts.values())
+            self.last_id = max_id
+            self.last_deleted_id = max_deleted_id
+            self.deleted_count = deleted_count
+            for row_id, old_plate, new_plate in replay:
+                self._rename(row_id, old_plate, new_plate, max_id)
+            self.data_version = None
+            self.last_refresh = 0.0
+    
+    def _reconcile_loop(self):
+        while True:
+            self.stale.wait(self.reconcile_interval)
+            self.stale.clear()
+            try:
+                self.reconcile()
+            except sqlite3.Error as e:
+                print(f"⚠️  Không đối chiếu được thống kê: {e}")
+
+# ==================== GHI BẤT ĐỒNG BỘ ====================
+class PendingPlate:
+    """Bản ghi detected_plates đang chờ ghi: id có sau khi writer ghi xong"""
+    
+    def __init__(self, plate_number, alert_triggered):
+        self.id = None
+        self.plate_number = plate_number
+        self.alert_triggered = alert_triggered
+    
+    def __str__(self):
+        return str(self.id) if self.id is not None else 'đang chờ ghi'
+
+def is_busy_error(error):
+    """DB đang bị kết nối khác khóa (SQLITE_BUSY/SQLITE_LOCKED): thử lại sau là được"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class WriterFailed(Exception):
+    """Lỗi DB không thử lại được trong luồng ghi"""
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+class AsyncDetectionWriter(threading.Thread):
+    """Ghi detection vào DB ở luồng nền, theo lô (executemany + 1 commit mỗi lô / flush_interval).
+    
+    save_plate/update_plate_number/set_image_path có cùng cách gọi với AdvancedLicensePlateDB nhưng chỉ
+    đưa việc ghi vào hàng đợi; quyết định watchlist/cảnh báo vẫn trả về ngay lập tức.
+    close() ghi hết mọi thứ còn trong hàng đợi trước khi trả về
+    """
+    
+    STOP = object()
+    
+    def __init__(self, db, max_batch=500, flush_interval=0.1, on_flush=None):
+        super().__init__(name='db-writer', daemon=True)
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush  # on_flush(số thao tác, thời gian ghi lô tính bằng giây)
+        self.queue = queue.Queue()
+        self.written = 0
+        self.error = None  # lỗi không thử lại được đã dừng luồng ghi
+        self.start()
+    
+    # ---------- phía frame loop: chỉ đưa vào hàng đợi ----------
+    def save_plate(self, plate_number, frame_number, confidence=0.0,
+                   image_path=None, source='webcam'):
+        """Trả về (PendingPlate, is_watchlist) ngay, bản ghi được ghi ở lô kế tiếp"""
+        self._check_running()
+        timestamp, ts_ms = now_stamp()
+        is_watchlist, watchlist_info = self.db.check_watchlist(plate_number)
+        pending = PendingPlate(plate_number, is_watchlist)
+        self.queue.put(('insert', pending, (plate_number, timestamp, ts_ms, frame_number, confidence,
+                                            image_path, source, int(is_watchlist)), watchlist_info))
+        return pending, is_watchlist
+    
+    def update_plate_number(self, pending, plate_number, confidence=None):
+        """Đổi biển số của bản ghi đang chờ/đã ghi, trả về True nếu vừa kích hoạt cảnh báo"""
+        self._check_running()
+        is_watchlist, watchlist_info = self.db.check_watchlist(plate_number)
+        triggered_alert = is_watchlist and not pending.alert_triggered
+        if triggered_alert:
+            pending.alert_triggered = True
+        old_plate, pending.plate_number = pending.plate_number, plate_number
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.queue.put(('update', pending, (plate_number, int(is_watchlist), confidence, timestamp, old_plate),
+                        watchlist_info if triggered_alert else None))
+        return triggered_alert
+    
+    def set_image_path(self, pending, image_path):
+        """Gắn ảnh crop (đã ghi xong) cho bản ghi, ghi ở lô kế tiếp sau bản ghi đó"""
+        self.queue.put(('image', pending, (image_path,), None))
+    
+    def pending(self):
+        return self.queue.qsize()
+    
+    def _check_running(self):
+        # như khi ghi trực tiếp: lỗi DB không thử lại được báo ngay cho nơi gọi
+        if self.error is not None:
+            raise self.error
+    
+    def close(self):
+        self.queue.put(self.STOP)
+        self.join()
+    
+    # ---------- luồng ghi ----------
+    def run(self):
+        conn = self.db.connections.open()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self.STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is self.STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._write_with_retry(conn, batch)
+            except WriterFailed as e:
+                self.error = e.error
+                print(f"❌ Dừng ghi DB bất đồng bộ: {e.error} ({len(batch) + self.queue.qsize()} thao tác chưa ghi)")
+                break
         conn.close()
+    
+    def _write_with_retry(self, conn, batch):
+        # DB bị khóa (VD: API đang đọc/ghi) thì thử lại, không bỏ detection nào.
+        # lỗi dữ liệu (1 bản ghi hỏng): ghi lại từng thao tác để chỉ mất đúng thao tác đó.
+        # lỗi khác (đầy đĩa, DB chỉ đọc, sai schema): thử lại cũng vô ích, dừng luồng ghi
+        if len(batch) == 1 and batch[0][0] != 'insert' and batch[0][1].id is None:
+            # bản ghi gốc đã bị bỏ ở lượt ghi từng thao tác
+            print(f"❌ Bỏ 1 thao tác DB ({batch[0][0]}): bản ghi {batch[0][1].plate_number!r} không được ghi")
+            return
+        delay = 0.05
+        while True:
+            try:
+                start = time.perf_counter()
+                self._write_batch(conn, batch)
+                self.written += len(batch)
+                if self.on_flush is not None:
+                    self.on_flush(len(batch), time.perf_counter() - start)
+                return
+            except sqlite3.OperationalError as e:
+                self._rollback(conn, batch)
+                if not is_busy_error(e):
+                    raise WriterFailed(e) from e
+                print(f"⚠️  Ghi DB thất bại ({e}), thử lại {len(batch)} bản ghi...")
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+            except sqlite3.Error as e:
+                self._rollback(conn, batch)
+                if len(batch) == 1:
+                    kind, pending, _, _ = batch[0]
+                    print(f"❌ Bỏ 1 thao tác DB ({kind}, biển {pending.plate_number!r}): {e}")
+                    return
+                print(f"⚠️  Lô {len(batch)} thao tác lỗi ({e}), ghi lại từng thao tác...")
+                for item in batch:
+                    self._write_with_retry(conn, [item])
+                return
+    
+    def _rollback(self, conn, batch):
+        # id gán trong giao dịch bị hủy không còn đúng nữa
+        conn.rollback()
+        for kind, pending, _, _ in batch:
+            if kind == 'insert':
+                pending.id = None
+    
+    def _write_batch(self, conn, batch):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        inserts = [(pending, row, info) for kind, pending, row, info in batch if kind == 'insert']
+        alerts = []
+        seen = []
+        if inserts:
+            cursor.executemany('''
+                INSERT INTO detected_plates 
+                (plate_number, timestamp, ts_ms, frame_number, confidence, image_path, source,
+                 is_watchlist, alert_triggered)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [row + (row[-1],) for _, row, _ in inserts])
+            # Trong 1 giao dịch IMMEDIATE không ai khác ghi được nên id của lô là liên tiếp
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            for k, (pending, row, info) in enumerate(inserts):
+                pending.id = last_id - len(inserts) + 1 + k
+                if info is not None:
+                    alerts.append((row[0], row[1], info['alert_type'],
+                                   f"Phát hiện biển số trong danh sách theo dõi: {info['reason']}"))
+                    seen.append((row[1], info['plate_number']))
+        
+        updates = [(pending, row, info) for kind, pending, row, info in batch if kind == 'update']
+        index_plates(conn, [row[0] for _, row, _ in inserts + updates])
+        if updates:
+            cursor.executemany('''
+                UPDATE detected_plates SET plate_number = ?, is_watchlist = ?,
+                    confidence = COALESCE(?, confidence), alert_triggered = MAX(alert_triggered, ?)
+                WHERE id = ?
+            ''', [(plate_number, is_watchlist, confidence, int(info is not None), pending.id)
+                  for pending, (plate_number, is_watchlist, confidence, _, _), info in updates])
+            for pending, (plate_number, _, _, timestamp, _), info in updates:
+                if info is not None:
+                    alerts.append((plate_number, timestamp, info['alert_type'],
+                                   f"Phát hiện biển số trong danh sách theo dõi: {info['reason']}"))
+                    seen.append((timestamp, info['plate_number']))
+        
+        images = [(row[0], pending.id) for kind, pending, row, _ in batch if kind == 'image']
+        if images:
+            cursor.executemany('UPDATE detected_plates SET image_path = ? WHERE id = ?', images)
+        
+        if alerts:
+            cursor.executemany('''
+                INSERT INTO alerts (plate_number, timestamp, alert_type, message)
+                VALUES (?, ?, ?, ?)
+            ''', alerts)
+            cursor.executemany('''
+                UPDATE watchlist 
+                SET last_seen = ?, detection_count = detection_count + 1
+                WHERE plate_number = ?
+            ''', seen)
         
-        return [dict(row) for row in plates]
\ No newline at end of file
+        stats = self.db.stats
+        with stats.lock:
+            conn.commit()
+            for pending, (plate_number, _, _, _, old_plate), _ in updates:
+                stats.on_rename(pending.id, old_plate, plate_number)
+
+# ==================== DÒNG LỆNH ====================
+if __name__ == '__main__':
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description='Quản lý schema database biển số')
+    parser.add_argument('command', choices=['migrate', 'check-plans', 'rebuild-rollups'])
+    parser.add_argument('--db', default='license_plates.db')
+    args = parser.parse_args()
+    
+    # AdvancedLicensePlateDB tự chạy migrate khi khởi tạo
+    db = AdvancedLicensePlateDB(args.db)
+    if args.command == 'rebuild-rollups':
+        conn = db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        rebuild_rollups(conn)
+        conn.commit()
+        print("✅ Đã tính lại các bảng rollup")
+    elif args.command == 'check-plans':
+        problems = check_query_plans(db.connect())
+        for name, reason, plan in problems:
+            print(f"❌ {name}: {reason}")
+            for detail in plan:
+                print(f"     {detail}")
+        if problems:
+            sys.exit(1)
+        print(f"✅ {len(HOT_QUERIES)} truy vấn nóng đều dùng index")
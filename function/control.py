@@ -0,0 +1,63 @@
+import queue
+import socketserver
+import sys
+import threading
+
+# non-blocking command channel for headless runs.
+# commands are single lines "<cmd> [arg]" (e.g. "p", "d", "a 29A-12345 xe lạ") read
+# from stdin and/or a local TCP socket; the main loop picks them up with poll()
+class ControlChannel:
+    def __init__(self, use_stdin=True, port=None, host='127.0.0.1'):
+        self.use_stdin = use_stdin
+        self.port = port
+        self.host = host
+        self.commands = queue.Queue()
+        self.server = None
+
+    def start(self):
+        if self.use_stdin:
+            threading.Thread(target=self._read_stdin, name='control-stdin', daemon=True).start()
+        if self.port:
+            channel = self
+
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    for raw in self.rfile:
+                        line = raw.decode('utf-8', errors='replace').strip()
+                        if line:
+                            channel.push(line)
+                            self.wfile.write(b"OK\n")
+
+            socketserver.ThreadingTCPServer.allow_reuse_address = True
+            self.server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name='control-socket', daemon=True).start()
+        return self
+
+    def _read_stdin(self):
+        try:
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    self.push(line)
+        except (OSError, ValueError):
+            # no usable stdin (service / detached process)
+            pass
+
+    def push(self, line):
+        parts = line.split(None, 1)
+        self.commands.put((parts[0].lower(), parts[1].strip() if len(parts) > 1 else ''))
+
+    # returns every pending (cmd, arg) without blocking
+    def poll(self):
+        pending = []
+        while True:
+            try:
+                pending.append(self.commands.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
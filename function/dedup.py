@@ -0,0 +1,94 @@
+import time
+from collections import Counter
+
+from function.plate_text import edit_distance, normalize_plate
+
+# one vehicle passage as stored in the DB: one row, one crop image.
+# the tracker already merges the reads of one continuous track; an event also
+# absorbs the tracks the tracker split off (track lost and re-acquired, box
+# jumps) whose reads are OCR variants of the same plate (29Y-03658 / 29Y3-03658)
+class PlateEvent:
+    def __init__(self, source, track, votes, box, now, is_watchlist=False):
+        self.source = source
+        # track id -> copy of that track's votes, taken on the thread that reads the plates:
+        # Track.votes keeps changing there while the persist thread votes over the event
+        self.votes = {track.id: dict(votes)}
+        self.box = box
+        self.last_seen = now
+        # a watchlist event and a normal one are never merged (the hit must get its own row and alert)
+        self.is_watchlist = is_watchlist
+        # owned by the persistence step: DB row of this event and the plate stored in it
+        self.plate_id = None
+        self.saved_plate = None
+
+    def add(self, track, votes, box, now):
+        self.update(track, votes)
+        self.touch(box, now)
+
+    def update(self, track, votes):
+        self.votes[track.id] = dict(votes)
+
+    def touch(self, box, now):
+        self.box = box
+        self.last_seen = now
+
+    # majority vote over every read of every merged track (ties: first plate read wins)
+    def best_plate(self):
+        votes = Counter()
+        for track_votes in self.votes.values():
+            votes.update(track_votes)
+        if not votes:
+            return None
+        return votes.most_common(1)[0][0]
+
+    def plates(self):
+        return {plate for track_votes in self.votes.values() for plate in track_votes}
+
+# ingest-side dedup: a new track joins an open event of the same source when its
+# plate is within max_distance edits (normalized) of any plate read in the event
+# and its box is within max_shift plate widths of the event's last box, and both have the
+# same watchlist status.
+# an event closes window seconds (wall clock) after any of its tracks was last seen
+class IngestDedup:
+    def __init__(self, window=5.0, max_distance=2, max_shift=3.0):
+        self.window = window
+        self.max_distance = max_distance
+        self.max_shift = max_shift
+        self.events = {}  # source -> [PlateEvent]
+        self.merged = 0
+
+    def match(self, source, plate, box, now=None, is_watchlist=False):
+        if self.window <= 0:
+            return None
+        now = time.monotonic() if now is None else now
+        events = [e for e in self.events.get(source, []) if now - e.last_seen <= self.window]
+        self.events[source] = events
+        normalized = normalize_plate(plate)
+        best = None
+        best_distance = self.max_distance + 1
+        for event in events:
+            if event.is_watchlist != is_watchlist or not self.near(event.box, box):
+                continue
+            for candidate in event.plates():
+                distance = edit_distance(normalized, normalize_plate(candidate), self.max_distance)
+                if distance < best_distance:
+                    best, best_distance = event, distance
+        return best
+
+    def open(self, source, track, votes, box, now=None, is_watchlist=False):
+        now = time.monotonic() if now is None else now
+        event = PlateEvent(source, track, votes, box, now, is_watchlist)
+        self.events.setdefault(source, []).append(event)
+        return event
+
+    def merge(self, event, track, votes, box, now=None):
+        event.add(track, votes, box, time.monotonic() if now is None else now)
+        self.merged += 1
+
+    # boxes: (x, y, w, h); None (position unknown) always matches
+    def near(self, a, b):
+        if a is None or b is None:
+            return True
+        dx = (a[0] + a[2] / 2) - (b[0] + b[2] / 2)
+        dy = (a[1] + a[3] / 2) - (b[1] + b[3] / 2)
+        return (dx * dx + dy * dy) ** 0.5 <= self.max_shift * max(a[2], b[2], 1)
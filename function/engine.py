@@ -0,0 +1,222 @@
+import argparse
+import ast
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import function.helper as helper
+
+ENGINES = ('torch', 'onnxruntime', 'openvino')
+CACHE_DIR = os.path.join('model', 'cache')
+
+# ===================== CACHE =====================
+# loaded/exported artifacts are cached under model/cache, keyed by the content hash
+# of the .pt file: replacing the weights invalidates the cache, restarts reuse it
+def weights_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+def cache_path(weights, suffix, cache_dir=CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(cache_dir, f"{stem}-{weights_hash(weights)}{suffix}")
+
+def _store(src, dst, move=False):
+    # write next to the target then rename, so a crash never leaves a half-written cache entry
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + '.tmp'
+    if move:
+        shutil.move(src, tmp)
+    else:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+# ===================== TORCH =====================
+# the yolov5 AutoShape model is the reference interface:
+#   model(images, size=640) -> result with .xyxy (one (n, 6) box array per image), model.names, model.conf
+def load_torch(weights, cache_dir=CACHE_DIR):
+    import torch
+    # the pickled AutoShape model references the yolov5 modules (models.common, utils...)
+    repo = os.path.abspath('yolov5')
+    if repo not in sys.path:
+        sys.path.insert(0, repo)
+
+    cached = cache_path(weights, '.torch', cache_dir)
+    if os.path.exists(cached):
+        try:
+            return torch.load(cached, map_location='cpu', weights_only=False)
+        except Exception as e:
+            print(f"⚠️  Cache model hỏng, tải lại từ {weights}: {e}")
+
+    # cold path: hub entry point (requirement checks, fuse, AutoShape wrap), then cache the result
+    model = torch.hub.load('yolov5', 'custom', path=weights, source='local')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.save(model, cached + '.tmp')
+        os.replace(cached + '.tmp', cached)
+    except Exception as e:
+        print(f"⚠️  Không ghi được cache model {cached}: {e}")
+    return model
+
+# ===================== ONNX RUNTIME =====================
+class OnnxDetections:
+    def __init__(self, xyxy, names):
+        self.xyxy = xyxy
+        self.names = names
+
+def letterbox(im, new_shape, color=(114, 114, 114)):
+    # same padding/rounding as yolov5 utils.augmentations.letterbox(auto=False)
+    shape = im.shape[:2]
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw = (new_shape[1] - new_unpad[0]) / 2
+    dh = (new_shape[0] - new_unpad[1]) / 2
+    if shape[::-1] != new_unpad:
+        im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+def non_max_suppression(pred, conf_thres, iou_thres, max_det=1000, max_wh=7680):
+    # numpy port of yolov5 utils.general.non_max_suppression (single label, class-aware)
+    output = []
+    for x in pred:
+        x = x[x[:, 4] > conf_thres]
+        if not len(x):
+            output.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+        scores = x[:, 5:] * x[:, 4:5]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(x)), cls]
+        box = np.empty((len(x), 4), dtype=np.float32)
+        box[:, 0] = x[:, 0] - x[:, 2] / 2
+        box[:, 1] = x[:, 1] - x[:, 3] / 2
+        box[:, 2] = x[:, 0] + x[:, 2] / 2
+        box[:, 3] = x[:, 1] + x[:, 3] / 2
+        mask = conf > conf_thres
+        box, conf, cls = box[mask], conf[mask], cls[mask]
+        keep = helper.nms(box + cls[:, None] * max_wh, conf, iou_thres)[:max_det]
+        output.append(np.concatenate([box[keep], conf[keep, None], cls[keep, None]], axis=1).astype(np.float32))
+    return output
+
+def scale_boxes(img1_shape, boxes, img0_shape):
+    gain = min(img1_shape[0] / img0_shape[0], img1_shape[1] / img0_shape[1])
+    pad_x = (img1_shape[1] - img0_shape[1] * gain) / 2
+    pad_y = (img1_shape[0] - img0_shape[0] * gain) / 2
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / gain).clip(0, img0_shape[1])
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / gain).clip(0, img0_shape[0])
+    return boxes
+
+# ONNX Runtime backend exposing the same call interface as the yolov5 AutoShape model.
+# pre/post-processing mirrors AutoShape (batch shape, letterbox, NMS, box rescale),
+# so both backends see identical network inputs
+class OnnxEngine:
+    def __init__(self, path, providers=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = ort.get_available_providers()
+        providers = [p for p in (providers or ['CPUExecutionProvider']) if p in available] or ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.providers = self.session.get_providers()
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.stride = int(meta.get('stride', 32))
+        self.names = ast.literal_eval(meta['names']) if 'names' in meta else {}
+        self.conf = 0.25
+        self.iou = 0.45
+        self.max_det = 1000
+        # static exports only accept their export batch size and image size
+        shape = self.session.get_inputs()[0].shape
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+        self.fixed_shape = tuple(shape[2:]) if all(isinstance(d, int) for d in shape[2:]) else None
+
+    def __call__(self, ims, size=640):
+        if not isinstance(ims, (list, tuple)):
+            ims = [ims]
+        if not ims:
+            return OnnxDetections([], self.names)
+
+        shape0, shape1 = [], []
+        for im in ims:
+            s = im.shape[:2]
+            shape0.append(s)
+            g = size / max(s)
+            shape1.append([int(y * g) for y in s])
+        if self.fixed_shape is not None:
+            shape1 = list(self.fixed_shape)
+        else:
+            shape1 = [math.ceil(x / self.stride) * self.stride for x in np.array(shape1).max(0)]
+
+        x = np.stack([letterbox(im[..., :3] if im.ndim == 3 else cv2.cvtColor(im, cv2.COLOR_GRAY2BGR), shape1)
+                      for im in ims])
+        x = np.ascontiguousarray(x.transpose((0, 3, 1, 2)), dtype=np.float32) / 255
+        if self.fixed_batch:
+            pred = np.concatenate([self.session.run(None, {self.input_name: x[i:i+self.fixed_batch]})[0]
+                                   for i in range(0, len(x), self.fixed_batch)])
+        else:
+            pred = self.session.run(None, {self.input_name: x})[0]
+
+        dets = non_max_suppression(pred, self.conf, self.iou, self.max_det)
+        for det, s in zip(dets, shape0):
+            scale_boxes(shape1, det, s)
+        return OnnxDetections(dets, self.names)
+
+# ===================== LOADER / EXPORT =====================
+def onnx_path(weights, cache_dir=CACHE_DIR):
+    return cache_path(weights, '.onnx', cache_dir)
+
+def load_engine(weights, engine='torch', cache_dir=CACHE_DIR):
+    """weights: file .pt; the ONNX backends use the cached .onnx export of it (see `export`)"""
+    if engine == 'torch':
+        return load_torch(weights, cache_dir)
+    path = onnx_path(weights, cache_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Không có {path}, hãy chạy: python -m function.engine export --weights {weights}")
+    providers = ['CPUExecutionProvider']
+    if engine == 'openvino':
+        providers = ['OpenVINOExecutionProvider', 'CPUExecutionProvider']
+    return OnnxEngine(path, providers)
+
+def export_onnx(weights, imgsz=640, dynamic=True, cache_dir=CACHE_DIR):
+    """Xuất file .onnx (kèm metadata stride/names) bằng yolov5/export.py vào cache"""
+    cmd = [sys.executable, os.path.join('yolov5', 'export.py'), '--weights', weights,
+           '--include', 'onnx', '--imgsz', str(imgsz)]
+    if dynamic:
+        cmd.append('--dynamic')
+    subprocess.run(cmd, check=True)
+    path = onnx_path(weights, cache_dir)
+    _store(os.path.splitext(weights)[0] + '.onnx', path, move=True)
+    return path
+
+# ===================== WARM-UP =====================
+def warmup(model, shapes, size=640, batch=1):
+    """Chạy thử model trên ảnh đen đúng kích thước thật (h, w) để lần gọi đầu tiên
+    khi có frame thật không phải chịu chi phí cấp phát/chọn kernel. Trả về thời gian (giây)"""
+    start = time.perf_counter()
+    for h, w in shapes:
+        model([np.zeros((h, w, 3), dtype=np.uint8)] * batch, size=size)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Xuất model sang ONNX cho --engine onnxruntime/openvino')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('export', help='Xuất .pt → .onnx')
+    p.add_argument('--weights', nargs='+', default=['model/LP_detector.pt', 'model/LP_ocr.pt'])
+    p.add_argument('--imgsz', type=int, default=640)
+    p.add_argument('--static', action='store_true', help='Kích thước đầu vào cố định thay vì dynamic')
+    args = parser.parse_args()
+
+    for w in args.weights:
+        print(f"📦 Đang xuất {w} ...")
+        print(f"✅ {export_onnx(w, args.imgsz, dynamic=not args.static)}")
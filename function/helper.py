@@ -1,9 +1,58 @@
 import math
+import time
+import numpy as np
+import function.utils_rotate as utils_rotate
+
+# deskew variants tried for each crop, in priority order (change_cons, center_thres)
+DESKEW_VARIANTS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+# class id -> character lookup tables, built once per OCR model
+_char_luts = {}
+
+def char_lookup(model):
+    lut = _char_luts.get(id(model))
+    if lut is None:
+        names = model.names
+        if isinstance(names, dict):
+            lut = np.array([str(names.get(i, '')) for i in range(max(names) + 1)], dtype=object)
+        else:
+            lut = np.array([str(n) for n in names], dtype=object)
+        _char_luts[id(model)] = lut
+    return lut
+
+# raw detections of a yolov5 result as one (n, 6) float array per image:
+# x1, y1, x2, y2, conf, class id (no pandas DataFrame on the hot path)
+def result_arrays(results):
+    arrays = []
+    for det in results.xyxy:
+        if hasattr(det, 'cpu'):
+            det = det.cpu().numpy()
+        arrays.append(np.asarray(det, dtype=np.float32).reshape(-1, 6))
+    return arrays
+
+# greedy non-maximum suppression, returns kept indices by decreasing score
+def nms(boxes, scores, iou_threshold):
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        ix1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        iy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        ix2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        iy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        overlap = inter / (areas[i] + areas[rest] - inter + 1e-6)
+        order = rest[overlap <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
 
 # license plate type classification helper function
 def linear_equation(x1, y1, x2, y2):
-    b = y1 - (y2 - y1) * x1 / (x2 - x1)
-    a = (y1 - b) / x1
+    # slope from the two points directly, so x1 == 0 no longer divides by zero
+    a = (y2 - y1) / (x2 - x1)
+    b = y1 - a * x1
     return a, b
 
 def check_point_linear(x, y, x1, y1, x2, y2):
@@ -11,11 +60,10 @@ def check_point_linear(x, y, x1, y1, x2, y2):
     y_pred = a*x+b
     return(math.isclose(y_pred, y, abs_tol = 3))
 
-# detect character and number in license plate
-def read_plate(yolo_license_plate, im):
+# build plate string from the OCR boxes of one crop: [[x1, y1, x2, y2, conf, char], ...]
+# (per-character reference implementation, decode_plates_vectorized is the NumPy equivalent)
+def decode_plate(bb_list):
     LP_type = "1"
-    results = yolo_license_plate(im)
-    bb_list = results.pandas().xyxy[0].values.tolist()
     if len(bb_list) == 0 or len(bb_list) < 7 or len(bb_list) > 10:
         return "unknown"
     center_list = []
@@ -41,7 +89,6 @@ def read_plate(yolo_license_plate, im):
                 LP_type = "2"
 
     y_mean = int(int(y_sum) / len(bb_list))
-    size = results.pandas().s
 
     # 1 line plates and 2 line plates
     line_1 = []
@@ -61,4 +108,125 @@ def read_plate(yolo_license_plate, im):
     else:
         for l in sorted(center_list, key = lambda x: x[0]):
             license_plate += str(l[2])
-    return license_plate
\ No newline at end of file
+    return license_plate
+
+# below this many crops the per-plate loop is faster: the NumPy setup costs ~80 µs per call
+# against ~20 µs per plate for decode_plate (benchmark.py decode reports both per batch size)
+VECTORIZE_MIN_BATCH = 16
+
+# decode_plate for a batch of crops.
+# boxes_list: one (n, 6) array per crop (x1, y1, x2, y2, conf, class id), lut: char_lookup table
+def decode_plates(boxes_list, lut, min_chars=7, max_chars=10):
+    if len(boxes_list) < VECTORIZE_MIN_BATCH:
+        return [decode_plate(boxes_to_bb_list(boxes, lut)) if min_chars <= len(boxes) <= max_chars
+                else "unknown" for boxes in boxes_list]
+    return decode_plates_vectorized(boxes_list, lut, min_chars, max_chars)
+
+# vectorized decode_plates: centers, the left/right reference line, the 1-line/2-line flag
+# and the x ordering are computed for all plates at once on a NaN-padded (plates, 10) grid
+def decode_plates_vectorized(boxes_list, lut, min_chars=7, max_chars=10):
+    plates = ["unknown"] * len(boxes_list)
+    keep = [i for i, boxes in enumerate(boxes_list) if min_chars <= len(boxes) <= max_chars]
+    if not keep:
+        return plates
+
+    counts = np.array([len(boxes_list[i]) for i in keep])
+    boxes = np.concatenate([boxes_list[i] for i in keep]).astype(np.float64)
+    n_plates = len(keep)
+    row = np.repeat(np.arange(n_plates), counts)
+    col = np.arange(len(boxes)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    xc = np.full((n_plates, max_chars), np.nan)
+    yc = np.full((n_plates, max_chars), np.nan)
+    cls = np.zeros((n_plates, max_chars), dtype=np.intp)
+    xc[row, col] = (boxes[:, 0] + boxes[:, 2]) / 2
+    yc[row, col] = (boxes[:, 1] + boxes[:, 3]) / 2
+    cls[row, col] = boxes[:, 5].astype(np.intp)
+    valid = ~np.isnan(xc)
+
+    # line through the left-most and right-most character (first occurrence on ties)
+    plate_idx = np.arange(n_plates)
+    l_idx = np.where(valid, xc, np.inf).argmin(axis=1)
+    r_idx = np.where(valid, xc, -np.inf).argmax(axis=1)
+    lx, ly = xc[plate_idx, l_idx], yc[plate_idx, l_idx]
+    rx, ry = xc[plate_idx, r_idx], yc[plate_idx, r_idx]
+    sloped = lx != rx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = np.where(sloped, (ry - ly) / np.where(sloped, rx - lx, 1.0), 0.0)
+    b = ly - a * lx
+
+    # 2-line plate when any center is off the line (same tolerance as math.isclose(abs_tol=3))
+    y_pred = a[:, None] * xc + b[:, None]
+    tol = np.maximum(1e-9 * np.maximum(np.abs(y_pred), np.abs(yc)), 3)
+    off_line = valid & (np.abs(y_pred - yc) > tol)
+    two_line = sloped & off_line.any(axis=1)
+
+    y_mean = np.trunc(np.trunc(np.nansum(yc, axis=1)) / counts)
+    line = (two_line[:, None] & (np.trunc(yc) > y_mean[:, None])).astype(np.int8)
+
+    # order by (padding last, line, x); lexsort is stable like sorted()
+    order = np.lexsort((np.where(valid, xc, np.inf), line, ~valid), axis=1)
+    chars = lut[cls[plate_idx[:, None], order]].tolist()
+    n_line_1 = ((line == 0) & valid).sum(axis=1).tolist()
+    counts = counts.tolist()
+    two_line = two_line.tolist()
+
+    for k, i in enumerate(keep):
+        row_chars = chars[k][:counts[k]]
+        if two_line[k]:
+            split = n_line_1[k]
+            plates[i] = "".join(row_chars[:split]) + "-" + "".join(row_chars[split:])
+        else:
+            plates[i] = "".join(row_chars)
+    return plates
+
+# detect character and number in license plate
+def read_plate(yolo_license_plate, im):
+    return read_plates(yolo_license_plate, [im])[0]
+
+# (n, 6) detection array -> decode_plate input, class ids mapped through the lookup table
+def boxes_to_bb_list(boxes, lut):
+    chars = lut[boxes[:, 5].astype(np.intp)]
+    return [[b[0], b[1], b[2], b[3], b[4], c] for b, c in zip(boxes.tolist(), chars)]
+
+# batch version of read_plate: one forward pass for a list of crops
+def read_plates(yolo_license_plate, ims):
+    if len(ims) == 0:
+        return []
+    results = yolo_license_plate(list(ims))
+    return decode_plates(result_arrays(results), char_lookup(yolo_license_plate))
+
+# read every crop of a frame, one OCR forward pass per deskew variant: all crops are read
+# with the first variant, then only the crops still "unknown" are deskewed with the next
+# variant and read again, so a crop that reads at once costs one deskew and one OCR.
+# on_stage(name, seconds) receives the 'deskew' and 'ocr' time of every pass
+def read_plates_cascade(yolo_license_plate, crops, variants=DESKEW_VARIANTS, on_stage=None):
+    lps = ["unknown"] * len(crops)
+    pending = list(range(len(crops)))
+    for cc, ct in variants:
+        if not pending:
+            break
+        t = time.perf_counter()
+        ims = [utils_rotate.deskew(crops[i], cc, ct) for i in pending]
+        t_ocr = time.perf_counter()
+        reads = read_plates(yolo_license_plate, ims)
+        if on_stage is not None:
+            on_stage('deskew', t_ocr - t)
+            on_stage('ocr', time.perf_counter() - t_ocr)
+        still_unknown = []
+        for i, lp in zip(pending, reads):
+            if lp == "unknown":
+                still_unknown.append(i)
+            else:
+                lps[i] = lp
+        pending = still_unknown
+    return lps
+
+# per-crop reference of read_plates_cascade (one forward pass per crop and variant, no
+# batch padding); benchmark.py compares the two to check batching leaves reads unchanged
+def read_plate_cascade(yolo_license_plate, crop_img, variants=DESKEW_VARIANTS):
+    for cc, ct in variants:
+        lp = read_plate(yolo_license_plate, utils_rotate.deskew(crop_img, cc, ct))
+        if lp != "unknown":
+            return lp
+    return "unknown"
@@ -0,0 +1,109 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import cv2
+
+from function.metrics import Metrics
+from function.pipeline import StageQueue, Stage
+
+# extension -> OpenCV quality flag
+FORMATS = {
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+}
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(name)).strip('_') or 'unknown'
+
+# crop image store: encoding and file writes run on a small pool of background
+# threads so the frame loop only pays for a queue put.
+# layout: <root>/<YYYYmmdd>/<source>/<plate>_<HHMMSS>_<ms>_<id>.<ext>; the random id and
+# exclusive-create open mean two crops of the same plate in the same second never
+# overwrite each other. on_saved(path) runs (on a store thread) only after the file
+# is fully written, so callers record image_path for files that really exist.
+# a full queue drops its oldest crop instead of blocking (counted in dropped()).
+# with segments (a SegmentStore) the encoded crop is appended to a segment file instead
+# and on_saved receives its 'segment:<id>' reference
+class ImageStore:
+    def __init__(self, root='detected_plates', fmt='jpg', quality=90, workers=2, queue_size=64, metrics=None,
+                 segments=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Định dạng ảnh không hỗ trợ: {fmt} (chọn: {', '.join(FORMATS)})")
+        self.root = root
+        self.fmt = fmt
+        self.params = [FORMATS[fmt], int(quality)]
+        self.segments = segments
+        self.metrics = metrics or Metrics(enabled=False)
+        self.queue = StageQueue('images', queue_size, drop_oldest=True)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.workers = [Stage(f'image-store-{i}', self._write_job, self.queue) for i in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+
+    # ---------- frame loop side ----------
+    def save(self, image, plate, source, on_saved=None):
+        """Queue a crop for writing; returns immediately. image must not be modified afterwards"""
+        return self.queue.put((image, plate, source, time.time(), on_saved))
+
+    def pending(self):
+        return self.queue.depth()
+
+    def dropped(self):
+        return self.queue.stats(reset_peak=False)['dropped']
+
+    def close(self):
+        """Write every queued crop, then stop the workers"""
+        self.queue.close()
+        for worker in self.workers:
+            worker.join()
+
+    # ---------- store threads ----------
+    def path_for(self, plate, source, when):
+        stamp = time.localtime(when)
+        folder = os.path.join(self.root, time.strftime('%Y%m%d', stamp), safe_name(source))
+        name = f"{safe_name(plate)}_{time.strftime('%H%M%S', stamp)}_{int(when * 1000) % 1000:03d}_{uuid.uuid4().hex[:8]}"
+        return os.path.join(folder, f'{name}.{self.fmt}')
+
+    def write(self, image, plate, source, when=None):
+        """Encode and write one crop synchronously, returns its path (or segment reference)"""
+        ok, data = cv2.imencode(f'.{self.fmt}', image, self.params)
+        if not ok:
+            raise ValueError(f"Không mã hóa được ảnh {plate} sang {self.fmt}")
+        if self.segments is not None:
+            return self.segments.append(data.tobytes(), self.fmt)
+        when = time.time() if when is None else when
+        path = self.path_for(plate, source, when)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        while True:
+            try:
+                with open(path, 'xb') as f:
+                    f.write(data.tobytes())
+                return path
+            except FileExistsError:
+                path = self.path_for(plate, source, when)
+
+    def _write_job(self, item):
+        image, plate, source, when, on_saved = item
+        try:
+            with self.metrics.time('imwrite'):
+                path = self.write(image, plate, source, when)
+        except (OSError, ValueError, cv2.error, sqlite3.Error) as e:
+            with self.lock:
+                self.failed += 1
+            print(f"⚠️  Không lưu được ảnh {plate}: {e}")
+            return None
+        with self.lock:
+            self.written += 1
+        if on_saved is not None:
+            try:
+                on_saved(path)
+            except Exception as e:
+                # the file is written; only recording it failed, keep the worker alive
+                print(f"⚠️  Không ghi được đường dẫn ảnh {path}: {e}")
+        return None
@@ -0,0 +1,197 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+# name -> (type, help). every metric the worker publishes, prefixed lpr_
+METRICS = {
+    'lpr_stage_seconds': ('histogram', 'Latency of one hot-path stage call'),
+    'lpr_frames_total': ('counter', 'Frames read from the source'),
+    'lpr_frames_gated_total': ('counter', 'Frames skipped by the motion gate'),
+    'lpr_frames_dropped_total': ('counter', 'Frames dropped by a full queue'),
+    'lpr_queue_depth': ('gauge', 'Items waiting in a pipeline queue'),
+    'lpr_ocr_attempts_total': ('counter', 'Plate crops sent through the deskew/OCR cascade'),
+    'lpr_ocr_unknown_total': ('counter', 'OCR attempts that returned "unknown"'),
+    'lpr_plates_total': ('counter', 'Plates stored in the database (one per vehicle event)'),
+    'lpr_plates_merged_total': ('counter', 'Tracks merged into an existing event by ingest dedup'),
+    'lpr_images_dropped_total': ('counter', 'Crop images dropped by a full image-store queue'),
+    'lpr_last_update_seconds': ('gauge', 'Unix time of the last metrics snapshot'),
+}
+
+# seconds; covers sub-millisecond DB writes up to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for c in self.counts[:-1]:
+            total += c
+            cumulative.append(total)
+        return {'buckets': list(self.buckets), 'cumulative': cumulative, 'sum': self.sum, 'count': self.count}
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+# in-process registry. every update is a dict lookup and an add under one lock,
+# so instrumenting a stage costs ~1 µs against stages measured in milliseconds.
+# with enabled=False every call returns immediately
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.values = {}      # (name, labels) -> float
+        self.histograms = {}  # stage -> Histogram
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram()
+            hist.observe(seconds)
+
+    # with metrics.time('detect'): ...
+    def time(self, stage):
+        return _Timer(self, stage) if self.enabled else _NULL_TIMER
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'time': time.time(),
+                'values': [[name, dict(labels), value] for (name, labels), value in self.values.items()],
+                'stages': {stage: hist.snapshot() for stage, hist in self.histograms.items()},
+            }
+
+# background thread that publishes snapshots as JSON for api_server.py (/api/metrics).
+# collect() is called before each snapshot to refresh gauges such as queue depth
+class MetricsWriter(threading.Thread):
+    def __init__(self, metrics, path, interval=5.0, collect=None):
+        super().__init__(name='metrics-writer', daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.collect = collect
+        self.stop_event = threading.Event()
+
+    def write(self):
+        if self.collect is not None:
+            self.collect()
+        self.metrics.set('lpr_last_update_seconds', time.time())
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"⚠️  Không ghi được metrics {self.path}: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.write()
+
+# ===================== PROMETHEUS =====================
+def load_snapshots(folder, max_age=300):
+    """{worker: snapshot} from every *.json in folder, skipping workers silent for max_age seconds"""
+    snapshots = {}
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshots):
+    """Prometheus text exposition format (0.0.4) for {worker: snapshot}"""
+    families = {name: [] for name in METRICS}
+    for worker, snap in snapshots.items():
+        for name, labels, value in snap.get('values', []):
+            families.setdefault(name, []).append((f'{name}{_labels(dict(labels, worker=worker))}', value))
+        for stage, hist in snap.get('stages', {}).items():
+            base = {'worker': worker, 'stage': stage}
+            rows = families['lpr_stage_seconds']
+            for le, cumulative in zip(hist['buckets'], hist['cumulative']):
+                rows.append((f'lpr_stage_seconds_bucket{_labels(dict(base, le=_number(float(le))))}', cumulative))
+            rows.append((f'lpr_stage_seconds_bucket{_labels(dict(base, le="+Inf"))}', hist['count']))
+            rows.append((f'lpr_stage_seconds_sum{_labels(base)}', hist['sum']))
+            rows.append((f'lpr_stage_seconds_count{_labels(base)}', hist['count']))
+
+    lines = []
+    for name, rows in families.items():
+        if not rows:
+            continue
+        kind, help_text = METRICS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{series} {_number(value)}' for series, value in rows)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,84 @@
+import cv2
+
+# cheap motion detector used to skip the plate detector on idle frames.
+# frames are downscaled to `width` pixels, blurred and compared with a running
+# average background; motion = share of changed pixels inside the ROI
+class MotionGate:
+    def __init__(self, threshold=0.005, pixel_delta=25, width=160, roi=None,
+                 learning_rate=0.05, refresh_frames=0):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.roi = roi  # (x1, y1, x2, y2) in full-frame pixels, None = whole frame
+        self.learning_rate = learning_rate
+        self.refresh_frames = refresh_frames  # force a detection every N gated frames, 0 = never
+        self.background = None
+        self.frames = 0
+        self.gated = 0
+        self.since_detect = 0
+        self.warned_roi = False
+
+    def _prepare(self, frame):
+        if self.roi is not None:
+            x1, y1, x2, y2 = self._clamp_roi(frame)
+            frame = frame[y1:y2, x1:x2]
+        h, w = frame.shape[:2]
+        scale = self.width / float(w)
+        small = cv2.resize(frame, (self.width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    # clamp the ROI to the frame (a negative slice index would count from the far edge);
+    # an ROI entirely outside the frame falls back to the whole frame
+    def _clamp_roi(self, frame):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self.roi
+        x1, x2 = min(max(x1, 0), w), min(max(x2, 0), w)
+        y1, y2 = min(max(y1, 0), h), min(max(y2, 0), h)
+        if x2 <= x1 or y2 <= y1:
+            if not self.warned_roi:
+                self.warned_roi = True
+                print(f"⚠️  ROI {self.roi} nằm ngoài khung hình {w}x{h}, dùng cả khung hình")
+            return 0, 0, w, h
+        return x1, y1, x2, y2
+
+    # returns True when the detector should run on this frame
+    def has_motion(self, frame):
+        self.frames += 1
+        gray = self._prepare(frame)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype('float32')
+            self.since_detect = 0
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, mask = cv2.threshold(diff, self.pixel_delta, 255, cv2.THRESH_BINARY)
+        changed = cv2.countNonZero(mask) / float(mask.size)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        if changed >= self.threshold:
+            self.since_detect = 0
+            return True
+        if self.refresh_frames and self.since_detect >= self.refresh_frames:
+            self.since_detect = 0
+            return True
+
+        self.since_detect += 1
+        self.gated += 1
+        return False
+
+    def gated_ratio(self):
+        return self.gated / self.frames if self.frames else 0.0
+
+def parse_roi(text):
+    # "x1,y1,x2,y2" -> (x1, y1, x2, y2)
+    if not text:
+        return None
+    values = [int(v) for v in text.split(',')]
+    if len(values) != 4:
+        raise ValueError(f"ROI phải có dạng x1,y1,x2,y2: {text}")
+    if values[2] <= values[0] or values[3] <= values[1]:
+        raise ValueError(f"ROI phải có x2 > x1 và y2 > y1: {text}")
+    return tuple(values)
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+
+# sentinel returned by StageQueue.get once the queue is closed and drained
+STOP = object()
+
+# bounded queue between two pipeline stages.
+# drop_oldest=True  -> "latest frame wins": a full queue discards its oldest item (live sources)
+# drop_oldest=False -> lossless: put() blocks until the consumer makes room (video files)
+class StageQueue:
+    def __init__(self, name, maxsize, drop_oldest=False):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.drop_oldest = drop_oldest
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.peak = 0
+
+    def put(self, item):
+        with self.cond:
+            if self.closed:
+                return False
+            if self.drop_oldest:
+                while len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+            else:
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return False
+            self.items.append(item)
+            self.put_count += 1
+            self.peak = max(self.peak, len(self.items))
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        # returns None on timeout, STOP once closed and empty
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while not self.items:
+                if self.closed:
+                    return STOP
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def depth(self):
+        with self.cond:
+            return len(self.items)
+
+    def stats(self, reset_peak=True):
+        with self.cond:
+            stats = {
+                'name': self.name,
+                'depth': len(self.items),
+                'maxsize': self.maxsize,
+                'peak': self.peak,
+                'put': self.put_count,
+                'dropped': self.dropped,
+            }
+            if reset_peak:
+                self.peak = len(self.items)
+            return stats
+
+# worker thread: takes items from in_queue, calls fn(item) and forwards
+# non-None results to every out_queue. out_queues are closed when the input
+# is exhausted so shutdown propagates down the pipeline.
+# an exception from one item is logged and the stage moves on to the next item;
+# after max_errors failures in a row (the cause is persistent: DB gone, disk full)
+# the stage stops, closes in_queue and calls on_error(stage) so the caller can
+# shut the whole pipeline down instead of silently dropping every later item
+class Stage(threading.Thread):
+    def __init__(self, name, fn, in_queue, out_queues=(), max_errors=10, on_error=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queues = list(out_queues)
+        self.max_errors = max_errors
+        self.on_error = on_error
+        self.processed = 0
+        self.failed = 0
+        self.error = None
+
+    def run(self):
+        consecutive = 0
+        try:
+            while True:
+                item = self.in_queue.get()
+                if item is STOP:
+                    break
+                try:
+                    result = self.fn(item)
+                except Exception as e:
+                    self.failed += 1
+                    consecutive += 1
+                    print(f"⚠️  Stage '{self.name}' lỗi ({consecutive}/{self.max_errors}): {e}")
+                    if consecutive >= self.max_errors:
+                        self.error = e
+                        print(f"❌ Stage '{self.name}' dừng sau {consecutive} lỗi liên tiếp")
+                        self.in_queue.close()
+                        if self.on_error is not None:
+                            self.on_error(self)
+                        break
+                    continue
+                consecutive = 0
+                self.processed += 1
+                if result is not None:
+                    for q in self.out_queues:
+                        q.put(result)
+        finally:
+            for q in self.out_queues:
+                q.close()
+
+# one line summary of queue depths, e.g. "capture 3/4 (peak 4, drop 12) | render 0/4"
+def format_queue_stats(queues):
+    parts = []
+    for q in queues:
+        s = q.stats()
+        text = f"{s['name']} {s['depth']}/{s['maxsize']} (peak {s['peak']}"
+        if s['dropped']:
+            text += f", drop {s['dropped']}"
+        parts.append(text + ")")
+    return " | ".join(parts)
@@ -0,0 +1,22 @@
+import re
+
+# pure plate-string helpers shared by the DB layer (watchlist, similar-plate index)
+# and the ingest side (function/dedup.py)
+
+def normalize_plate(plate_number):
+    """Bỏ dấu phân cách và khoảng trắng: '29A-123.45' -> '29A12345'"""
+    return re.sub(r'[^0-9A-Z]', '', plate_number.upper())
+
+def edit_distance(a, b, max_distance):
+    """Khoảng cách Levenshtein, dừng sớm và trả về max_distance + 1 khi đã vượt ngưỡng"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
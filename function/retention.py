@@ -0,0 +1,197 @@
+import argparse
+import csv
+import gzip
+import os
+import threading
+import time
+from collections import defaultdict
+
+from database_manager import AdvancedLicensePlateDB, enable_incremental_vacuum, since_ms
+from function.image_store import safe_name
+
+ARCHIVE_FORMATS = ('csv', 'parquet')
+
+# rough bytes of DB pages touched per deleted row (table row + its 5 index entries),
+# only used to charge deletes against the I/O budget
+ROW_IO_BYTES = 512
+
+def parquet_module():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+# retention: rows older than `days` are archived (optional), then deleted together with
+# their images in batches of batch_size, each batch its own short write transaction so
+# the detection writer never waits long for the lock. freed pages go back to the OS with
+# PRAGMA incremental_vacuum (needs auto_vacuum=INCREMENTAL, see enable_incremental_vacuum).
+# io_budget (MB/s, 0 = unlimited) paces archive writes, image deletes, row deletes and
+# vacuum so a run on a large backlog does not starve the cameras of disk bandwidth.
+# run_once() does one pass; start() repeats it every `interval` seconds on a daemon thread
+class RetentionEngine(threading.Thread):
+    def __init__(self, db, days=30, batch_size=500, archive_dir=None, archive_format='csv',
+                 io_budget=0.0, interval=3600.0, vacuum_pages=1000, segments=None):
+        super().__init__(name='retention', daemon=True)
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Định dạng lưu trữ không hỗ trợ: {archive_format} (chọn: {', '.join(ARCHIVE_FORMATS)})")
+        if archive_dir and archive_format == 'parquet' and parquet_module() is None:
+            raise ValueError("Lưu trữ parquet cần pyarrow (pip install pyarrow), hoặc dùng --archive-format csv")
+        self.db = db
+        self.days = days
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.io_budget = io_budget * 1e6
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.segments = segments  # SegmentStore: compacted after each pass
+        self.stop_event = threading.Event()
+        self.warned_vacuum = False
+
+    # ---------- one pass ----------
+    def run_once(self):
+        result = {'deleted': 0, 'archived': 0, 'archive_bytes': 0, 'image_bytes': 0, 'vacuum_pages': 0}
+        cutoff = since_ms(days=self.days)
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            rows = self.db.expired_plates(cutoff, self.batch_size)
+            if not rows:
+                break
+            written = 0
+            if self.archive_dir:
+                written = self.archive(rows)
+                result['archived'] += len(rows)
+                result['archive_bytes'] += written
+            deleted, freed = self.db.purge_plates(rows)
+            result['deleted'] += deleted
+            result['image_bytes'] += freed
+            self.throttle(written + freed + deleted * ROW_IO_BYTES, started)
+        if self.segments is not None:
+            self.segments.compact()
+        result['vacuum_pages'] = self.vacuum()
+        return result
+
+    def throttle(self, io_bytes, started):
+        # wait until this step fits the budget; stop() interrupts the wait
+        if self.io_budget > 0:
+            self.stop_event.wait(io_bytes / self.io_budget - (time.monotonic() - started))
+
+    def vacuum(self):
+        """Return free pages to the OS, vacuum_pages at a time. Returns pages released"""
+        conn = self.db.connect()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            if not self.warned_vacuum:
+                self.warned_vacuum = True
+                print("ℹ️  DB chưa bật auto_vacuum=INCREMENTAL, dung lượng trống không được trả lại "
+                      "(python -m function.retention enable-vacuum)")
+            return 0
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        released = 0
+        while not self.stop_event.is_set():
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                break
+            started = time.monotonic()
+            step = min(free, self.vacuum_pages)
+            # execute() steps the pragma once (1 page); executescript runs it to completion
+            conn.executescript(f'PRAGMA incremental_vacuum({step});')
+            freed = free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if freed <= 0:
+                break
+            released += freed
+            # each moved page is read and written once
+            self.throttle(2 * step * page_size, started)
+        # in WAL mode the file only shrinks once the truncation is checkpointed
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+        return released
+
+    # ---------- archive ----------
+    def archive(self, rows):
+        """Write rows under <archive_dir>/day=YYYY-MM-DD/source=<source>/, returns bytes written.
+        file names come from the id range, so re-archiving a batch after a crash overwrites it"""
+        partitions = defaultdict(list)
+        for row in rows:
+            partitions[(row['timestamp'][:10], safe_name(row['source'] or 'unknown'))].append(row)
+        written = 0
+        for (day, source), part in partitions.items():
+            folder = os.path.join(self.archive_dir, f'day={day}', f'source={source}')
+            os.makedirs(folder, exist_ok=True)
+            ids = [row['id'] for row in part]
+            path = os.path.join(folder, f'plates-{min(ids)}-{max(ids)}.{self.suffix()}')
+            tmp = path + '.tmp'
+            if self.archive_format == 'parquet':
+                self.write_parquet(tmp, part)
+            else:
+                self.write_csv(tmp, part)
+            os.replace(tmp, path)
+            written += os.path.getsize(path)
+        return written
+
+    def suffix(self):
+        return 'parquet' if self.archive_format == 'parquet' else 'csv.gz'
+
+    def write_csv(self, path, rows):
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(rows[0].keys())
+            writer.writerows(tuple(row) for row in rows)
+
+    def write_parquet(self, path, rows):
+        pyarrow = parquet_module()
+        columns = rows[0].keys()
+        table = pyarrow.table({name: [row[name] for row in rows] for name in columns})
+        pyarrow.parquet.write_table(table, path, compression='zstd')
+
+    # ---------- background ----------
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                result = self.run_once()
+                if result['deleted'] or result['vacuum_pages']:
+                    print(f"🧹 Retention: xóa {result['deleted']} bản ghi (lưu trữ {result['archived']}), "
+                          f"ảnh {result['image_bytes'] / 1e6:.1f} MB, trả {result['vacuum_pages']} trang DB")
+            except Exception as e:
+                print(f"⚠️  Retention lỗi: {e}")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Xóa/lưu trữ bản ghi biển số cũ')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('run', help='Chạy 1 lượt: lưu trữ, xóa bản ghi cũ và ảnh, thu hồi dung lượng')
+    p.add_argument('--days', type=int, default=30, help='Giữ lại bản ghi trong X ngày gần nhất')
+    p.add_argument('--batch-size', type=int, default=500)
+    p.add_argument('--archive-dir', type=str, help='Lưu bản ghi trước khi xóa (chia thư mục theo ngày/nguồn)')
+    p.add_argument('--archive-format', choices=ARCHIVE_FORMATS, default='csv')
+    p.add_argument('--io-budget', type=float, default=0, help='Giới hạn I/O (MB/s), 0 = không giới hạn')
+    p.add_argument('--segments', action='store_true', help='Nén kho ảnh segment sau khi xóa')
+    sub.add_parser('enable-vacuum', help='Bật auto_vacuum=INCREMENTAL cho DB cũ (VACUUM toàn bộ 1 lần)')
+    for p in sub.choices.values():
+        p.add_argument('--db', default='license_plates.db')
+    args = parser.parse_args()
+
+    db = AdvancedLicensePlateDB(args.db)
+    if args.command == 'enable-vacuum':
+        if enable_incremental_vacuum(db.connect()):
+            print("✅ Đã bật auto_vacuum=INCREMENTAL")
+        else:
+            print("✅ auto_vacuum=INCREMENTAL đã bật từ trước")
+    else:
+        segments = None
+        if args.segments:
+            from function.segment_store import SegmentStore
+            segments = SegmentStore(args.db)
+        engine = RetentionEngine(db, args.days, args.batch_size, args.archive_dir, args.archive_format,
+                                 args.io_budget, segments=segments)
+        r = engine.run_once()
+        print(f"✅ Đã xóa {r['deleted']} bản ghi cũ hơn {args.days} ngày, lưu trữ {r['archived']} "
+              f"({r['archive_bytes'] / 1e6:.1f} MB), ảnh {r['image_bytes'] / 1e6:.1f} MB, "
+              f"trả {r['vacuum_pages']} trang DB")
+        if segments is not None:
+            segments.close()
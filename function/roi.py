@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import function.helper as helper
+
+# one detection zone of a camera: a rectangle [x1, y1, x2, y2] or a polygon [[x, y], ...].
+# the detector only sees the bounding rectangle of the zone; for polygons the pixels
+# outside the polygon are blacked out
+class Roi:
+    def __init__(self, spec):
+        points = np.array(spec, dtype=np.int32)
+        if points.ndim == 1:
+            if len(points) != 4:
+                raise ValueError(f"ROI hình chữ nhật phải có dạng [x1, y1, x2, y2]: {spec}")
+            self.rect = tuple(int(v) for v in points)
+            self.polygon = None
+        else:
+            if len(points) < 3 or points.shape[1] != 2:
+                raise ValueError(f"ROI đa giác phải có ít nhất 3 điểm [x, y]: {spec}")
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            self.rect = (int(x1), int(y1), int(x2), int(y2))
+            self.polygon = points
+        self.mask = None
+
+    def clip(self, frame):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self.rect
+        return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+    def crop(self, frame):
+        x1, y1, x2, y2 = self.clip(frame)
+        crop = frame[y1:y2, x1:x2]
+        if self.polygon is None or crop.size == 0:
+            return crop
+        if self.mask is None or self.mask.shape != crop.shape[:2]:
+            self.mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+            cv2.fillPoly(self.mask, [self.polygon - np.array([x1, y1], dtype=np.int32)], 255)
+        return cv2.bitwise_and(crop, crop, mask=self.mask)
+
+    # (n, 6) boxes in crop coordinates -> frame coordinates
+    def to_frame(self, boxes, frame):
+        x1, y1, _, _ = self.clip(frame)
+        boxes = boxes.copy()
+        boxes[:, [0, 2]] += x1
+        boxes[:, [1, 3]] += y1
+        return boxes
+
+# per-source ROI list loaded from a JSON file and reloaded when the file changes:
+#   {"0": [[0, 300, 1280, 720]], "rtsp://cam1": [[[100, 400], [1200, 400], [1280, 720], [0, 720]]]}
+# the key "*" applies to every source without its own entry
+class RoiConfig:
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.rois = {}
+        self.mtime = None
+        self.last_check = 0.0
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.rois = {str(name): [Roi(spec) for spec in specs] for name, specs in data.items()}
+            self.mtime = mtime
+            total = sum(len(r) for r in self.rois.values())
+            print(f"🗺️  Đã tải {total} vùng ROI từ {self.path}")
+        except (OSError, ValueError, TypeError) as e:
+            # giữ cấu hình cũ nếu file đang được sửa dở hoặc sai cú pháp
+            print(f"⚠️  Không tải được ROI từ {self.path}: {e}")
+            if self.mtime is None:
+                self.mtime = 0
+
+    def get(self, source_name):
+        now = time.monotonic()
+        if now - self.last_check >= self.check_interval:
+            self.last_check = now
+            try:
+                if os.path.getmtime(self.path) != self.mtime:
+                    self.reload()
+            except OSError:
+                pass
+        return self.rois.get(source_name, self.rois.get('*', []))
+
+# concatenate boxes found in several (possibly overlapping) ROIs and drop duplicates
+def merge_boxes(parts, iou_threshold=0.5):
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return np.zeros((0, 6), dtype=np.float32)
+    if len(parts) == 1:
+        return parts[0]
+    boxes = np.concatenate(parts)
+    keep = helper.nms(boxes[:, :4], boxes[:, 4], iou_threshold)
+    return boxes[np.sort(keep)]
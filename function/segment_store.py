@@ -0,0 +1,317 @@
+import argparse
+import mmap
+import os
+import threading
+import time
+
+from database_manager import SEGMENT_PREFIX, get_connection_manager, migrate, segment_blob_id
+
+SEGMENT_DIR = os.path.join('detected_plates', 'segments')
+SEGMENT_SIZE = 256 << 20
+
+MIMETYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+
+# packed crop storage: crops are appended to large segment files and located through
+# the image_blobs table (segment, offset, length); detected_plates.image_path holds
+# 'segment:<blob id>'. millions of crops become a few hundred files.
+# - every store instance appends only to a segment it created itself, so several
+#   processes can share one DB without interleaving writes
+# - reads go through one read-only mmap per segment, cached for the process; maps of
+#   segments another process retired are closed every prune_interval seconds so the
+#   files can be deleted and their space freed
+# - deleting a plate only drops its image_blobs row; compact() rewrites segments whose
+#   live share fell below a threshold and removes the old files
+class SegmentStore:
+    def __init__(self, db_path='license_plates.db', root=SEGMENT_DIR, segment_size=SEGMENT_SIZE,
+                 prune_interval=30.0):
+        self.db_path = db_path
+        self.root = root
+        self.segment_size = segment_size
+        self.connections = get_connection_manager(db_path)
+        migrate(self.connections.connection())
+        self.lock = threading.Lock()  # appends and compaction
+        self.active = None            # (segment id, file) this instance appends to
+        self.active_size = 0
+        self.maps_lock = threading.Lock()
+        self.maps = {}                # segment id -> read-only mmap
+        self.prune_interval = prune_interval
+        self.pruned_at = time.monotonic()
+
+    # ---------- write ----------
+    def append(self, data, fmt=None):
+        """Append one encoded image, returns its image_path reference ('segment:<id>')"""
+        with self.lock:
+            segment_id, offset = self._write(data)
+            conn = self.connections.connection()
+            cursor = conn.execute('''
+                INSERT INTO image_blobs (segment_id, offset, length, format, ts_ms) VALUES (?, ?, ?, ?, ?)
+            ''', (segment_id, offset, len(data), fmt, int(time.time() * 1000)))
+            conn.execute('UPDATE image_segments SET size = ? WHERE id = ?', (self.active_size, segment_id))
+            conn.commit()
+            return f'{SEGMENT_PREFIX}{cursor.lastrowid}'
+
+    def _write(self, data):
+        # caller holds self.lock
+        if self.active is None or (self.active_size and self.active_size + len(data) > self.segment_size):
+            self._roll()
+        segment_id, f = self.active
+        offset = self.active_size
+        f.write(data)
+        # readers in other processes map the file, so the bytes must reach the OS before the index row
+        f.flush()
+        self.active_size += len(data)
+        return segment_id, offset
+
+    def _roll(self):
+        conn = self.connections.connection()
+        self._seal(conn)
+        cursor = conn.execute("INSERT INTO image_segments (path) VALUES ('')")
+        segment_id = cursor.lastrowid
+        path = os.path.join(self.root, f'segment-{segment_id:06d}.seg')
+        conn.execute('UPDATE image_segments SET path = ? WHERE id = ?', (path, segment_id))
+        conn.commit()
+        os.makedirs(self.root, exist_ok=True)
+        self.active = (segment_id, open(path, 'ab'))
+        self.active_size = 0
+
+    def _seal(self, conn):
+        if self.active is None:
+            return
+        segment_id, f = self.active
+        f.close()
+        conn.execute('UPDATE image_segments SET sealed = 1 WHERE id = ? AND sealed = 0', (segment_id,))
+        conn.commit()
+        self.active = None
+
+    def close(self):
+        with self.lock:
+            self._seal(self.connections.connection())
+        with self.maps_lock:
+            for mm in self.maps.values():
+                mm.close()
+            self.maps.clear()
+
+    # ---------- read ----------
+    def read(self, image_path):
+        """(bytes, mimetype) of a 'segment:<id>' image, (None, None) when it no longer exists"""
+        conn = self.connections.connection()
+        if time.monotonic() - self.pruned_at >= self.prune_interval:
+            self.prune_maps(conn)
+        row = conn.execute('''
+            SELECT b.segment_id, b.offset, b.length, b.format, s.path
+            FROM image_blobs b JOIN image_segments s ON s.id = b.segment_id
+            WHERE b.id = ? AND s.sealed < 2
+        ''', (segment_blob_id(image_path),)).fetchone()
+        if row is None:
+            return None, None
+        segment_id, offset, length, fmt, path = row
+        with self.maps_lock:
+            # sliced under the lock so prune_maps never closes a map mid-read
+            data = self._map(segment_id, path, offset + length)[offset:offset + length]
+        return data, MIMETYPES.get(fmt, 'application/octet-stream')
+
+    def _map(self, segment_id, path, needed):
+        # caller holds self.maps_lock
+        mm = self.maps.get(segment_id)
+        # the active segment grows: map it again once a blob lies past the mapped end
+        if mm is None or len(mm) < needed:
+            with open(path, 'rb') as f:
+                new = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mm is not None:
+                mm.close()
+            mm = self.maps[segment_id] = new
+        return mm
+
+    def _unmap(self, segment_id):
+        # caller holds self.maps_lock
+        mm = self.maps.pop(segment_id, None)
+        if mm is not None:
+            mm.close()
+
+    def prune_maps(self, conn=None):
+        """Close the maps of segments that were retired (possibly by another process)"""
+        conn = conn or self.connections.connection()
+        self.pruned_at = time.monotonic()
+        with self.maps_lock:
+            if not self.maps:
+                return 0
+            ids = list(self.maps)
+            live = {row[0] for row in conn.execute(f'''
+                SELECT id FROM image_segments WHERE sealed < 2 AND id IN ({','.join('?' * len(ids))})
+            ''', ids)}
+            retired = [segment_id for segment_id in ids if segment_id not in live]
+            for segment_id in retired:
+                self._unmap(segment_id)
+            return len(retired)
+
+    # ---------- maintenance ----------
+    def delete(self, image_path):
+        conn = self.connections.connection()
+        conn.execute('DELETE FROM image_blobs WHERE id = ?', (segment_blob_id(image_path),))
+        conn.commit()
+
+    def stats(self):
+        conn = self.connections.connection()
+        segments, size = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_segments WHERE sealed < 2
+        ''').fetchone()
+        blobs, live = conn.execute('SELECT COUNT(*), COALESCE(SUM(length), 0) FROM image_blobs').fetchone()
+        return {'segments': segments, 'bytes': size, 'images': blobs, 'live_bytes': live}
+
+    def compact(self, min_dead_ratio=0.5, grace=60.0, idle=3600.0):
+        """Drop orphan images, rewrite segments with at least min_dead_ratio dead bytes, remove old files.
+        grace: images younger than this may not be linked to their plate yet.
+        idle: an unsealed segment untouched this long belongs to a writer that died"""
+        conn = self.connections.connection()
+        # images whose plate was deleted without going through delete_plate (bulk deletes, retention)
+        orphans = conn.execute('''
+            DELETE FROM image_blobs WHERE ts_ms < ? AND NOT EXISTS (
+                SELECT 1 FROM detected_plates WHERE image_path = ? || image_blobs.id
+            )
+        ''', (int((time.time() - grace) * 1000), SEGMENT_PREFIX)).rowcount
+        conn.commit()
+
+        result = {'orphans': orphans, 'segments': 0, 'moved': 0, 'reclaimed_bytes': 0, 'removed_files': 0}
+        with self.lock:
+            own = self.active[0] if self.active else None
+            segments = conn.execute('''
+                SELECT s.id, s.path, s.size, s.sealed, COALESCE(SUM(b.length), 0)
+                FROM image_segments s LEFT JOIN image_blobs b ON b.segment_id = s.id
+                WHERE s.sealed < 2 GROUP BY s.id
+            ''').fetchall()
+            for segment_id, path, size, sealed, live in segments:
+                if segment_id == own:
+                    continue
+                if not sealed:
+                    try:
+                        if time.time() - os.path.getmtime(path) < idle:
+                            continue
+                    except OSError:
+                        pass
+                if size and (size - live) / size < min_dead_ratio:
+                    continue
+                result['moved'] += self._move_live(conn, segment_id, path)
+                result['reclaimed_bytes'] += size - live
+                result['segments'] += 1
+            self._seal(conn)
+
+        for segment_id, path in conn.execute('SELECT id, path FROM image_segments WHERE sealed = 2').fetchall():
+            with self.maps_lock:
+                self._unmap(segment_id)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                # still mapped by a reader on a platform that refuses to delete it, retry next time
+                continue
+            conn.execute('DELETE FROM image_segments WHERE id = ?', (segment_id,))
+            conn.commit()
+            result['removed_files'] += 1
+        return result
+
+    def _move_live(self, conn, segment_id, path):
+        # copy the live images of one segment into the active segment, then retire it.
+        # caller holds self.lock; readers keep working: each read looks the location up again
+        blobs = conn.execute('''
+            SELECT id, offset, length FROM image_blobs WHERE segment_id = ? ORDER BY offset
+        ''', (segment_id,)).fetchall()
+        moves = []
+        if blobs:
+            with open(path, 'rb') as f:
+                for blob_id, offset, length in blobs:
+                    f.seek(offset)
+                    new_segment, new_offset = self._write(f.read(length))
+                    moves.append((new_segment, new_offset, blob_id))
+        conn.executemany('UPDATE image_blobs SET segment_id = ?, offset = ? WHERE id = ?', moves)
+        if self.active is not None:
+            conn.execute('UPDATE image_segments SET size = ? WHERE id = ?', (self.active_size, self.active[0]))
+        conn.execute('UPDATE image_segments SET sealed = 2 WHERE id = ?', (segment_id,))
+        conn.commit()
+        return len(moves)
+
+    # ---------- migration from one file per crop ----------
+    def import_files(self, delete=False, batch=500):
+        """Move every detected_plates image that is still a plain file into the segment store"""
+        conn = self.connections.connection()
+        rows = conn.execute('''
+            SELECT id, image_path FROM detected_plates
+            WHERE image_path IS NOT NULL AND image_path NOT LIKE ? || '%'
+        ''', (SEGMENT_PREFIX,)).fetchall()
+        result = {'imported': 0, 'missing': 0, 'bytes': 0}
+        done = []
+        for plate_id, path in rows:
+            if not os.path.isfile(path):
+                result['missing'] += 1
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            fmt = os.path.splitext(path)[1].lower().lstrip('.').replace('jpeg', 'jpg')
+            # append() commits the image row on this same connection, so each plate is its own
+            # pair of commits: a crash between them leaves an orphan image for compact(), never
+            # a row pointing at a missing image
+            ref = self.append(data, fmt)
+            conn.execute('UPDATE detected_plates SET image_path = ? WHERE id = ?', (ref, plate_id))
+            conn.commit()
+            done.append(path)
+            result['imported'] += 1
+            result['bytes'] += len(data)
+            if len(done) >= batch:
+                self._remove_imported(done, delete)
+        self._remove_imported(done, delete)
+        return result
+
+    def _remove_imported(self, done, delete):
+        # source files go only after their rows point into the store (committed above)
+        if delete:
+            for path in done:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"⚠️  Không xóa được {path}: {e}")
+        done.clear()
+
+def unreferenced_files(db_path, folder):
+    """Image files under folder that no detected_plates row points to"""
+    conn = get_connection_manager(db_path).connection()
+    referenced = {os.path.normpath(row[0]) for row in
+                  conn.execute('SELECT image_path FROM detected_plates WHERE image_path IS NOT NULL')}
+    files = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != os.path.normpath(SEGMENT_DIR)]
+        for name in filenames:
+            path = os.path.normpath(os.path.join(dirpath, name))
+            if name.lower().endswith(('.jpg', '.jpeg', '.webp', '.png')) and path not in referenced:
+                files.append(path)
+    return files
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Kho ảnh biển số dạng segment')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('migrate', help='Chuyển ảnh từng file (detected_plates/) vào kho segment')
+    p.add_argument('--folder', default='detected_plates')
+    p.add_argument('--delete', action='store_true', help='Xóa file ảnh gốc sau khi đã chuyển')
+    p = sub.add_parser('compact', help='Thu hồi dung lượng của ảnh đã xóa')
+    p.add_argument('--min-dead', type=float, default=0.5, help='Tỉ lệ dung lượng chết tối thiểu để viết lại 1 segment')
+    sub.add_parser('stats', help='Dung lượng kho segment')
+    for p in sub.choices.values():
+        p.add_argument('--db', default='license_plates.db')
+        p.add_argument('--segment-size', type=int, default=SEGMENT_SIZE >> 20, help='Kích thước tối đa 1 segment (MB)')
+    args = parser.parse_args()
+
+    store = SegmentStore(args.db, segment_size=args.segment_size << 20)
+    try:
+        if args.command == 'migrate':
+            r = store.import_files(args.delete)
+            print(f"✅ Đã chuyển {r['imported']} ảnh ({r['bytes'] / 1e6:.1f} MB), thiếu file: {r['missing']}")
+            extra = unreferenced_files(args.db, args.folder)
+            if extra:
+                print(f"ℹ️  {len(extra)} ảnh trong {args.folder} không thuộc bản ghi nào, giữ nguyên")
+        elif args.command == 'compact':
+            r = store.compact(args.min_dead)
+            print(f"✅ Ảnh mồ côi: {r['orphans']} | segment viết lại: {r['segments']} ({r['moved']} ảnh) | "
+                  f"thu hồi {r['reclaimed_bytes'] / 1e6:.1f} MB | xóa {r['removed_files']} file")
+        st = store.stats()
+        print(f"📦 {st['segments']} segment, {st['images']} ảnh, "
+              f"{st['live_bytes'] / 1e6:.1f}/{st['bytes'] / 1e6:.1f} MB còn dùng")
+    finally:
+        store.close()
@@ -0,0 +1,110 @@
+from collections import Counter
+
+def iou(a, b):
+    ix1 = max(a[0], b[0])
+    iy1 = max(a[1], b[1])
+    ix2 = min(a[2], b[2])
+    iy2 = min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if inter <= 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / (area_a + area_b - inter + 1e-6)
+
+# one plate followed across frames.
+# position uses a constant-velocity alpha-beta filter (a light Kalman variant)
+class Track:
+    def __init__(self, track_id, box, frame_number):
+        self.id = track_id
+        self.box = list(box)
+        self.velocity = [0.0, 0.0, 0.0, 0.0]
+        self.first_frame = frame_number
+        self.last_frame = frame_number
+        self.hits = 1
+        self.last_ocr_frame = None
+        self.votes = Counter()
+        self.confidence = 0.0
+        # owned by the persistence step: the PlateEvent (DB row) this track was merged into
+        self.event = None
+        # watchlist lookup cached for the current best plate
+        self.watchlist_plate = None
+        self.watchlist = (False, None)
+
+    def predict(self, frame_number):
+        dt = frame_number - self.last_frame
+        return [b + v * dt for b, v in zip(self.box, self.velocity)]
+
+    def update(self, box, frame_number, alpha=0.6, beta=0.2):
+        dt = max(1, frame_number - self.last_frame)
+        predicted = self.predict(frame_number)
+        for i in range(4):
+            residual = box[i] - predicted[i]
+            self.box[i] = predicted[i] + alpha * residual
+            self.velocity[i] += beta * residual / dt
+        self.last_frame = frame_number
+        self.hits += 1
+
+    def add_read(self, lp, confidence):
+        self.votes[lp] += 1
+        self.confidence = max(self.confidence, confidence)
+
+    # majority vote over every OCR read of the track (ties: first plate read wins)
+    def best_plate(self):
+        if not self.votes:
+            return None
+        return self.votes.most_common(1)[0][0]
+
+# IoU tracker: matches detector boxes to existing tracks and decides which
+# boxes need an OCR pass (new tracks, tracks without a read yet, and every
+# ocr_interval frames to refine the vote)
+class PlateTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=15, ocr_interval=10):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.ocr_interval = ocr_interval
+        self.tracks = []
+        self.next_id = 1
+
+    # boxes: list of (x1, y1, x2, y2). returns [(track, needs_ocr)] in the same order
+    def update(self, boxes, frame_number):
+        predictions = [t.predict(frame_number) for t in self.tracks]
+        pairs = []
+        for bi, box in enumerate(boxes):
+            for ti, pred in enumerate(predictions):
+                score = iou(box, pred)
+                if score >= self.iou_threshold:
+                    pairs.append((score, bi, ti))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for score, bi, ti in pairs:
+            if assigned[bi] is not None or ti in used_tracks:
+                continue
+            assigned[bi] = self.tracks[ti]
+            used_tracks.add(ti)
+            self.tracks[ti].update(boxes[bi], frame_number)
+
+        for bi, box in enumerate(boxes):
+            if assigned[bi] is None:
+                track = Track(self.next_id, box, frame_number)
+                self.next_id += 1
+                self.tracks.append(track)
+                assigned[bi] = track
+
+        # drop tracks that have not been seen for max_missed frames
+        self.tracks = [t for t in self.tracks if frame_number - t.last_frame <= self.max_missed]
+
+        return [(track, self.needs_ocr(track, frame_number)) for track in assigned]
+
+    # frame skipped by the motion gate: nothing moved, keep every track where it is
+    def hold(self, frame_number):
+        for t in self.tracks:
+            t.velocity = [0.0, 0.0, 0.0, 0.0]
+            t.last_frame = frame_number
+
+    def needs_ocr(self, track, frame_number):
+        if not track.votes or track.last_ocr_frame is None:
+            return True
+        return frame_number - track.last_ocr_frame >= self.ocr_interval
@@ -29,6 +29,8 @@ def compute_skew(src_img, center_thres):
     lines = cv2.HoughLinesP(edges, 1, math.pi/180, 30, minLineLength=w / 1.5, maxLineGap=h/3.0)
     if lines is None:
         return 1
+    # OpenCV 5 returns (N, 4) instead of (N, 1, 4)
+    lines = lines.reshape(-1, 1, 4)
 
     min_line = 100
     min_line_pos = 0
@@ -1,24 +1,96 @@
 from PIL import Image
 import cv2
-import torch
-import math 
-import function.utils_rotate as utils_rotate
+import numpy as np
+import math
 import function.helper as helper
 import time
 import os
+import re
 import argparse
-from database_manager import AdvancedLicensePlateDB
+import sys
+import threading
+from function.pipeline import StageQueue, Stage, STOP, format_queue_stats
+from function.tracker import PlateTracker
+from function.dedup import IngestDedup
+from function.motion import MotionGate, parse_roi
+from function.control import ControlChannel
+from function.roi import RoiConfig, merge_boxes
+from function.engine import load_engine, warmup, ENGINES
+from function.metrics import Metrics, MetricsWriter
+from function.image_store import ImageStore, FORMATS
+from function.segment_store import SegmentStore
+from function.retention import RetentionEngine, ARCHIVE_FORMATS
+from database_manager import AdvancedLicensePlateDB, AsyncDetectionWriter
+
+startup_time = time.perf_counter()
 
 # ===================== CẤU HÌNH =====================
 parser = argparse.ArgumentParser(description='Advanced License Plate Detection')
-parser.add_argument('--source', type=str, default='0', help='Nguồn video')
+parser.add_argument('--source', type=str, action='append',
+                    help='Nguồn video, có thể lặp lại (--source 0 --source rtsp://...)')
+parser.add_argument('--sources-file', type=str, help='File danh sách nguồn video (1 nguồn/dòng, # là chú thích)')
 parser.add_argument('--save', action='store_true', help='Lưu video output')
 parser.add_argument('--save-crops', action='store_true', help='Lưu ảnh biển số')
+parser.add_argument('--image-format', choices=sorted(FORMATS), default='jpg', help='Định dạng ảnh biển số (--save-crops)')
+parser.add_argument('--image-quality', type=int, default=90, help='Chất lượng nén ảnh biển số (0-100)')
+parser.add_argument('--image-workers', type=int, default=2, help='Số luồng nền mã hóa và ghi ảnh biển số')
+parser.add_argument('--image-store', choices=['files', 'segments'], default='files',
+                    help='Lưu ảnh biển số: mỗi ảnh 1 file, hoặc gộp vào các file segment lớn')
+parser.add_argument('--segment-size', type=int, default=256, help='Kích thước tối đa 1 file segment (MB)')
 parser.add_argument('--watchlist', type=str, help='File watchlist (1 biển số/dòng)')
+parser.add_argument('--pipeline', action='store_true', help='Chạy đa luồng: capture → inference → lưu DB → hiển thị')
+parser.add_argument('--queue-size', type=int, default=4, help='Kích thước hàng đợi giữa các stage (chế độ --pipeline)')
+parser.add_argument('--queue-report', type=float, default=5.0, help='Chu kỳ (giây) in độ sâu hàng đợi, 0 = tắt')
+parser.add_argument('--ocr-interval', type=int, default=10, help='Số frame giữa 2 lần OCR lại cùng 1 track')
+parser.add_argument('--track-iou', type=float, default=0.3, help='Ngưỡng IoU để ghép khung vào track')
+parser.add_argument('--track-max-missed', type=int, default=15, help='Số frame mất dấu tối đa trước khi xóa track')
+parser.add_argument('--dedup-window', type=float, default=5.0,
+                    help='Gộp track mới vào lượt xe vừa thấy trong N giây (cùng nguồn, gần vị trí, biển gần giống), 0 = tắt')
+parser.add_argument('--dedup-distance', type=int, default=2, help='Số ký tự sai khác tối đa khi gộp (khoảng cách sửa)')
+parser.add_argument('--dedup-shift', type=float, default=3.0, help='Khoảng cách tâm tối đa khi gộp, tính theo bề rộng biển số')
+parser.add_argument('--motion-gate', action='store_true', help='Bỏ qua detector khi khung hình không có chuyển động')
+parser.add_argument('--motion-threshold', type=float, default=0.005, help='Tỉ lệ điểm ảnh thay đổi tối thiểu để coi là có chuyển động')
+parser.add_argument('--motion-roi', type=str, help='Vùng theo dõi chuyển động x1,y1,x2,y2 (mặc định cả khung hình)')
+parser.add_argument('--roi-config', type=str,
+                    help='File JSON vùng phát hiện theo nguồn, tự tải lại khi file thay đổi')
+parser.add_argument('--roi-size', type=int, default=640, help='Kích thước ảnh đầu vào detector cho vùng ROI')
+parser.add_argument('--headless', action='store_true',
+                    help='Chạy không giao diện: không vẽ/hiển thị (trừ khi --save), điều khiển qua stdin/socket')
+parser.add_argument('--control-port', type=int, help='Cổng TCP (127.0.0.1) nhận lệnh điều khiển, VD: echo d | nc localhost 9999')
+parser.add_argument('--motion-refresh', type=int, default=0, help='Bắt buộc chạy detector sau N frame bị bỏ qua liên tiếp, 0 = tắt')
+parser.add_argument('--engine', choices=ENGINES, default='torch',
+                    help='Backend suy luận: torch (mặc định), onnxruntime hoặc openvino (cần file .onnx, xem function/engine.py)')
+parser.add_argument('--watchlist-distance', type=int, choices=[0, 1], default=0,
+                    help='1 = vẫn cảnh báo khi biển số đọc được sai/thừa/thiếu 1 ký tự so với watchlist')
+parser.add_argument('--async-db', action='store_true',
+                    help='Ghi detection vào DB ở luồng nền theo lô, không chặn vòng lặp frame')
+parser.add_argument('--metrics', action='store_true',
+                    help='Đo thời gian từng stage và bộ đếm, xuất cho /api/metrics của api_server.py')
+parser.add_argument('--metrics-dir', type=str, default='metrics', help='Thư mục ghi snapshot metrics (dùng chung với api_server.py)')
+parser.add_argument('--metrics-name', type=str, help='Tên worker trong metrics, mặc định theo tên nguồn')
+parser.add_argument('--metrics-interval', type=float, default=5.0, help='Chu kỳ ghi snapshot metrics (giây)')
+parser.add_argument('--retention-days', type=int, default=0,
+                    help='Chạy nền: xóa bản ghi (kèm ảnh) cũ hơn X ngày, 0 = tắt')
+parser.add_argument('--retention-interval', type=float, default=3600, help='Chu kỳ dọn dữ liệu cũ (giây)')
+parser.add_argument('--archive-dir', type=str, help='Lưu bản ghi cũ ra file trước khi xóa (theo ngày/nguồn)')
+parser.add_argument('--archive-format', choices=ARCHIVE_FORMATS, default='csv',
+                    help='csv = CSV nén gzip, parquet cần pyarrow')
+parser.add_argument('--io-budget', type=float, default=5.0, help='Giới hạn I/O khi dọn dữ liệu cũ (MB/s), 0 = không giới hạn')
 args = parser.parse_args()
 
+# Danh sách nguồn: --source (lặp lại) + --sources-file, mặc định camera 0
+source_specs = list(args.source or [])
+if args.sources_file:
+    with open(args.sources_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                source_specs.append(line)
+if not source_specs:
+    source_specs = ['0']
+
 # Khởi tạo database nâng cao
-db = AdvancedLicensePlateDB()
+db = AdvancedLicensePlateDB(watchlist_distance=args.watchlist_distance)
 
 # Tạo thư mục lưu ảnh
 if args.save_crops:
@@ -36,214 +108,462 @@ if args.watchlist and os.path.exists(args.watchlist):
                 if success:
                     print(f"   ✅ Đã thêm: {plate}")
 
-# Tải models
-print("⏳ Đang tải models...")
-yolo_LP_detect = torch.hub.load('yolov5', 'custom', path='model/LP_detector.pt', force_reload=True, source='local')
-yolo_license_plate = torch.hub.load('yolov5', 'custom', path='model/LP_ocr.pt', force_reload=True, source='local')
+# Tải models (dùng chung cho mọi nguồn video)
+print(f"⏳ Đang tải models ({args.engine})...")
+load_start = time.perf_counter()
+yolo_LP_detect = load_engine('model/LP_detector.pt', args.engine)
+yolo_license_plate = load_engine('model/LP_ocr.pt', args.engine)
 yolo_license_plate.conf = 0.60
-print("✅ Models đã tải xong!")
+print(f"✅ Models đã tải xong! ({time.perf_counter() - load_start:.1f}s)")
+
+# Vùng phát hiện (ROI) theo từng nguồn
+roi_config = RoiConfig(args.roi_config) if args.roi_config else None
+
+# ===================== NGUỒN VIDEO =====================
+def slugify(name):
+    """Chuyển tên nguồn (đường dẫn/URL) thành chuỗi an toàn cho tên file"""
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')
+
+class VideoSource:
+    """Một nguồn video (camera/file/RTSP) cùng trạng thái xử lý riêng của nó"""
+
+    def __init__(self, spec, multi=False):
+        self.source = int(spec) if spec.isdigit() else spec
+        self.name = str(self.source)
+        # Nguồn trực tiếp (camera/RTSP) thì bỏ frame cũ, file video thì không bỏ frame nào
+        self.is_live = isinstance(self.source, int) or \
+            self.source.lower().startswith(('rtsp://', 'rtmp://', 'http://', 'https://'))
+        self.window_name = "Advanced License Plate Detection"
+        if multi:
+            self.window_name += f" - {self.name}"
+
+        self.cap = cv2.VideoCapture(self.source)
+        self.out = None
+
+        # Biến tracking riêng cho từng nguồn
+        self.frame_count = 0
+        self.prev_frame_time = 0
+        self.tracker = PlateTracker(args.track_iou, args.track_max_missed, args.ocr_interval)
+        self.alert_frames = {}  # Lưu frame hiển thị cảnh báo
+
+        # Cổng chuyển động: giữ lại khung biển số gần nhất để hiển thị khi bỏ qua detector
+        self.motion_gate = None
+        if args.motion_gate:
+            self.motion_gate = MotionGate(args.motion_threshold, roi=parse_roi(args.motion_roi),
+                                          refresh_frames=args.motion_refresh)
+        self.last_detections = []
+
+    def open(self):
+        if not self.cap.isOpened():
+            print(f"❌ Không mở được nguồn: {self.source}")
+            return False
+
+        if isinstance(self.source, int):
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+            print(f"📹 Đang sử dụng Camera {self.source}")
+        else:
+            print(f"🎥 Đang xử lý video: {self.source}")
+        return True
+
+    def setup_writer(self, multi=False):
+        frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = int(self.cap.get(cv2.CAP_PROP_FPS)) or 20
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        if multi:
+            output_path = f'output_{slugify(self.name)}_{time.strftime("%Y%m%d_%H%M%S")}.mp4'
+        else:
+            output_path = f'output_{time.strftime("%Y%m%d_%H%M%S")}.mp4'
+        self.out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+        print(f"💾 Sẽ lưu video vào: {output_path}")
+
+    def release(self):
+        self.cap.release()
+        if self.out is not None:
+            self.out.release()
+            print(f"✅ Đã lưu video output: {self.name}")
 
 # ===================== MỞ NGUỒN VIDEO =====================
-source = int(args.source) if args.source.isdigit() else args.source
-cap = cv2.VideoCapture(source)
+multi_source = len(source_specs) > 1
+sources = [VideoSource(spec, multi_source) for spec in source_specs]
 
-if not cap.isOpened():
-    print(f"❌ Không mở được nguồn: {source}")
+if not all([src.open() for src in sources]):
+    for src in sources:
+        src.release()
     exit()
 
-if isinstance(source, int):
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    print(f"📹 Đang sử dụng Camera {source}")
-else:
-    print(f"🎥 Đang xử lý video: {source}")
+# ===================== WARM-UP MODELS =====================
+# Chạy thử ở đúng kích thước đầu vào thật: frame của từng nguồn (hoặc vùng ROI),
+# và lô crop biển số cho OCR (4 biến thể deskew của 1 biển)
+frame_shapes = set()
+for src in sources:
+    h = int(src.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 720
+    w = int(src.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 1280
+    frame_shapes.add((h, w))
+warmup_time = warmup(yolo_LP_detect, sorted(frame_shapes), size=640, batch=len(sources))
+if roi_config is not None:
+    blank = np.zeros((max(h for h, _ in frame_shapes), max(w for _, w in frame_shapes), 3), dtype=np.uint8)
+    roi_shapes = {roi.crop(blank).shape[:2] for rois in roi_config.rois.values() for roi in rois}
+    warmup_time += warmup(yolo_LP_detect, sorted(shape for shape in roi_shapes if min(shape) > 0), size=args.roi_size)
+warmup_time += warmup(yolo_license_plate, [(60, 200)], size=640, batch=len(helper.DESKEW_VARIANTS))
+print(f"🔥 Warm-up models: {warmup_time:.1f}s")
+
+first_frame_reported = False
+
+def report_first_frame():
+    """In thời gian từ lúc khởi động đến khi xử lý xong frame đầu tiên"""
+    global first_frame_reported
+    if not first_frame_reported:
+        first_frame_reported = True
+        print(f"⏱️  Time-to-first-frame: {time.perf_counter() - startup_time:.2f}s")
 
 # ===================== SETUP SAVE VIDEO =====================
-out = None
 if args.save:
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 20
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    output_path = f'output_{time.strftime("%Y%m%d_%H%M%S")}.mp4'
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-    print(f"💾 Sẽ lưu video vào: {output_path}")
-
-# ===================== BIẾN TRACKING =====================
-prev_frame_time = 0
-new_frame_time = 0
-frame_count = 0
-detected_plates_history = {}
-DETECTION_COOLDOWN = 30
+    for src in sources:
+        src.setup_writer(multi_source)
 
 # Biến cho cảnh báo
 alert_sound_enabled = True
-alert_frames = {}  # Lưu frame hiển thị cảnh báo
+
+# Metrics: khi tắt, mọi lời gọi đo đều trả về ngay
+metrics = Metrics(enabled=args.metrics)
+metric_queues = []  # hàng đợi của chế độ pipeline, đọc độ sâu/số frame bị bỏ khi ghi snapshot
+
+# Ảnh biển số: mã hóa và ghi ở luồng nền, chia thư mục theo ngày/nguồn.
+# image_path chỉ được ghi vào DB sau khi file đã ghi xong.
+# --image-store segments: ảnh gộp vào file segment, image_path = 'segment:<id>'
+image_store = None
+segment_store = None
+if args.save_crops:
+    if args.image_store == 'segments':
+        segment_store = SegmentStore(db.db_path, segment_size=args.segment_size << 20)
+    image_store = ImageStore('detected_plates', args.image_format, args.image_quality,
+                             args.image_workers, metrics=metrics, segments=segment_store)
+
+def collect_queue_metrics():
+    for q in metric_queues:
+        st = q.stats()
+        metrics.set('lpr_queue_depth', st['depth'], queue=st['name'])
+        metrics.set('lpr_frames_dropped_total', st['dropped'], queue=st['name'])
+    if image_store is not None:
+        metrics.set('lpr_queue_depth', image_store.pending(), queue='images')
+        metrics.set('lpr_images_dropped_total', image_store.dropped())
+
+metrics_writer = None
+if args.metrics:
+    metrics_name = args.metrics_name or slugify('_'.join(source_specs)) or 'worker'
+    metrics_writer = MetricsWriter(metrics, os.path.join(args.metrics_dir, f'{metrics_name}.json'),
+                                   args.metrics_interval, collect=collect_queue_metrics)
+    metrics_writer.start()
+    print(f"📈 Metrics: {metrics_writer.path} (mỗi {args.metrics_interval:g}s)")
+
+# Ghi DB: trực tiếp (mặc định) hoặc qua hàng đợi + luồng ghi theo lô (--async-db).
+# Cả hai có cùng save_plate/update_plate_number/set_image_path nên persist() không cần phân biệt
+db_writer = None
+if args.async_db:
+    db_writer = AsyncDetectionWriter(db, on_flush=lambda n, seconds: metrics.observe('db_batch', seconds))
+    print("🗃️  Ghi DB bất đồng bộ theo lô")
+plate_store = db_writer or db
+
+# Dọn dữ liệu cũ ở luồng nền: từng lô nhỏ, giới hạn I/O để không tranh đĩa với camera
+retention = None
+if args.retention_days > 0:
+    retention = RetentionEngine(db, args.retention_days, archive_dir=args.archive_dir,
+                                archive_format=args.archive_format, io_budget=args.io_budget,
+                                interval=args.retention_interval, segments=segment_store)
+    retention.start()
+    print(f"🧹 Giữ dữ liệu {args.retention_days} ngày (dọn mỗi {args.retention_interval:g}s)")
+
+# Gộp các lần đọc của cùng 1 xe bị tách thành nhiều track thành 1 bản ghi + 1 ảnh
+dedup = IngestDedup(args.dedup_window, args.dedup_distance, args.dedup_shift)
+
+# Chỉ vẽ overlay khi có người xem hoặc cần ghi video
+render_enabled = not args.headless or args.save
+
+# Kênh điều khiển không chặn: stdin (chế độ headless) và/hoặc socket cục bộ
+control = None
+if args.headless or args.control_port:
+    control = ControlChannel(use_stdin=args.headless, port=args.control_port).start()
 
 print("\n🚀 Bắt đầu xử lý...")
-print("⌨️  Nhấn 'q' để thoát")
-print("⌨️  Nhấn 'p' để tạm dừng/tiếp tục")
-print("⌨️  Nhấn 's' để chụp ảnh màn hình")
-print("⌨️  Nhấn 'd' để xem danh sách 10 biển số gần nhất")
-print("⌨️  Nhấn 'w' để xem watchlist")
-print("⌨️  Nhấn 'a' để thêm biển số vào watchlist")
-print("⌨️  Nhấn 'm' để bật/tắt âm thanh cảnh báo\n")
+if args.headless:
+    print("🖥️  Chế độ headless" + (" (vẫn vẽ overlay để ghi video)" if args.save else ""))
+    print("⌨️  Lệnh (stdin" + (f" hoặc cổng {args.control_port}" if args.control_port else "") + "):")
+    print("⌨️  q: thoát | p: tạm dừng/tiếp tục | s: chụp ảnh | d: 10 biển số gần nhất")
+    print("⌨️  w: xem watchlist | m: bật/tắt âm thanh | a <biển số> [lý do]: thêm vào watchlist\n")
+else:
+    print("⌨️  Nhấn 'q' để thoát")
+    print("⌨️  Nhấn 'p' để tạm dừng/tiếp tục")
+    print("⌨️  Nhấn 's' để chụp ảnh màn hình")
+    print("⌨️  Nhấn 'd' để xem danh sách 10 biển số gần nhất")
+    print("⌨️  Nhấn 'w' để xem watchlist")
+    print("⌨️  Nhấn 'a' để thêm biển số vào watchlist")
+    print("⌨️  Nhấn 'm' để bật/tắt âm thanh cảnh báo\n")
 
 paused = False
 
-# ===================== VÒNG LẶP CHÍNH =====================
-while True:
-    if not paused:
-        ret, frame = cap.read()
-        if not ret:
-            print("✅ Video đã kết thúc hoặc lỗi đọc frame.")
-            break
-        
-        frame_count += 1
-        
-        # Phát hiện biển số
-        plates = yolo_LP_detect(frame, size=640)
-        list_plates = plates.pandas().xyxy[0].values.tolist()
-        
-        detected_plates = []
-        current_alerts = []
-        
-        for plate in list_plates:
-            flag = 0
+# ===================== CÁC BƯỚC XỬ LÝ =====================
+def detect_plates(items):
+    """Chạy detector trên 1 lô frame [(src, frame_number, frame)], chỉ trong vùng ROI nếu nguồn có cấu hình.
+    Trả về mảng khung (n, 6) theo toạ độ frame cho từng frame"""
+    full_jobs = []
+    roi_jobs = []
+    for k, (src, _, frame) in enumerate(items):
+        rois = roi_config.get(src.name) if roi_config is not None else []
+        if not rois:
+            full_jobs.append(k)
+            continue
+        for roi in rois:
+            crop = roi.crop(frame)
+            if crop.size:
+                roi_jobs.append((k, roi, crop))
+
+    parts = [[] for _ in items]
+    if full_jobs:
+        plates = yolo_LP_detect([items[k][2] for k in full_jobs], size=640)
+        for k, boxes in zip(full_jobs, helper.result_arrays(plates)):
+            parts[k].append(boxes)
+    if roi_jobs:
+        plates = yolo_LP_detect([crop for _, _, crop in roi_jobs], size=args.roi_size)
+        for (k, roi, _), boxes in zip(roi_jobs, helper.result_arrays(plates)):
+            parts[k].append(roi.to_frame(boxes, items[k][2]))
+    return [merge_boxes(p) for p in parts]
+
+def recognize_batch(items):
+    """Phát hiện, tracking và đọc biển số trên 1 lô frame [(src, frame_number, frame)]"""
+    # Cổng chuyển động: frame không thay đổi thì bỏ qua detector, dùng lại khung cũ để hiển thị
+    detections = [None] * len(items)
+    active = []
+    for i, (src, frame_number, frame) in enumerate(items):
+        metrics.inc('lpr_frames_total', source=src.name)
+        if src.motion_gate is not None and not src.motion_gate.has_motion(frame):
+            metrics.inc('lpr_frames_gated_total', source=src.name)
+            src.tracker.hold(frame_number)
+            detections[i] = [dict(det, crop=None) for det in src.last_detections]
+        else:
+            active.append(i)
+    if not active:
+        return detections
+
+    with metrics.time('detect'):
+        plates = detect_plates([items[i] for i in active])
+
+    # Ghép khung vào track, chỉ cắt ảnh cho track mới hoặc đến lượt OCR lại
+    tracked = []
+    ocr_jobs = []
+    crops = []
+    for i, list_plates in zip(active, plates):
+        src, frame_number, frame = items[i]
+        matches = src.tracker.update([plate[:4] for plate in list_plates], frame_number)
+        frame_tracks = []
+        for plate, (track, needs_ocr) in zip(list_plates, matches):
             x = int(plate[0])
             y = int(plate[1])
             w = int(plate[2] - plate[0])
             h = int(plate[3] - plate[1])
-            confidence = plate[4]
-            
-            # Vẽ khung biển số
-            crop_img = frame[y:y+h, x:x+w]
-            
-            # Đọc biển số
-            lp = ""
-            for cc in range(0, 2):
-                for ct in range(0, 2):
-                    lp = helper.read_plate(yolo_license_plate, utils_rotate.deskew(crop_img, cc, ct))
-                    if lp != "unknown":
-                        detected_plates.append(lp)
-                        
-                        # Kiểm tra có trong watchlist không
-                        is_watchlist, watchlist_info = db.check_watchlist(lp)
-                        
-                        # Chọn màu khung
-                        box_color = (0, 0, 255) if is_watchlist else (0, 255, 0)
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), box_color, 3)
-                        
-                        # Kiểm tra nên lưu không
-                        should_save = False
-                        if lp not in detected_plates_history:
-                            should_save = True
-                        elif frame_count - detected_plates_history[lp] > DETECTION_COOLDOWN:
-                            should_save = True
-                        
-                        # Lưu vào database
-                        if should_save:
-                            image_path = None
-                            if args.save_crops:
-                                crop_filename = f'detected_plates/{lp}_{time.strftime("%Y%m%d_%H%M%S")}.jpg'
-                                cv2.imwrite(crop_filename, crop_img)
-                                image_path = crop_filename
-                            
-                            plate_id, triggered_alert = db.save_plate(
-                                lp, frame_count, confidence, image_path, str(source)
-                            )
-                            detected_plates_history[lp] = frame_count
-                            
-                            if triggered_alert:
-                                print(f"🚨 CẢNH BÁO: Phát hiện biển số trong watchlist: {lp}")
-                                current_alerts.append({
-                                    'plate': lp,
-                                    'reason': watchlist_info['reason'],
-                                    'type': watchlist_info['alert_type']
-                                })
-                                alert_frames[lp] = frame_count + 100  # Hiển thị cảnh báo 100 frames
-                            else:
-                                print(f"💾 Đã lưu biển số: {lp} (ID: {plate_id})")
-                        
-                        # Vẽ text biển số
-                        text_bg_color = (0, 0, 255) if is_watchlist else (0, 255, 0)
-                        text_size = cv2.getTextSize(lp, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)[0]
-                        cv2.rectangle(frame, (x, y-35), (x + text_size[0] + 10, y), text_bg_color, -1)
-                        
-                        # Thêm icon cảnh báo nếu trong watchlist
-                        display_text = f"⚠️ {lp}" if is_watchlist else lp
-                        cv2.putText(frame, display_text, (x, y-10), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
-                        
-                        flag = 1
-                        break
-                if flag == 1:
-                    break
-        
-        # Hiển thị FPS
-        new_frame_time = time.time()
-        fps = int(1 / (new_frame_time - prev_frame_time + 1e-6))
-        prev_frame_time = new_frame_time
-        
-        # Vẽ bảng thông tin
-        info_bg = frame.copy()
-        cv2.rectangle(info_bg, (5, 5), (350, 180), (0, 0, 0), -1)
-        frame = cv2.addWeighted(frame, 0.7, info_bg, 0.3, 0)
-        
-        cv2.putText(frame, f"FPS: {fps}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
-        cv2.putText(frame, f"Frame: {frame_count}", (10, 60), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2)
-        cv2.putText(frame, f"Detected: {len(detected_plates)}", (10, 90), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2)
-        cv2.putText(frame, f"Total DB: {db.get_total_count()}", (10, 120), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,255), 2)
-        
-        # Hiển thị số watchlist
-        watchlist_count = db.get_statistics()['watchlist_count']
-        cv2.putText(frame, f"Watchlist: {watchlist_count}", (10, 150), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,0,255), 2)
-        
-        # Hiển thị cảnh báo active
-        alert_y = 220
-        for plate, end_frame in list(alert_frames.items()):
-            if frame_count < end_frame:
-                # Vẽ banner cảnh báo
-                cv2.rectangle(frame, (0, alert_y-30), (frame.shape[1], alert_y+10), (0, 0, 255), -1)
-                cv2.putText(frame, f"!!! CANH BAO: {plate} trong danh sach theo doi !!!", 
-                           (20, alert_y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255,255,255), 3)
-                alert_y += 50
-            else:
-                del alert_frames[plate]
-        
-        # Lưu video
-        if out is not None:
-            out.write(frame)
-    
-    # Hiển thị video
+            confidence = float(plate[4])
+            frame_tracks.append((track, (x, y, w, h), confidence))
+            if needs_ocr:
+                track.last_ocr_frame = frame_number
+                ocr_jobs.append((track, confidence))
+                crops.append(frame[y:y+h, x:x+w])
+        tracked.append((i, frame_tracks))
+
+    # Đọc tất cả biển số cần OCR theo lô: mỗi biến thể deskew 1 lần chạy OCR,
+    # biến thể sau chỉ dành cho các biển số chưa đọc được
+    lps = []
+    if crops:
+        lps = helper.read_plates_cascade(yolo_license_plate, crops, on_stage=metrics.observe)
+        metrics.inc('lpr_ocr_attempts_total', len(crops))
+        metrics.inc('lpr_ocr_unknown_total', lps.count("unknown"))
+    last_crops = {}
+    for (track, confidence), crop_img, lp in zip(ocr_jobs, crops, lps):
+        if lp != "unknown":
+            track.add_read(lp, confidence)
+            last_crops[track.id] = crop_img
+
+    for i, frame_tracks in tracked:
+        frame_detections = []
+        for track, box, confidence in frame_tracks:
+            lp = track.best_plate()
+            if lp is None:
+                continue
+
+            # Kiểm tra có trong watchlist không (chỉ khi kết quả bình chọn của track đổi)
+            if track.watchlist_plate != lp:
+                with metrics.time('watchlist'):
+                    track.watchlist = db.check_watchlist(lp)
+                track.watchlist_plate = lp
+            is_watchlist, watchlist_info = track.watchlist
+
+            crop_img = last_crops.get(track.id)
+            frame_detections.append({
+                'plate': lp,
+                'box': box,
+                'confidence': track.confidence,
+                'track': track,
+                # bản sao: luồng lưu DB bình chọn trên các phiếu này trong lúc luồng OCR vẫn cộng thêm vào track.votes
+                'votes': dict(track.votes),
+                # Copy để phần vẽ overlay (có thể ở luồng khác) không ghi đè lên ảnh crop
+                'crop': crop_img.copy() if args.save_crops and crop_img is not None else None,
+                'is_watchlist': is_watchlist,
+                'watchlist_info': watchlist_info,
+            })
+        detections[i] = frame_detections
+        items[i][0].last_detections = frame_detections
+    return detections
+
+def persist(src, detections, frame_number):
+    """Lưu biển số vào database: mỗi lượt xe (event) đúng 1 bản ghi và 1 ảnh, cập nhật khi kết quả bình chọn đổi.
+    Track mới có biển số gần giống (sai khác nhỏ do OCR) ở gần vị trí của 1 event vừa thấy thì gộp vào event đó,
+    trừ khi 1 bên thuộc watchlist còn bên kia thì không (lần gặp watchlist luôn có bản ghi và cảnh báo riêng)"""
+    now = time.monotonic()
+    for det in detections:
+        track = det['track']
+        event = track.event
+
+        if event is None:
+            event = dedup.match(src.name, det['plate'], det['box'], now, det['is_watchlist'])
+            if event is not None:
+                dedup.merge(event, track, det['votes'], det['box'], now)
+                track.event = event
+                metrics.inc('lpr_plates_merged_total', source=src.name)
+                print(f"🔗 Gộp track #{track.id} ({det['plate']}) vào bản ghi {event.saved_plate} (ID: {event.plate_id})")
+        else:
+            event.update(track, det['votes'])
+            event.touch(det['box'], now)
+
+        if event is not None:
+            lp = event.best_plate()
+            if lp == event.saved_plate:
+                continue
+            with metrics.time('db_write'):
+                triggered_alert = plate_store.update_plate_number(event.plate_id, lp, det['confidence'])
+            print(f"✏️  Cập nhật track #{track.id}: {event.saved_plate} → {lp} (ID: {event.plate_id})")
+            event.saved_plate = lp
+            if triggered_alert:
+                event.is_watchlist = True
+                print(f"🚨 CẢNH BÁO: Phát hiện biển số trong watchlist: {lp} (nguồn: {src.name})")
+                src.alert_frames[lp] = frame_number + 100  # Hiển thị cảnh báo 100 frames
+            continue
+
+        # Lưu vào database
+        lp = det['plate']
+        with metrics.time('db_write'):
+            plate_id, triggered_alert = plate_store.save_plate(
+                lp, frame_number, det['confidence'], None, src.name
+            )
+        metrics.inc('lpr_plates_total', source=src.name)
+        if image_store is not None and det['crop'] is not None:
+            image_store.save(det['crop'], lp, src.name,
+                             lambda path, plate_id=plate_id: plate_store.set_image_path(plate_id, path))
+        event = track.event = dedup.open(src.name, track, det['votes'], det['box'], now, det['is_watchlist'])
+        event.plate_id = plate_id
+        event.saved_plate = lp
+
+        if triggered_alert:
+            print(f"🚨 CẢNH BÁO: Phát hiện biển số trong watchlist: {lp} (nguồn: {src.name})")
+            src.alert_frames[lp] = frame_number + 100  # Hiển thị cảnh báo 100 frames
+        else:
+            print(f"💾 Đã lưu biển số: {lp} (ID: {plate_id}, track #{track.id})")
+
+def draw_overlay(src, frame, frame_number, detections):
+    """Vẽ khung biển số, bảng thông tin và banner cảnh báo"""
+    for det in detections:
+        lp = det['plate']
+        x, y, w, h = det['box']
+        is_watchlist = det['is_watchlist']
+
+        # Chọn màu khung
+        box_color = (0, 0, 255) if is_watchlist else (0, 255, 0)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), box_color, 3)
+
+        # Vẽ text biển số
+        text_bg_color = (0, 0, 255) if is_watchlist else (0, 255, 0)
+        text_size = cv2.getTextSize(lp, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)[0]
+        cv2.rectangle(frame, (x, y-35), (x + text_size[0] + 10, y), text_bg_color, -1)
+
+        # Thêm icon cảnh báo nếu trong watchlist
+        display_text = f"⚠️ {lp}" if is_watchlist else lp
+        cv2.putText(frame, display_text, (x, y-10),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
+
+    # Hiển thị FPS
+    new_frame_time = time.time()
+    fps = int(1 / (new_frame_time - src.prev_frame_time + 1e-6))
+    src.prev_frame_time = new_frame_time
+
+    # Vẽ bảng thông tin
+    info_bg = frame.copy()
+    cv2.rectangle(info_bg, (5, 5), (350, 180), (0, 0, 0), -1)
+    frame = cv2.addWeighted(frame, 0.7, info_bg, 0.3, 0)
+
+    cv2.putText(frame, f"FPS: {fps}", (10, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+    cv2.putText(frame, f"Frame: {frame_number}", (10, 60),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2)
+    cv2.putText(frame, f"Detected: {len(detections)}", (10, 90),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2)
+    # bộ đếm trong bộ nhớ, không tính top biển số cho mỗi frame
+    stats = db.get_statistics(top_plates=False)
+    cv2.putText(frame, f"Total DB: {stats['total']}", (10, 120),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,255), 2)
+
+    # Hiển thị số watchlist
+    cv2.putText(frame, f"Watchlist: {stats['watchlist_count']}", (10, 150),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,0,255), 2)
+
+    # Số frame đã bỏ qua detector nhờ cổng chuyển động
+    if src.motion_gate is not None:
+        cv2.putText(frame, f"Gated: {src.motion_gate.gated}/{src.motion_gate.frames}", (10, 175),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,200), 1)
+
+    # Hiển thị cảnh báo active
+    alert_y = 220
+    for plate, end_frame in list(src.alert_frames.items()):
+        if frame_number < end_frame:
+            # Vẽ banner cảnh báo
+            cv2.rectangle(frame, (0, alert_y-30), (frame.shape[1], alert_y+10), (0, 0, 255), -1)
+            cv2.putText(frame, f"!!! CANH BAO: {plate} trong danh sach theo doi !!!",
+                       (20, alert_y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255,255,255), 3)
+            alert_y += 50
+        else:
+            src.alert_frames.pop(plate, None)
+
+    return frame
+
+def show(src, frame):
+    """Hiển thị frame của 1 nguồn"""
     display_frame = frame.copy()
     if paused:
-        cv2.putText(display_frame, "PAUSED - Press 'p' to continue", 
-                    (frame.shape[1]//2 - 250, frame.shape[0]//2), 
+        cv2.putText(display_frame, "PAUSED - Press 'p' to continue",
+                    (frame.shape[1]//2 - 250, frame.shape[0]//2),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
-    
-    cv2.imshow("Advanced License Plate Detection", display_frame)
-    
-    # Xử lý phím bấm
-    key = cv2.waitKey(1) & 0xFF
-    
-    if key == ord('q'):
+
+    cv2.imshow(src.window_name, display_frame)
+
+def handle_command(cmd, arg, last_frames):
+    """Thực hiện 1 lệnh (từ phím bấm hoặc kênh điều khiển), trả về False nếu cần thoát"""
+    global paused, alert_sound_enabled
+
+    if cmd == 'q':
         print("\n🛑 Dừng chương trình...")
-        break
-    elif key == ord('p'):
+        return False
+    elif cmd == 'p':
         paused = not paused
         print("⏸️  Tạm dừng" if paused else "▶️  Tiếp tục")
-    elif key == ord('s'):
-        screenshot_path = f'screenshot_{time.strftime("%Y%m%d_%H%M%S")}.jpg'
-        cv2.imwrite(screenshot_path, frame)
-        print(f"📸 Đã lưu ảnh: {screenshot_path}")
-    elif key == ord('d'):
+    elif cmd == 's':
+        for src in sources:
+            frame = last_frames.get(src.name)
+            if frame is None:
+                continue
+            prefix = f'screenshot_{slugify(src.name)}' if multi_source else 'screenshot'
+            screenshot_path = f'{prefix}_{time.strftime("%Y%m%d_%H%M%S")}.jpg'
+            cv2.imwrite(screenshot_path, frame)
+            print(f"📸 Đã lưu ảnh: {screenshot_path}")
+    elif cmd == 'd':
         print("\n" + "="*60)
         print("📋 10 BIỂN SỐ GẦN NHẤT:")
         recent = db.get_recent_plates(10)
@@ -251,7 +571,7 @@ while True:
             alert_icon = "🚨" if plate_data['is_watchlist'] else "  "
             print(f"{i}. {alert_icon} {plate_data['plate_number']} - {plate_data['timestamp']} (Frame: {plate_data['frame_number']})")
         print("="*60 + "\n")
-    elif key == ord('w'):
+    elif cmd == 'w':
         print("\n" + "="*60)
         print("👁️  DANH SÁCH WATCHLIST:")
         watchlist = db.get_watchlist()
@@ -262,26 +582,239 @@ while True:
         else:
             print("   (Trống)")
         print("="*60 + "\n")
-    elif key == ord('a'):
+    elif cmd == 'a':
+        parts = arg.split(None, 1)
+        if not parts:
+            print("❌ Cú pháp: a <biển số> [lý do]")
+            return True
+        plate_input = parts[0]
+        reason_input = parts[1] if len(parts) > 1 else "Thêm thủ công"
+        success, result = db.add_to_watchlist(plate_input, reason_input, "warning")
+        if success:
+            print(f"✅ Đã thêm {plate_input} vào watchlist")
+        else:
+            print(f"❌ {result}")
+    elif cmd == 'm':
+        alert_sound_enabled = not alert_sound_enabled
+        print(f"🔔 Âm thanh cảnh báo: {'BẬT' if alert_sound_enabled else 'TẮT'}")
+    else:
+        print(f"❓ Lệnh không hợp lệ: {cmd}")
+
+    return True
+
+def handle_key(last_frames):
+    """Xử lý phím bấm trên cửa sổ hiển thị, trả về False nếu người dùng muốn thoát"""
+    key = cv2.waitKey(1) & 0xFF
+
+    if key == 255:
+        return True
+    if key == ord('a'):
         print("\n➕ THÊM BIỂN SỐ VÀO WATCHLIST:")
         plate_input = input("Nhập biển số: ").strip()
         if plate_input:
             reason_input = input("Lý do (tùy chọn): ").strip() or "Thêm thủ công"
-            success, result = db.add_to_watchlist(plate_input, reason_input, "warning")
-            if success:
-                print(f"✅ Đã thêm {plate_input} vào watchlist")
-            else:
-                print(f"❌ {result}")
-    elif key == ord('m'):
-        alert_sound_enabled = not alert_sound_enabled
-        print(f"🔔 Âm thanh cảnh báo: {'BẬT' if alert_sound_enabled else 'TẮT'}")
+            return handle_command('a', f"{plate_input} {reason_input}", last_frames)
+        return True
+    if chr(key) in 'qpsdwm':
+        return handle_command(chr(key), '', last_frames)
+    return True
+
+def poll_controls(last_frames):
+    """Xử lý lệnh từ kênh điều khiển và phím bấm (nếu có cửa sổ), trả về False nếu cần thoát"""
+    if control is not None:
+        for cmd, arg in control.poll():
+            if not handle_command(cmd, arg, last_frames):
+                return False
+    if args.headless or not last_frames:
+        return True
+    return handle_key(last_frames)
+
+# ===================== CHẾ ĐỘ TUẦN TỰ =====================
+def run_sequential(src):
+    frame = None
+
+    while True:
+        if not paused:
+            ret, frame = src.cap.read()
+            if not ret:
+                print("✅ Video đã kết thúc hoặc lỗi đọc frame.")
+                break
+
+            src.frame_count += 1
+
+            with metrics.time('recognize'):
+                detections = recognize_batch([(src, src.frame_count, frame)])[0]
+            report_first_frame()
+            persist(src, detections, src.frame_count)
+            if render_enabled:
+                with metrics.time('render'):
+                    frame = draw_overlay(src, frame, src.frame_count, detections)
+
+            # Lưu video
+            if src.out is not None:
+                src.out.write(frame)
+        elif args.headless:
+            time.sleep(0.05)
+
+        if not args.headless:
+            show(src, frame)
+        if not poll_controls({src.name: frame}):
+            break
+
+# ===================== CHẾ ĐỘ PIPELINE (ĐA LUỒNG) =====================
+def run_pipelined():
+    """capture (1 luồng/nguồn) → inference theo lô → (lưu DB | vẽ + hiển thị/ghi video)"""
+    # Nguồn trực tiếp: "frame mới nhất thắng" để độ trễ không tăng mãi
+    # File video: không mất frame, stage chậm sẽ làm chậm việc đọc file
+    frame_queues = {
+        src.name: StageQueue(f'capture[{src.name}]' if multi_source else 'capture',
+                             args.queue_size, drop_oldest=src.is_live)
+        for src in sources
+    }
+    any_live = any(src.is_live for src in sources)
+    persist_q = StageQueue('persist', args.queue_size * 16, drop_oldest=False)
+    render_q = StageQueue('render', args.queue_size * len(sources), drop_oldest=any_live)
+    queues = list(frame_queues.values()) + [persist_q, render_q]
+    metric_queues.extend(queues)
+
+    stop_event = threading.Event()
+
+    def capture_worker(src, frame_q):
+        try:
+            while not stop_event.is_set():
+                if paused:
+                    time.sleep(0.05)
+                    continue
+                ret, frame = src.cap.read()
+                if not ret:
+                    print(f"✅ Video đã kết thúc hoặc lỗi đọc frame: {src.name}")
+                    break
+                src.frame_count += 1
+                if not frame_q.put((src.frame_count, frame)):
+                    break
+        finally:
+            frame_q.close()
+
+    def inference_worker():
+        # Mỗi lượt lấy tối đa 1 frame từ mỗi nguồn rồi detect chung 1 lô
+        active = [(src, frame_queues[src.name]) for src in sources]
+        try:
+            while active:
+                batch = []
+                for src, frame_q in list(active):
+                    item = frame_q.get(timeout=0)
+                    if item is STOP:
+                        active.remove((src, frame_q))
+                    elif item is not None:
+                        batch.append((src, item[0], item[1]))
+                if not batch:
+                    time.sleep(0.005)
+                    continue
+
+                with metrics.time('recognize'):
+                    results = recognize_batch(batch)
+                report_first_frame()
+                for (src, frame_number, frame), detections in zip(batch, results):
+                    if detections:
+                        persist_q.put((src, frame_number, detections))
+                    render_q.put((src, frame_number, frame, detections))
+        except Exception as e:
+            print(f"❌ Stage 'inference' lỗi: {e}")
+            for frame_q in frame_queues.values():
+                frame_q.close()
+        finally:
+            render_q.close()
+
+    def persist_step(item):
+        src, frame_number, detections = item
+        persist(src, detections, frame_number)
+
+    capture_threads = [
+        threading.Thread(target=capture_worker, args=(src, frame_queues[src.name]),
+                         name=f'capture-{src.name}', daemon=True)
+        for src in sources
+    ]
+    inference_thread = threading.Thread(target=inference_worker, name='inference', daemon=True)
+    def stage_failed(stage):
+        # lỗi lặp lại (DB hỏng, đầy đĩa): dừng cả pipeline thay vì tiếp tục chạy mà không lưu gì
+        stop_event.set()
+
+    persist_stage = Stage('persist', persist_step, persist_q, on_error=stage_failed)
+
+    for t in capture_threads:
+        t.start()
+    inference_thread.start()
+    persist_stage.start()
+
+    # Render chạy ở luồng chính vì cv2.imshow/waitKey cần luồng chính
+    # (headless: chỉ nhận lệnh điều khiển và ghi video nếu có --save)
+    last_report = time.time()
+    last_frames = {}
+    while True:
+        item = render_q.get(timeout=0.05)
+        if item is STOP:
+            break
+        if item is not None:
+            src, frame_number, frame, detections = item
+            if render_enabled:
+                with metrics.time('render'):
+                    frame = draw_overlay(src, frame, frame_number, detections)
+            if src.out is not None:
+                src.out.write(frame)
+            if not args.headless:
+                show(src, frame)
+            last_frames[src.name] = frame
+
+        if not poll_controls(last_frames) or stop_event.is_set():
+            break
+
+        if args.queue_report > 0 and time.time() - last_report >= args.queue_report:
+            print(f"📊 Hàng đợi: {format_queue_stats(queues)}")
+            last_report = time.time()
+
+    # Dừng capture, chờ inference xả hàng đợi rồi ghi nốt DB (không mất detection)
+    stop_event.set()
+    for frame_q in frame_queues.values():
+        frame_q.close()
+    render_q.close()
+    for t in capture_threads:
+        t.join()
+    inference_thread.join()
+    persist_q.close()
+    persist_stage.join()
+    print(f"📊 Hàng đợi: {format_queue_stats(queues)}")
+    return persist_stage.error
+
+# ===================== VÒNG LẶP CHÍNH =====================
+if args.pipeline or multi_source:
+    if multi_source:
+        print(f"📡 Chế độ đa nguồn: {len(sources)} nguồn, dùng chung 1 bộ model")
+    print("🧵 Chế độ pipeline đa luồng")
+    pipeline_error = run_pipelined()
+else:
+    pipeline_error = None
+    run_sequential(sources[0])
 
 # ===================== GIẢI PHÓNG TÀI NGUYÊN =====================
-cap.release()
-if out is not None:
-    out.release()
-    print(f"✅ Đã lưu video output!")
-cv2.destroyAllWindows()
+for src in sources:
+    src.release()
+if retention is not None:
+    retention.stop()
+if image_store is not None:
+    # Ghi nốt ảnh trước DB: mỗi ảnh xong sẽ gắn image_path vào bản ghi của nó
+    print(f"⏳ Đang ghi nốt {image_store.pending()} ảnh biển số...")
+    image_store.close()
+if segment_store is not None:
+    segment_store.close()
+if db_writer is not None:
+    print(f"⏳ Đang ghi nốt {db_writer.pending()} thao tác DB...")
+    db_writer.close()
+if metrics_writer is not None:
+    metrics_writer.stop()
+if control is not None:
+    control.stop()
+if not args.headless:
+    cv2.destroyAllWindows()
 
 # Hiển thị thống kê cuối
 stats = db.get_statistics()
@@ -290,5 +823,12 @@ print(f"   - Tổng số phát hiện: {stats['total']}")
 print(f"   - Biển số độc nhất: {stats['unique']}")
 print(f"   - Trong watchlist: {stats['watchlist_count']}")
 print(f"   - Cảnh báo chưa xử lý: {stats['alerts_pending']}")
-print(f"   - Tổng số frame: {frame_count}")
-print("👋 Chương trình kết thúc!")
\ No newline at end of file
+print(f"   - Tổng số frame: {sum(src.frame_count for src in sources)}")
+for src in sources:
+    if src.motion_gate is not None:
+        print(f"   - Frame bỏ qua detector ({src.name}): {src.motion_gate.gated} "
+              f"({src.motion_gate.gated_ratio():.0%})")
+if pipeline_error is not None:
+    print(f"❌ Dừng do lỗi lưu dữ liệu: {pipeline_error}")
+    sys.exit(1)
+print("👋 Chương trình kết thúc!")
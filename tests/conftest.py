@@ -0,0 +1,42 @@
+import importlib
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# the modules live at the repository root (run as scripts, not installed)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import migrate
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Fresh database file migrated to the latest schema"""
+    conn = sqlite3.connect(str(tmp_path / 'plates.db'))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """AdvancedLicensePlateDB on a fresh file; statistics refresh on every read"""
+    from database_manager import AdvancedLicensePlateDB
+    db = AdvancedLicensePlateDB(str(tmp_path / 'plates.db'))
+    db.stats.refresh_interval = 0
+    yield db
+    db.connections.close()
+
+
+@pytest.fixture
+def api_server(tmp_path, monkeypatch):
+    """api_server imported fresh on an empty license_plates.db in tmp_path"""
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_cors')
+    # api_server opens license_plates.db in the working directory at import
+    monkeypatch.chdir(tmp_path)
+    sys.modules.pop('api_server', None)
+    yield importlib.import_module('api_server')
+    sys.modules.pop('api_server', None)
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def client(api_server):
+    api_server.db.save_plate('29A12345', 1)
+    return api_server.app.test_client()
+
+
+@pytest.mark.parametrize('url', [
+    '/api/stats/today?tz=Mars/Olympus',
+    '/api/stats/today?date=2024-13-01',
+    '/api/stats/today?date=yesterday',
+    '/api/stats/timeseries?tz=Not/AZone',
+    '/api/stats/timeseries?from=2024-5-1x',
+    '/api/stats/top?to=tomorrow',
+    '/api/plates/similar?plate=29A12345&max_distance=3',
+])
+def test_invalid_parameters_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['success'] is False and body['message']
+
+
+def test_today_with_timezone(client):
+    body = client.get('/api/stats/today?tz=Asia/Ho_Chi_Minh').get_json()
+    assert body['success'] and body['count'] == 1
+
+
+def test_explicit_day_without_detections(client):
+    body = client.get('/api/stats/today?date=2000-01-01').get_json()
+    assert body['success'] and (body['date'], body['count']) == ('2000-01-01', 0)
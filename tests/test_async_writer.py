@@ -0,0 +1,71 @@
+import threading
+
+from database_manager import AsyncDetectionWriter
+
+
+def rows(db):
+    return db.connect().execute('SELECT plate_number FROM detected_plates ORDER BY id').fetchall()
+
+
+def test_queued_writes_are_batched(db):
+    flushes = []
+    writer = AsyncDetectionWriter(db, max_batch=20, flush_interval=1.0,
+                                  on_flush=lambda n, seconds: flushes.append(n))
+    pending = [writer.save_plate(f'29A{i:05d}', i)[0] for i in range(50)]
+    writer.close()
+    assert flushes == [20, 20, 10]
+    assert [p.id for p in pending] == list(range(1, 51))
+    assert len(rows(db)) == 50
+
+
+def test_close_flushes_pending_writes(db):
+    writer = AsyncDetectionWriter(db, flush_interval=30.0)
+    first, _ = writer.save_plate('29A12345', 1)
+    writer.update_plate_number(first, '29A12346', 0.9)
+    writer.set_image_path(first, 'crops/a.jpg')
+    writer.close()
+    row = db.connect().execute('SELECT plate_number, image_path FROM detected_plates').fetchone()
+    assert tuple(row) == ('29A12346', 'crops/a.jpg')
+
+
+def test_retries_while_another_connection_holds_the_write_lock(db, capsys):
+    # no busy_timeout: the writer sees "database is locked" at once and must retry
+    db.connections.PRAGMAS = (('busy_timeout', 0),)
+    locker = db.connections.open()
+    locker.execute('BEGIN IMMEDIATE')
+    writer = AsyncDetectionWriter(db, flush_interval=0.01)
+    pending, _ = writer.save_plate('29A12345', 1)
+    release = threading.Timer(0.3, locker.commit)
+    release.start()
+    writer.close()
+    release.join()
+    locker.close()
+    assert 'thử lại' in capsys.readouterr().out
+    assert pending.id == 1 and writer.error is None
+    assert len(rows(db)) == 1
+
+
+def test_bad_row_falls_back_to_row_by_row(db):
+    flushes = []
+    writer = AsyncDetectionWriter(db, flush_interval=1.0, on_flush=lambda n, seconds: flushes.append(n))
+    good = [writer.save_plate(f'51F{i:05d}', i)[0] for i in range(4)]
+    bad, _ = writer.save_plate(None, 99)  # violates NOT NULL
+    writer.update_plate_number(bad, '30H00000')
+    writer.update_plate_number(good[1], '51F99999')
+    writer.close()
+    # only the bad insert and its update are lost; the rest is written one operation at a time
+    assert flushes == [1] * 5
+    assert bad.id is None and all(p.id is not None for p in good)
+    assert [r[0] for r in rows(db)] == ['51F00000', '51F99999', '51F00002', '51F00003']
+    assert writer.error is None
+
+
+def test_non_busy_operational_error_stops_the_writer(db):
+    writer = AsyncDetectionWriter(db, flush_interval=0.01)
+    conn = db.connections.open()
+    conn.execute('ALTER TABLE detected_plates RENAME TO detected_plates_old')
+    conn.commit()
+    conn.close()
+    writer.save_plate('29A12345', 1)
+    writer.close()  # returns instead of retrying forever
+    assert writer.error is not None
@@ -0,0 +1,19 @@
+import argparse
+import json
+
+import benchmark
+
+
+def test_dedup_writes_json(tmp_path):
+    folder = tmp_path / 'crops'
+    folder.mkdir()
+    for name in ('29Y03658_20240501_081500', '29Y303658_20240501_081502',
+                 '51F67890_20240501_081530'):
+        (folder / f'{name}.jpg').write_bytes(b'')
+    out = tmp_path / 'dedup.json'
+
+    benchmark.bench_dedup(argparse.Namespace(folder=str(folder), window=5.0, distance=2, json=str(out)))
+
+    result = json.loads(out.read_text(encoding='utf-8'))
+    assert (result['reads'], result['events']) == (3, 2)
+    assert result['merged'] == [['29Y03658', '29Y303658']]
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from database_manager import (MIGRATIONS, SIMILAR_MAX_DISTANCE, check_query_plans, migrate,
+                              schema_version, search_plate_index)
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def test_fresh_database_reaches_latest_version(conn):
+    assert schema_version(conn) == LATEST
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'detected_plates', 'watchlist', 'alerts', 'plate_search', 'image_blobs', 'rollup_hourly'} <= tables
+
+
+def test_migrate_is_idempotent(conn):
+    assert migrate(conn) == []
+    assert schema_version(conn) == LATEST
+
+
+def test_hot_queries_use_indexes(conn):
+    problems = check_query_plans(conn)
+    assert problems == [], '\n'.join(f'{name}: {reason} {plan}' for name, reason, plan in problems)
+
+
+def test_upgrade_backfills_existing_rows(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'old.db'))
+    migrate(conn, MIGRATIONS[:2])
+    conn.executemany('''
+        INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, source, is_watchlist)
+        VALUES (?, ?, 0, 0.9, 'cam1', ?)
+    ''', [('29A-12345', '2024-05-01 08:15:00', 0),
+          ('29A-12345', '2024-05-01 08:45:00', 1),
+          ('51F-67890', '2024-05-02 09:00:00', 0)])
+    conn.commit()
+
+    applied = migrate(conn)
+    assert [version for version, _ in applied] == list(range(3, LATEST + 1))
+    # ts_ms computed from the local-time timestamp
+    assert conn.execute('SELECT COUNT(*) FROM detected_plates WHERE ts_ms IS NULL').fetchone()[0] == 0
+    # existing plates indexed for the similar-plate search
+    assert dict(search_plate_index(conn, '29A-12346', 1)) == {'29A-12345': 1}
+    # rollups rebuilt from the existing rows
+    assert conn.execute('SELECT SUM(detections), SUM(watchlist_hits) FROM rollup_daily').fetchone() == (3, 1)
+    assert dict(conn.execute('SELECT plate_number, count FROM rollup_plates')) == {'29A-12345': 2, '51F-67890': 1}
+
+
+def test_rollup_triggers_follow_inserts(conn):
+    conn.execute('''
+        INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, source, is_watchlist)
+        VALUES ('29A-12345', '2024-05-01 08:15:00', 0, 0.9, 'cam1', 0)
+    ''')
+    conn.commit()
+    assert conn.execute("SELECT detections FROM rollup_daily WHERE day = '2024-05-01'").fetchone() == (1,)
+
+
+def test_failed_migration_rolls_back(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'broken.db'))
+    migrate(conn, MIGRATIONS[:1])
+    broken = MIGRATIONS[:1] + [(2, 'broken', ['CREATE TABLE half_done (id INTEGER)', 'NOT SQL'])]
+    with pytest.raises(sqlite3.Error):
+        migrate(conn, broken)
+    assert schema_version(conn) == 1
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+
+
+def test_similar_search_rejects_distance_beyond_index(conn):
+    with pytest.raises(ValueError):
+        search_plate_index(conn, '29A-12345', SIMILAR_MAX_DISTANCE + 1)
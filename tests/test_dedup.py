@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from function.dedup import IngestDedup
+
+
+def track(track_id):
+    return SimpleNamespace(id=track_id)
+
+
+BOX = (100, 100, 80, 20)
+
+
+def test_ocr_variant_near_box_joins_event():
+    dedup = IngestDedup(window=5.0)
+    event = dedup.open('cam1', track(1), {'29Y03658': 3}, BOX, now=0.0)
+    assert dedup.match('cam1', '29Y303658', (110, 102, 80, 20), now=1.0) is event
+    dedup.merge(event, track(2), {'29Y303658': 1}, (110, 102, 80, 20), now=1.0)
+    assert dedup.merged == 1
+    assert event.best_plate() == '29Y03658'
+
+
+def test_no_match_for_other_plate_source_or_position():
+    dedup = IngestDedup(window=5.0)
+    dedup.open('cam1', track(1), {'29Y03658': 1}, BOX, now=0.0)
+    assert dedup.match('cam1', '51F67890', BOX, now=1.0) is None
+    assert dedup.match('cam2', '29Y03658', BOX, now=1.0) is None
+    assert dedup.match('cam1', '29Y03658', (900, 500, 80, 20), now=1.0) is None
+
+
+def test_event_expires_after_window():
+    dedup = IngestDedup(window=5.0)
+    event = dedup.open('cam1', track(1), {'29Y03658': 1}, BOX, now=0.0)
+    dedup.merge(event, track(2), {'29Y03658': 1}, BOX, now=4.0)
+    assert dedup.match('cam1', '29Y03658', BOX, now=8.0) is event
+    assert dedup.match('cam1', '29Y03658', BOX, now=9.5) is None
+
+
+def test_watchlist_status_is_never_merged():
+    dedup = IngestDedup(window=5.0)
+    dedup.open('cam1', track(1), {'29Y03658': 1}, BOX, now=0.0, is_watchlist=False)
+    assert dedup.match('cam1', '29Y03659', BOX, now=1.0, is_watchlist=True) is None
+
+
+def test_event_votes_are_a_snapshot():
+    dedup = IngestDedup(window=5.0)
+    votes = {'29Y03658': 1}
+    event = dedup.open('cam1', track(1), votes, BOX, now=0.0)
+    votes['51F67890'] = 5
+    assert event.plates() == {'29Y03658'}
+
+
+def test_disabled_window_never_matches():
+    dedup = IngestDedup(window=0)
+    dedup.open('cam1', track(1), {'29Y03658': 1}, BOX, now=0.0)
+    assert dedup.match('cam1', '29Y03658', BOX, now=0.0) is None
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from function.helper import (VECTORIZE_MIN_BATCH, boxes_to_bb_list, decode_plate, decode_plates,
+                             decode_plates_vectorized)
+
+LUT = np.array(list('0123456789ABCDEFGHKLMNPSTUVXYZ'), dtype=object)
+
+
+def plate_boxes(chars, rows=1, tilt=0.0, x0=10.0, y0=10.0, w=12.0, h=20.0):
+    """(n, 6) OCR boxes laid out in `rows` lines, shuffled like detector output"""
+    boxes = []
+    per_row = -(-len(chars) // rows)
+    for k, c in enumerate(chars):
+        col, row = k % per_row, k // per_row
+        x = x0 + col * (w + 2)
+        y = y0 + row * (h + 6) + tilt * x
+        boxes.append([x, y, x + w, y + h, 0.9, float(np.where(LUT == c)[0][0])])
+    order = np.random.default_rng(len(chars) + rows).permutation(len(boxes))
+    return np.array(boxes, dtype=np.float32)[order]
+
+
+def reference(boxes):
+    return decode_plate(boxes_to_bb_list(boxes, LUT))
+
+
+@pytest.mark.parametrize('chars, rows, tilt', [
+    ('29A12345', 1, 0.0),
+    ('29A123456', 1, 0.15),        # slanted single line
+    ('51F67890', 2, 0.0),          # two-line plate
+    ('30H123456', 2, 0.1),
+    ('1234567890', 1, -0.2),
+])
+def test_vectorized_matches_reference(chars, rows, tilt):
+    boxes = plate_boxes(chars, rows, tilt)
+    assert decode_plates_vectorized([boxes], LUT) == [reference(boxes)]
+
+
+@pytest.mark.parametrize('repeat', [1, VECTORIZE_MIN_BATCH])
+def test_decode_plates_batch_keeps_order_and_unknowns(repeat):
+    # 5 crops stay on the per-plate loop, 5 * VECTORIZE_MIN_BATCH take the vectorized path
+    batch = [plate_boxes('29A12345'), plate_boxes('123456'), np.zeros((0, 6), np.float32),
+             plate_boxes('51F67890', 2), plate_boxes('12345678901')] * repeat
+    expected = [reference(boxes) for boxes in batch]
+    assert decode_plates(batch, LUT) == expected
+    assert expected[1:3] == ['unknown', 'unknown'] and expected[4] == 'unknown'
+    assert '-' in expected[3]
+
+
+def test_decode_plates_random_layouts():
+    rng = np.random.default_rng(0)
+    batch = []
+    for _ in range(200):
+        n = int(rng.integers(5, 12))
+        boxes = np.zeros((n, 6), np.float32)
+        boxes[:, 0] = rng.uniform(0, 200, n)
+        boxes[:, 1] = rng.uniform(0, 60, n)
+        boxes[:, 2] = boxes[:, 0] + rng.uniform(5, 15, n)
+        boxes[:, 3] = boxes[:, 1] + rng.uniform(10, 25, n)
+        boxes[:, 4] = rng.uniform(0.3, 1.0, n)
+        boxes[:, 5] = rng.integers(0, len(LUT), n)
+        batch.append(boxes)
+    assert decode_plates_vectorized(batch, LUT) == [reference(boxes) for boxes in batch]
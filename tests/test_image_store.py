@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+import function.image_store as image_store
+from function.image_store import ImageStore
+from function.segment_store import SegmentStore
+
+
+def crop(value=128):
+    image = np.full((40, 120, 3), value, np.uint8)
+    cv2.putText(image, '29A', (5, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    return image
+
+
+def test_paths_are_sharded_by_day_and_source(tmp_path):
+    store = ImageStore(str(tmp_path), workers=1)
+    when = time.mktime((2024, 5, 1, 8, 15, 30, 0, 0, -1)) + 0.25
+    path = store.write(crop(), '29A-123.45', 'rtsp://cam 1/stream', when)
+    store.close()
+    folder, name = os.path.split(os.path.relpath(path, tmp_path))
+    assert folder == os.path.join('20240501', 'rtsp_cam_1_stream')
+    assert name.startswith('29A-123_45_081530_250_') and name.endswith('.jpg')
+
+
+def test_same_plate_same_second_never_overwrites(tmp_path, monkeypatch):
+    store = ImageStore(str(tmp_path), workers=1)
+    when = time.time()
+    paths = {store.write(crop(i), '29A12345', 'cam1', when) for i in range(20)}
+    assert len(paths) == 20
+
+    # forced id collision: the exclusive create fails and a new name is drawn
+    a, b = uuid.UUID(int=0xAAAAAAAA << 96), uuid.UUID(int=0xBBBBBBBB << 96)
+    ids = iter([a, a, b])
+    monkeypatch.setattr(image_store.uuid, 'uuid4', lambda: next(ids))
+    first = store.write(crop(1), '51F67890', 'cam1', when)
+    second = store.write(crop(2), '51F67890', 'cam1', when)
+    store.close()
+    assert first != second
+    assert cv2.imread(first)[0, 0, 0] != cv2.imread(second)[0, 0, 0]
+
+
+def test_on_saved_runs_after_the_file_is_written(tmp_path):
+    store = ImageStore(str(tmp_path), workers=2)
+    saved = []
+    lock = threading.Lock()
+
+    def on_saved(path):
+        # the file is complete when the callback runs
+        assert cv2.imread(path) is not None
+        with lock:
+            saved.append(path)
+
+    for i in range(10):
+        assert store.save(crop(i), f'29A{i:05d}', 'cam1', on_saved)
+    store.close()
+    assert len(saved) == 10 and store.written == 10 and store.failed == 0
+
+
+def test_close_drains_the_queue(tmp_path):
+    store = ImageStore(str(tmp_path), workers=1, queue_size=100)
+    for i in range(40):
+        store.save(crop(i), '29A12345', 'cam1')
+    store.close()
+    assert store.pending() == 0 and store.dropped() == 0
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert len(files) == 40
+    assert not store.save(crop(), '29A12345', 'cam1')  # closed
+
+
+def test_segments_store_receives_references(db, tmp_path):
+    segments = SegmentStore(db.db_path, root=str(tmp_path / 'segments'))
+    store = ImageStore(str(tmp_path / 'crops'), workers=1, segments=segments)
+    saved = []
+    store.save(crop(), '29A12345', 'cam1', saved.append)
+    store.close()
+    assert saved[0].startswith('segment:')
+    data, mimetype = segments.read(saved[0])
+    assert mimetype == 'image/jpeg' and cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) is not None
+    segments.close()
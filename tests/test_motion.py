@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from function.motion import MotionGate, parse_roi
+
+
+def frame(value=0, h=120, w=200):
+    return np.full((h, w, 3), value, np.uint8)
+
+
+def test_roi_is_clamped_to_frame():
+    gate = MotionGate(roi=(-50, -20, 5000, 5000))
+    assert gate._clamp_roi(frame()) == (0, 0, 200, 120)
+    assert gate.has_motion(frame())
+    assert not gate.has_motion(frame())
+
+
+def test_roi_outside_frame_uses_whole_frame():
+    gate = MotionGate(roi=(300, 200, 400, 260))
+    assert gate._clamp_roi(frame()) == (0, 0, 200, 120)
+    gate.has_motion(frame())
+    assert gate.has_motion(frame(255))
+
+
+def test_motion_outside_roi_is_ignored():
+    gate = MotionGate(roi=(0, 0, 100, 120))
+    gate.has_motion(frame())
+    moved = frame()
+    moved[:, 150:] = 255
+    assert not gate.has_motion(moved)
+
+
+def test_parse_roi():
+    assert parse_roi('10,20,110,80') == (10, 20, 110, 80)
+    assert parse_roi('') is None
+    with pytest.raises(ValueError):
+        parse_roi('10,20,110')
+    with pytest.raises(ValueError):
+        parse_roi('110,20,10,80')
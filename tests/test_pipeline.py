@@ -0,0 +1,50 @@
+from function.pipeline import STOP, Stage, StageQueue
+
+
+def run_stage(fn, items, **kwargs):
+    in_q, out_q = StageQueue('in', 100), StageQueue('out', 100)
+    stage = Stage('test', fn, in_q, [out_q], **kwargs)
+    stage.start()
+    for item in items:
+        in_q.put(item)
+    in_q.close()
+    stage.join(5)
+    results = []
+    while True:
+        item = out_q.get(timeout=0)
+        if item is STOP or item is None:
+            return stage, results
+        results.append(item)
+
+
+def test_failing_item_is_skipped():
+    def fn(x):
+        if x == 3:
+            raise ValueError('bad item')
+        return x * 10
+
+    stage, results = run_stage(fn, range(6))
+    assert results == [0, 10, 20, 40, 50]
+    assert (stage.processed, stage.failed, stage.error) == (5, 1, None)
+
+
+def test_repeated_failures_stop_the_stage():
+    failed = []
+
+    def fn(x):
+        raise OSError('disk full')
+
+    stage, results = run_stage(fn, range(10), max_errors=3, on_error=failed.append)
+    assert results == []
+    assert failed == [stage]
+    assert isinstance(stage.error, OSError) and stage.failed == 3
+    # the input queue is closed so producers notice instead of queueing forever
+    assert stage.in_queue.put(99) is False
+
+
+def test_lossy_queue_drops_oldest():
+    q = StageQueue('live', 2, drop_oldest=True)
+    for i in range(5):
+        q.put(i)
+    assert [q.get(timeout=0), q.get(timeout=0)] == [3, 4]
+    assert q.stats()['dropped'] == 3
@@ -0,0 +1,67 @@
+import csv
+import glob
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from database_manager import to_ms
+from function.retention import RetentionEngine
+
+
+def insert_plates(db, tmp_path, count, age_days, prefix):
+    conn = db.connect()
+    images = []
+    for i in range(count):
+        when = datetime.now() - timedelta(days=age_days, minutes=i)
+        image = None
+        if i % 100 == 0:
+            image = str(tmp_path / f'{prefix}{i}.jpg')
+            with open(image, 'wb') as f:
+                f.write(b'x' * 1000)
+            images.append(image)
+        conn.execute('''
+            INSERT INTO detected_plates (plate_number, timestamp, ts_ms, frame_number, confidence,
+                                         image_path, source)
+            VALUES (?, ?, ?, ?, 0.9, ?, 'cam1')
+        ''', (f'{prefix}{i:05d}', when.strftime('%Y-%m-%d %H:%M:%S'), to_ms(when), i, image))
+    conn.commit()
+    return images
+
+
+def test_purges_archives_and_vacuums_old_rows(db, tmp_path):
+    old_images = insert_plates(db, tmp_path, 3000, 60, '29A')
+    new_images = insert_plates(db, tmp_path, 50, 1, '51F')
+    archive = tmp_path / 'archive'
+
+    engine = RetentionEngine(db, days=30, batch_size=500, archive_dir=str(archive))
+    result = engine.run_once()
+
+    assert (result['deleted'], result['archived']) == (3000, 3000)
+    assert result['image_bytes'] == 1000 * len(old_images)
+    conn = db.connect()
+    assert conn.execute('SELECT COUNT(*) FROM detected_plates').fetchone()[0] == 50
+    assert conn.execute("SELECT COUNT(*) FROM detected_plates WHERE plate_number LIKE '29A%'").fetchone()[0] == 0
+    assert not any(os.path.exists(path) for path in old_images)
+    assert all(os.path.exists(path) for path in new_images)
+
+    # archived rows read back from the day/source partitions
+    files = glob.glob(str(archive / 'day=*' / 'source=cam1' / 'plates-*.csv.gz'))
+    archived = []
+    for path in files:
+        day = path.split('day=')[1][:10]
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert all(row['timestamp'].startswith(day) for row in rows)
+        archived.extend(rows)
+    assert sorted(row['plate_number'] for row in archived) == [f'29A{i:05d}' for i in range(3000)]
+
+    # freed pages went back to the OS
+    assert result['vacuum_pages'] > 0
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_nothing_to_purge(db, tmp_path):
+    insert_plates(db, tmp_path, 10, 1, '51F')
+    result = RetentionEngine(db, days=30).run_once()
+    assert result['deleted'] == 0
+    assert db.connect().execute('SELECT COUNT(*) FROM detected_plates').fetchone()[0] == 10
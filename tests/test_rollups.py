@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_manager import day_range_ms, rebuild_rollups, to_ms
+
+ROLLUPS = ('rollup_hourly', 'rollup_daily', 'rollup_daily_plates', 'rollup_plates', 'rollup_alerts_hourly')
+
+
+def snapshot(conn):
+    # a count that went back to 0 and a missing row mean the same thing
+    return {table: sorted(tuple(row) for row in conn.execute(f'SELECT * FROM {table}')
+                          if row[-1] != 0 and tuple(row[-2:]) != (0, 0))
+            for table in ROLLUPS}
+
+
+def insert(conn, plate, when, source='cam1', is_watchlist=0):
+    return conn.execute('''
+        INSERT INTO detected_plates (plate_number, timestamp, ts_ms, frame_number, confidence, source, is_watchlist)
+        VALUES (?, ?, ?, 0, 0.9, ?, ?)
+    ''', (plate, when.strftime('%Y-%m-%d %H:%M:%S'), to_ms(when), source, is_watchlist)).lastrowid
+
+
+def seed(db, base):
+    conn = db.connect()
+    ids = []
+    for i in range(40):
+        when = base + timedelta(minutes=37 * i)
+        ids.append(insert(conn, f'29A{i % 7:05d}', when, ('cam1', 'cam2', None)[i % 3], int(i % 5 == 0)))
+    for i in range(6):
+        conn.execute('INSERT INTO alerts (plate_number, timestamp, alert_type, message) VALUES (?, ?, ?, ?)',
+                     ('29A00000', (base + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S'),
+                      ('warning', 'danger')[i % 2], ''))
+    conn.commit()
+    return ids
+
+
+def test_triggers_match_a_rebuild(db):
+    base = datetime(2024, 5, 1, 6, 10)
+    ids = seed(db, base)
+    conn = db.connect()
+    # renames, watchlist flips, moves to another hour/day/source, deletes
+    conn.execute("UPDATE detected_plates SET plate_number = '51F67890' WHERE id IN (?, ?)", ids[:2])
+    conn.execute('UPDATE detected_plates SET is_watchlist = 1 WHERE id = ?', (ids[3],))
+    conn.execute("UPDATE detected_plates SET timestamp = '2024-05-03 23:59:59', source = 'cam9' WHERE id = ?",
+                 (ids[4],))
+    conn.executemany('DELETE FROM detected_plates WHERE id = ?', [(i,) for i in ids[10:20]])
+    conn.execute("DELETE FROM alerts WHERE alert_type = 'danger'")
+    conn.commit()
+    maintained = snapshot(conn)
+
+    conn.execute('BEGIN IMMEDIATE')
+    rebuild_rollups(conn)
+    assert snapshot(conn) == maintained
+    conn.rollback()
+
+
+def test_hour_and_day_series(db):
+    base = datetime(2024, 5, 1, 6, 10)
+    seed(db, base)
+    start_ms, _ = day_range_ms('2024-05-01')
+    _, end_ms = day_range_ms('2024-05-02')
+
+    hours = db.get_timeseries(start_ms, end_ms, 'hour')
+    assert len(hours) == 48
+    assert sum(p['detections'] for p in hours) == 40
+    assert hours[6]['time'] == to_ms(datetime(2024, 5, 1, 6)) and hours[6]['detections'] == 2
+
+    days = db.get_timeseries(start_ms, end_ms, 'day')
+    assert [p['date'] for p in days] == ['2024-05-01', '2024-05-02']
+    conn = db.connect()
+    for point in days:
+        assert point['detections'] == conn.execute(
+            'SELECT COUNT(*) FROM detected_plates WHERE substr(timestamp, 1, 10) = ?', (point['date'],)).fetchone()[0]
+    assert sum(p['alerts'] for p in days) == 6
+    assert days[0]['sources']['cam1'] + days[1]['sources']['cam1'] == 14
+
+
+@pytest.fixture
+def client(api_server):
+    seed(api_server.db, datetime(2024, 5, 1, 6, 10))
+    return api_server.app.test_client()
+
+
+def test_timeseries_endpoint_hour_buckets(client):
+    body = client.get('/api/stats/timeseries?bucket=hour&from=2024-05-01&to=2024-05-02').get_json()
+    assert body['success'] and body['bucket'] == 'hour'
+    assert len(body['data']) == 48
+    assert sum(p['detections'] for p in body['data']) == 40
+
+
+def test_timeseries_endpoint_day_buckets(client):
+    body = client.get('/api/stats/timeseries?bucket=day&from=2024-05-01&to=2024-05-02').get_json()
+    assert [p['date'] for p in body['data']] == ['2024-05-01', '2024-05-02']
+    assert sum(p['detections'] for p in body['data']) == 40
+
+
+def test_top_endpoint(client):
+    body = client.get('/api/stats/top?limit=3').get_json()
+    assert body['success'] and len(body['data']) == 3
+    assert body['data'][0]['count'] >= body['data'][-1]['count']
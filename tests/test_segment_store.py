@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from function.segment_store import SegmentStore
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    store = SegmentStore(db.db_path, root=str(tmp_path / 'segments'), segment_size=100)
+    yield store
+    store.close()
+
+
+def segment_files(store):
+    return sorted(os.listdir(store.root))
+
+
+def test_append_and_read_back(store):
+    refs = [store.append(bytes([i]) * 40, 'jpg') for i in range(5)]
+    assert all(ref.startswith('segment:') for ref in refs)
+    for i, ref in enumerate(refs):
+        assert store.read(ref) == (bytes([i]) * 40, 'image/jpeg')
+    # 100-byte segments hold two 40-byte images each
+    assert len(segment_files(store)) == 3
+    assert store.read('segment:999') == (None, None)
+
+
+def test_read_remaps_a_growing_segment(store, db):
+    reader = SegmentStore(db.db_path, root=store.root)
+    first = store.append(b'a' * 30, 'png')
+    assert reader.read(first) == (b'a' * 30, 'image/png')
+    second = store.append(b'b' * 30, 'png')  # same segment, past the end of the reader's map
+    assert reader.read(second)[0] == b'b' * 30
+    reader.close()
+    assert reader.maps == {}
+
+
+def test_compact_moves_live_images_and_removes_files(store, db):
+    refs = [store.append(bytes([i]) * 40, 'jpg') for i in range(6)]
+    conn = db.connect()
+    conn.executemany('''
+        INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, image_path)
+        VALUES ('29A12345', '2024-05-01 08:00:00', 0, 0.9, ?)
+    ''', [(ref,) for ref in refs])
+    conn.commit()
+    reader = SegmentStore(db.db_path, root=store.root, prune_interval=0)
+    assert reader.read(refs[0])[0] == bytes([0]) * 40
+
+    for ref in refs[:3] + refs[4:]:
+        store.delete(ref)
+    result = store.compact()
+
+    # the active segment is skipped (and sealed); segment 2's live image moves to a new one
+    assert (result['segments'], result['moved'], result['removed_files']) == (2, 1, 2)
+    assert store.read(refs[3]) == (bytes([3]) * 40, 'image/jpeg')
+    assert store.read(refs[0]) == (None, None)
+    assert store.compact()['removed_files'] == 1
+    assert len(segment_files(store)) == 1
+    # a reader in another process closes its map of the retired segment on its next read
+    assert reader.read(refs[3])[0] == bytes([3]) * 40
+    assert 1 not in reader.maps
+    reader.close()
+
+
+def test_import_files_moves_plain_crops(store, db, tmp_path):
+    crops = tmp_path / 'crops'
+    crops.mkdir()
+    conn = db.connect()
+    for i in range(3):
+        path = crops / f'29A1234{i}.jpg'
+        path.write_bytes(bytes([i]) * 20)
+        conn.execute('''
+            INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, image_path)
+            VALUES (?, '2024-05-01 08:00:00', 0, 0.9, ?)
+        ''', (f'29A1234{i}', str(path)))
+    conn.execute('''
+        INSERT INTO detected_plates (plate_number, timestamp, frame_number, confidence, image_path)
+        VALUES ('51F67890', '2024-05-01 08:00:00', 0, 0.9, ?)
+    ''', (str(crops / 'missing.jpg'),))
+    conn.commit()
+
+    result = store.import_files(delete=True, batch=2)
+
+    assert (result['imported'], result['missing'], result['bytes']) == (3, 1, 60)
+    assert os.listdir(crops) == []
+    rows = conn.execute("SELECT plate_number, image_path FROM detected_plates WHERE image_path LIKE 'segment:%'")
+    for plate_number, ref in rows.fetchall():
+        assert store.read(ref)[0] == bytes([int(plate_number[-1])]) * 20
+    assert not conn.in_transaction
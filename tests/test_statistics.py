@@ -0,0 +1,57 @@
+import time
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def table_total(db):
+    return db.connect().execute('SELECT COUNT(*) FROM detected_plates').fetchone()[0]
+
+
+def test_counts_follow_inserts_and_deletes(db):
+    ids = [db.save_plate(f'29A{i:05d}', i)[0] for i in range(5)]
+    db.save_plate('29A00000', 9)
+    stats = db.get_statistics()
+    assert (stats['total'], stats['unique']) == (6, 5)
+    assert stats['top_plates'][0] == {'plate': '29A00000', 'count': 2}
+
+    db.delete_plate(ids[1])
+    assert db.get_total_count() == 5
+
+
+def test_delete_and_restore_between_refreshes(db):
+    ids = [db.save_plate(f'51F{i:05d}', i)[0] for i in range(23)]
+    assert db.get_total_count() == 23
+
+    db.delete_plate(ids[0])
+    deleted_id = db.connect().execute('SELECT MAX(id) FROM deleted_plates').fetchone()[0]
+    db.restore_deleted_plate(deleted_id)
+
+    assert table_total(db) == 23
+    # the restore erased the deleted_plates row: the delete counter triggers a recount
+    assert wait_for(lambda: db.get_total_count() == 23)
+
+
+def test_bulk_delete_from_another_connection(db):
+    for i in range(10):
+        db.save_plate(f'30H{i:05d}', i)
+    assert db.get_total_count() == 10
+
+    conn = db.connections.open()
+    conn.execute("DELETE FROM detected_plates WHERE plate_number < '30H00004'")
+    conn.commit()
+    conn.close()
+    assert wait_for(lambda: db.get_total_count() == 6)
+
+
+def test_overlay_counters_skip_top_plates(db):
+    db.save_plate('29A12345', 1)
+    stats = db.get_statistics(top_plates=False)
+    assert 'top_plates' not in stats
+    assert stats['total'] == 1
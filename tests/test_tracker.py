@@ -0,0 +1,92 @@
+import pytest
+
+from function.tracker import PlateTracker, iou
+
+
+def moved(box, dx):
+    return (box[0] + dx, box[1], box[2] + dx, box[3])
+
+
+def read(track, frame_number, plate='29A12345'):
+    # what the caller does after an OCR pass
+    track.add_read(plate, 0.9)
+    track.last_ocr_frame = frame_number
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) > 0.99
+    assert iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(1 / 3, abs=1e-4)
+    assert iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+
+
+def test_moving_plate_keeps_its_track():
+    tracker = PlateTracker()
+    box = (100, 100, 180, 120)
+    (first, _), = tracker.update([box], 0)
+    for frame in range(1, 10):
+        (track, _), = tracker.update([moved(box, 6 * frame)], frame)
+        assert track is first
+    assert first.hits == 10 and len(tracker.tracks) == 1
+
+
+def test_each_box_gets_its_own_track():
+    tracker = PlateTracker()
+    a, b = (100, 100, 180, 120), (400, 300, 480, 320)
+    tracks = [t for t, _ in tracker.update([a, b], 0)]
+    assert tracks[0] is not tracks[1]
+    # order of boxes does not matter for matching
+    again = [t for t, _ in tracker.update([b, a], 1)]
+    assert again == tracks[::-1]
+
+
+def test_low_overlap_starts_a_new_track():
+    tracker = PlateTracker(iou_threshold=0.3)
+    (first, _), = tracker.update([(100, 100, 180, 120)], 0)
+    (second, _), = tracker.update([(160, 100, 240, 120)], 1)  # IoU 0.14
+    assert second is not first and second.id == first.id + 1
+
+
+def test_track_expires_after_max_missed():
+    tracker = PlateTracker(max_missed=5)
+    box = (100, 100, 180, 120)
+    (first, _), = tracker.update([box], 0)
+    tracker.update([], 5)
+    assert tracker.tracks == [first]
+    (same, _), = tracker.update([box], 5)
+    assert same is first
+    tracker.update([], 11)
+    assert tracker.tracks == []
+    (new, _), = tracker.update([box], 12)
+    assert new is not first
+
+
+def test_ocr_runs_on_new_tracks_then_every_interval():
+    tracker = PlateTracker(ocr_interval=10)
+    box = (100, 100, 180, 120)
+    ocr_frames = []
+    for frame in range(35):
+        (track, needs_ocr), = tracker.update([box], frame)
+        if needs_ocr:
+            ocr_frames.append(frame)
+            read(track, frame)
+    assert ocr_frames == [0, 10, 20, 30]
+
+
+def test_ocr_repeats_until_a_plate_is_read():
+    tracker = PlateTracker(ocr_interval=10)
+    box = (100, 100, 180, 120)
+    for frame in range(3):
+        (track, needs_ocr), = tracker.update([box], frame)
+        assert needs_ocr
+        track.last_ocr_frame = frame  # read returned "unknown": no vote
+    read(track, 3)
+    assert not tracker.update([box], 4)[0][1]
+
+
+def test_hold_keeps_tracks_alive_on_gated_frames():
+    tracker = PlateTracker(max_missed=5)
+    (first, _), = tracker.update([(100, 100, 180, 120)], 0)
+    for frame in range(1, 20):
+        tracker.hold(frame)
+    (track, _), = tracker.update([(100, 100, 180, 120)], 20)
+    assert track is first
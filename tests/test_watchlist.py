@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from database_manager import WatchlistIndex
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_add_and_deactivate_are_seen_at_once(db):
+    assert db.check_watchlist('29A12345') == (False, None)
+    db.add_to_watchlist('29A12345', 'stolen', 'danger')
+    is_watchlist, info = db.check_watchlist('29A12345')
+    assert is_watchlist and info['reason'] == 'stolen' and info['alert_type'] == 'danger'
+
+    db.remove_from_watchlist('29A12345')
+    assert db.check_watchlist('29A12345') == (False, None)
+
+
+def test_reloads_changes_from_another_connection(db):
+    index = WatchlistIndex(db.db_path, check_interval=0)
+    assert index.lookup('51F67890') is None
+
+    # another process (API server, CLI) edits the watchlist
+    conn = sqlite3.connect(db.db_path)
+    conn.execute('''
+        INSERT INTO watchlist (plate_number, reason, alert_type, added_date)
+        VALUES ('51F67890', 'api', 'warning', '2024-05-01 08:00:00')
+    ''')
+    conn.commit()
+    assert wait_for(lambda: index.lookup('51F67890') is not None)
+
+    conn.execute("UPDATE watchlist SET active = 0 WHERE plate_number = '51F67890'")
+    conn.commit()
+    conn.close()
+    assert wait_for(lambda: index.lookup('51F67890') is None)
+
+
+def test_fuzzy_lookup_within_one_edit(db):
+    db.add_to_watchlist('29A-12345', 'stolen')
+    index = db.watchlist_index
+
+    assert index.lookup('29A12345') is None                      # exact only by default
+    assert index.lookup('29A12345', 1)['match_distance'] == 0    # same plate once normalized
+    for read in ('29A12346', '29A1234', '29A123455', '29B12345'):
+        hit = index.lookup(read, 1)
+        assert hit['plate_number'] == '29A-12345' and hit['match_distance'] == 1, read
+    for read in ('29A12366', '29A123', '51F67890'):
+        assert index.lookup(read, 1) is None, read
+
+
+def test_check_watchlist_uses_configured_distance(db):
+    db.add_to_watchlist('29A12345')
+    assert db.check_watchlist('29A12346') == (False, None)
+    assert db.check_watchlist('29A12346', max_distance=1)[0]